@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Асинхронный HTTP API сервер для TourVisor на aiohttp
+Те же эндпоинты и JSON, что у http_server.py, но все запросы обслуживает один долгоживущий
+цикл событий: пул браузеров, кэши и задания общие на весь процесс
+"""
+
+import asyncio
+import logging
+import os
+import traceback
+from datetime import datetime
+
+from aiohttp import web
+
+from http_api import (HTTPWrapper, RequestError, ENDPOINTS, wants_job, wants_sse,
+                      stream_content_type, format_event)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WRAPPER = web.AppKey("wrapper", HTTPWrapper)
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type",
+    "Access-Control-Allow-Methods": "GET, POST, DELETE, OPTIONS"
+}
+
+
+def error_response(message, status):
+    return web.json_response({
+        "success": False,
+        "error": message,
+        "timestamp": datetime.now().isoformat()
+    }, status=status)
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Разрешаем CORS для всех доменов (как flask_cors в http_server.py)"""
+    if request.method == "OPTIONS":
+        response = web.Response()
+    else:
+        response = await handler(request)
+    # У потоковых ответов заголовки уже отправлены (CORS выставлен в обработчике)
+    if not response.prepared:
+        response.headers.update(CORS_HEADERS)
+    return response
+
+
+@web.middleware
+async def error_middleware(request, handler):
+    try:
+        return await handler(request)
+    except web.HTTPNotFound:
+        return web.json_response(request.app[WRAPPER].not_found(), status=404)
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in {request.path}: {e}")
+        logger.error(traceback.format_exc())
+        return error_response(str(e), 500)
+
+
+async def health_check(request):
+    """Проверка здоровья сервера"""
+    return web.json_response(request.app[WRAPPER].health())
+
+
+async def search_tours(request):
+    """Основной поиск туров"""
+    wrapper = request.app[WRAPPER]
+    data = await read_json(request)
+    try:
+        params = wrapper.params_from_json(data)
+    except RequestError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=e.status)
+
+    if wants_job(data, request.query):
+        payload, status = wrapper.submit_job(
+            "search_tours", lambda job: wrapper.search_tours_async(params, wrapper.job_reporter(job)))
+        return web.json_response(payload, status=status)
+
+    result = await wrapper.search_tours_async(params)
+    return web.json_response(result, status=200 if result["success"] else 500)
+
+
+async def search_tours_stream(request):
+    """Поиск туров с выдачей каждого тура по мере появления"""
+    wrapper = request.app[WRAPPER]
+    data = await read_json(request)
+    try:
+        params = wrapper.params_from_json(data)
+    except RequestError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=e.status)
+
+    sse = wants_sse(request.query, request.headers.get("Accept"))
+    response = web.StreamResponse(headers=dict(CORS_HEADERS, **{
+        "Content-Type": stream_content_type(sse),
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    }))
+    await response.prepare(request)
+
+    events = asyncio.Queue()
+    # Поиск не привязан к соединению: если клиент уйдет, результат все равно попадет в кэш
+    search = asyncio.create_task(wrapper.stream_search(params, events.put_nowait))
+    while True:
+        event = await events.get()
+        await response.write(format_event(event, sse).encode("utf-8"))
+        if event["type"] == "summary":
+            break
+    await search
+    await response.write_eof()
+    return response
+
+
+async def quick_search(request):
+    """Быстрый поиск по текстовому запросу"""
+    wrapper = request.app[WRAPPER]
+    data = await read_json(request)
+    try:
+        query, params = wrapper.query_from_json(data)
+    except RequestError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=e.status)
+
+    if wants_job(data, request.query):
+        payload, status = wrapper.submit_job(
+            "quick_search", lambda job: wrapper.quick_search_async(query, params, wrapper.job_reporter(job)))
+        return web.json_response(payload, status=status)
+
+    return web.json_response(await wrapper.quick_search_async(query, params))
+
+
+async def batch_search(request):
+    """Пакетный поиск: варианты выполняются одновременно"""
+    wrapper = request.app[WRAPPER]
+    data = await read_json(request)
+    try:
+        variants = wrapper.batch_from_json(data)
+    except RequestError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=e.status)
+
+    if wants_job(data, request.query):
+        payload, status = wrapper.submit_job("batch_search", lambda job: wrapper.batch_search_async(variants))
+        return web.json_response(payload, status=status)
+
+    result = await wrapper.batch_search_async(variants)
+    return web.json_response(result, status=200 if result["success"] else 500)
+
+
+async def tour_stats(request):
+    """Сводка цен по курортам/операторам/питанию"""
+    wrapper = request.app[WRAPPER]
+    data = await read_json(request)
+    try:
+        params, group_by = wrapper.stats_from_json(data)
+    except RequestError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=e.status)
+
+    if wants_job(data, request.query):
+        payload, status = wrapper.submit_job("tour_stats", lambda job: wrapper.tour_stats_async(params, group_by))
+        return web.json_response(payload, status=status)
+
+    result = await wrapper.tour_stats_async(params, group_by)
+    return web.json_response(result, status=200 if result["success"] else 500)
+
+
+async def price_calendar(request):
+    """Минимальная цена на каждую дату вылета"""
+    wrapper = request.app[WRAPPER]
+    data = await read_json(request)
+    try:
+        params = wrapper.calendar_from_json(data)
+    except RequestError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=e.status)
+
+    if wants_job(data, request.query):
+        payload, status = wrapper.submit_job("price_calendar", lambda job: wrapper.price_calendar_async(params))
+        return web.json_response(payload, status=status)
+
+    result = await wrapper.price_calendar_async(params)
+    return web.json_response(result, status=200 if result["success"] else 500)
+
+
+async def watch_route(request):
+    """Наблюдение за маршрутом: начальная выдача, дальше - только изменения"""
+    wrapper = request.app[WRAPPER]
+    data = await read_json(request)
+    try:
+        params, interval = wrapper.watch_from_json(data)
+    except RequestError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=e.status)
+
+    payload, status = await wrapper.watch_route_async(params, interval)
+    return web.json_response(payload, status=status)
+
+
+async def watch_changes(request):
+    """Изменения выдачи наблюдаемого маршрута"""
+    wrapper = request.app[WRAPPER]
+    try:
+        since = wrapper.since_from_args(request.query)
+    except RequestError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=e.status)
+
+    payload, status = await wrapper.watch_changes_async(request.match_info["watch_id"], since)
+    return web.json_response(payload, status=status)
+
+
+async def unwatch_route(request):
+    """Снять наблюдение"""
+    payload, status = await request.app[WRAPPER].unwatch_async(request.match_info["watch_id"])
+    return web.json_response(payload, status=status)
+
+
+async def get_job(request):
+    """Статус и результат фонового задания"""
+    payload, status = request.app[WRAPPER].job_status(request.match_info["job_id"])
+    return web.json_response(payload, status=status)
+
+
+async def get_countries(request):
+    """Получить список стран"""
+    return web.json_response(request.app[WRAPPER].countries())
+
+
+async def get_departures(request):
+    """Получить список городов вылета"""
+    return web.json_response(request.app[WRAPPER].departures())
+
+
+async def get_stats(request):
+    """Статистика сервера"""
+    return web.json_response(request.app[WRAPPER].stats())
+
+
+async def get_metrics_text(request):
+    """Метрики в формате Prometheus"""
+    body, content_type = request.app[WRAPPER].metrics()
+    return web.Response(body=body.encode("utf-8"), headers={"Content-Type": content_type})
+
+
+async def on_startup(app):
+    # Обертка создается внутри работающего цикла: задания и поиски пойдут в него же
+    app[WRAPPER] = HTTPWrapper(loop=asyncio.get_running_loop())
+    app[WRAPPER].start_background()
+
+
+async def on_cleanup(app):
+    await app[WRAPPER].close()
+
+
+def create_app():
+    app = web.Application(middlewares=[cors_middleware, error_middleware])
+    app.router.add_get('/health', health_check)
+    app.router.add_post('/search_tours', search_tours)
+    app.router.add_post('/search_tours/stream', search_tours_stream)
+    app.router.add_post('/quick_search', quick_search)
+    app.router.add_post('/batch_search', batch_search)
+    app.router.add_post('/tour_stats', tour_stats)
+    app.router.add_post('/price_calendar', price_calendar)
+    app.router.add_post('/watch_route', watch_route)
+    app.router.add_get('/watch_route/{watch_id}', watch_changes)
+    app.router.add_delete('/watch_route/{watch_id}', unwatch_route)
+    app.router.add_get('/jobs/{job_id}', get_job)
+    app.router.add_get('/get_countries', get_countries)
+    app.router.add_get('/get_departures', get_departures)
+    app.router.add_get('/stats', get_stats)
+    app.router.add_get('/metrics', get_metrics_text)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main():
+    port = int(os.environ.get("PORT", "8080"))
+    print("🚀 Запуск асинхронного TourVisor HTTP API сервера...")
+    print("📍 Доступные эндпоинты:")
+    for method, path, description in ENDPOINTS:
+        print(f"  {method:<4} {path} - {description}")
+    print(f"\n🌐 Сервер запущен на http://localhost:{port}")
+
+    web.run_app(create_app(), host='0.0.0.0', port=port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Пакетный поиск: одна и та же поездка из нескольких городов вылета / в несколько стран
+Варианты выполняются одновременно на страницах пула браузеров под общим ограничением,
+поэтому сравнение четырех городов занимает примерно столько же, сколько самый долгий поиск
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from fixed_departure_api import Country, Departure, Tour, TourSearchParams
+from tour_filters import refine_tours
+
+logger = logging.getLogger(__name__)
+
+# Поля запроса, описывающие сам пакет (остальные - общие параметры всех вариантов)
+BATCH_FIELDS = ("variants", "countries", "departures", "async")
+
+
+class BatchError(ValueError):
+    """Некорректное описание пакета"""
+
+
+@dataclass
+class VariantResult:
+    params: TourSearchParams
+    tours: List[Tour]
+    elapsed: float
+    error: Optional[str] = None
+
+
+def max_variants() -> int:
+    return int(os.environ.get("TOURVISOR_BATCH_MAX_VARIANTS", "20"))
+
+
+def batch_concurrency(pool=None) -> int:
+    """Сколько вариантов искать одновременно (по умолчанию - по странице пула на вариант)"""
+    default = pool.size if pool is not None else 4
+    return max(1, int(os.environ.get("TOURVISOR_BATCH_CONCURRENCY", default)))
+
+
+def expand_batch(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Описание пакета -> аргументы каждого варианта
+    {"variants": [{...}, ...]} - явный список; {"countries": [...], "departures": [...]} - все сочетания.
+    Остальные поля запроса общие для всех вариантов (вариант может их переопределить).
+    """
+    if not spec:
+        raise BatchError("No batch spec provided")
+    base = {key: value for key, value in spec.items() if key not in BATCH_FIELDS}
+
+    if spec.get("variants"):
+        if not isinstance(spec["variants"], list) or not all(isinstance(v, dict) for v in spec["variants"]):
+            raise BatchError("variants must be a list of objects")
+        variants = [dict(base, **variant) for variant in spec["variants"]]
+    elif spec.get("countries") or spec.get("departures"):
+        countries = spec.get("countries") or [base.get("country")]
+        departures = spec.get("departures") or [base.get("departure")]
+        variants = [dict(base, country=country, departure=departure)
+                    for country, departure in itertools.product(countries, departures)]
+    else:
+        raise BatchError("Either variants or countries/departures is required")
+
+    limit = max_variants()
+    if len(variants) > limit:
+        raise BatchError(f"Too many variants: {len(variants)} (max {limit})")
+    return variants
+
+
+async def run_batch(backend, variants: List[TourSearchParams], concurrency: int,
+                    on_done: Optional[Callable[[VariantResult], None]] = None) -> List[VariantResult]:
+    """Выполнить варианты одновременно; ошибка одного варианта не прерывает остальные. Туры - после refine_tours"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def search(params: TourSearchParams) -> VariantResult:
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                tours = refine_tours(await backend.search_tours(params), params)
+                result = VariantResult(params, tours, time.monotonic() - started)
+            except Exception as e:
+                logger.warning(f"⚠️ Вариант пакета {_enum_value(params.departure)} → "
+                               f"{_enum_value(params.country)} не выполнен: {e}")
+                result = VariantResult(params, [], time.monotonic() - started, error=str(e))
+        if on_done:
+            on_done(result)
+        return result
+
+    return await asyncio.gather(*(search(params) for params in variants))
+
+
+def _enum_value(value) -> Any:
+    return value.value if isinstance(value, (Country, Departure)) else value
+
+
+def batch_json(results: List[VariantResult], tour_json: Callable[[Tour], Dict[str, Any]],
+               elapsed: float) -> Dict[str, Any]:
+    """Результаты по вариантам + сводка: самый дешевый вариант и общее число туров"""
+    variants = []
+    for result in results:
+        prices = [tour.price for tour in result.tours if tour.price is not None]
+        variant = {
+            "country": _enum_value(result.params.country),
+            "departure": _enum_value(result.params.departure),
+            "date_from": result.params.date_from,
+            "date_to": result.params.date_to,
+            "nights_from": result.params.nights_from,
+            "nights_to": result.params.nights_to,
+            "success": result.error is None,
+            "count": len(result.tours),
+            "min_price": min(prices) if prices else None,
+            "elapsed": round(result.elapsed, 3),
+            "tours": [tour_json(tour) for tour in result.tours]
+        }
+        if result.error is not None:
+            variant["error"] = result.error
+        variants.append(variant)
+
+    priced = [variant for variant in variants if variant["min_price"] is not None]
+    cheapest = min(priced, key=lambda variant: variant["min_price"]) if priced else None
+    return {
+        "success": any(variant["success"] for variant in variants),
+        "count": sum(variant["count"] for variant in variants),
+        "elapsed": round(elapsed, 3),
+        "cheapest": {key: cheapest[key] for key in ("country", "departure", "min_price")} if cheapest else None,
+        "variants": variants
+    }
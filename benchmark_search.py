@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Офлайн-бенчмарк FixedTourvisorAPI
+Локальный HTTP-сервер отдает синтетическую (или сохраненную) страницу поиска с имитацией виджета TourVisor:
+форма, выпадающие списки, JSON-пачки результатов по адресу с "tourvisor.ru/" (их перехватывает ResultCapture)
+и карточки в #TVResultPanel. Задержки страницы, виджета и поиска и число туров настраиваются.
+Поиск идет целиком через search_tours, время каждой фазы берется из стадий report_stage.
+Сеть не нужна; итог - JSON, чтобы сравнивать прогоны до и после оптимизации.
+
+    python benchmark_search.py --runs 5 --results 120 --search-latency 3 --output before.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from browser_pool import BrowserPool
+from fixed_departure_api import Country, Departure, FixedTourvisorAPI, TourSearchParams
+from resource_policy import ResourcePolicy
+from search_progress import STAGE_PHASES, track_stages
+from tour_model import DATE_FORMAT, parse_date
+from tour_stats import percentile
+from waits import WaitConfig
+
+# Суммарные фазы поверх пофазных (STAGE_PHASES): (фаза, стадия начала - None: старт поиска, стадия конца)
+TOTAL_PHASES = (
+    ("form_fill", "page_loaded", "submitted"),
+    ("total", None, "extracted"),
+)
+
+PHASE_NAMES = tuple(STAGE_PHASES.values()) + tuple(name for name, _, _ in TOTAL_PHASES)
+
+HOTEL_PREFIXES = ("Sunrise", "Royal", "Grand", "Blue", "Crystal", "Golden", "Palm", "Silver", "Green", "Ocean")
+HOTEL_SUFFIXES = ("Resort", "Beach", "Palace", "Club", "Hotel", "Garden", "Bay", "Park")
+RESORTS = ("Анталия", "Белек", "Кемер", "Сиде", "Алания")
+MEALS = ("AI", "UAI", "FB", "HB", "BB")
+OPERATORS = ("Anex Tour", "TUI", "Coral Travel", "Biblio-Globus", "Pegas Touristik")
+
+STANDIN_PAGE = '''<!doctype html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>Поиск туров (локальная копия для бенчмарка)</title>
+<style>
+  body {{ font-family: sans-serif; margin: 20px; }}
+  .tv-search-form > * {{ display: inline-block; margin: 4px; vertical-align: top; }}
+  .TVCountrySelect, .TVDepartureSelect {{ position: relative; min-width: 160px; padding: 6px; border: 1px solid #999; cursor: pointer; }}
+  .tv-list {{ position: absolute; top: 100%; left: 0; z-index: 10; background: #fff; border: 1px solid #999; }}
+  .tv-list-item {{ padding: 4px 8px; white-space: nowrap; }}
+  .TVSHotelResultItem {{ display: block; width: 640px; min-height: 90px; margin: 8px 0; padding: 8px;
+                        border: 1px solid #ccc; white-space: pre-line; }}
+</style>
+</head>
+<body>
+<div class="tv-search-form">
+  <div class="TVCountrySelect">Страна</div>
+  <div class="TVDepartureSelect">Город вылета</div>
+  <input type="text" placeholder="дата с">
+  <input type="text" placeholder="дата по">
+  <select name="nights">{nights}</select>
+  <select name="adults">{adults}</select>
+  <button class="TVSearchButton">Найти</button>
+</div>
+<div id="TVResultPanel"></div>
+<script>
+  // Виджет грузится после load, как на eto.travel: goto не ждет его
+  window.addEventListener('load', () => {{
+    const script = document.createElement('script');
+    script.src = '/widget.js';
+    document.body.appendChild(script);
+  }});
+  window.TV_COUNTRIES = {countries};
+  window.TV_DEPARTURES = {departures};
+</script>
+</body>
+</html>
+'''
+
+WIDGET_JS = r'''
+(() => {
+    const API = '/tourvisor.ru/modsearch/';
+    const MEALS = {AI: 'All Inclusive', UAI: 'Ultra All Inclusive', FB: 'Full Board', HB: 'Half Board',
+                   BB: 'Bed & Breakfast'};
+    const form = document.querySelector('.tv-search-form');
+    const panel = document.getElementById('TVResultPanel');
+    const state = {country: '', departure: ''};
+
+    const closeLists = () => document.querySelectorAll('.tv-list').forEach(list => list.remove());
+    const openList = (anchor, items, onPick) => {
+        closeLists();
+        const list = document.createElement('div');
+        list.className = 'tv-list';
+        for (const name of items) {
+            const item = document.createElement('div');
+            item.className = 'tv-list-item';
+            item.textContent = name;
+            item.addEventListener('click', (event) => {
+                event.stopPropagation();
+                onPick(name);
+                closeLists();
+            });
+            list.appendChild(item);
+        }
+        anchor.appendChild(list);
+    };
+    const formatPrice = (price) => {
+        const thousands = Math.floor(price / 1000);
+        return (thousands ? thousands + ' ' + String(price % 1000).padStart(3, '0') : String(price)) + ' руб';
+    };
+
+    const countrySelect = form.querySelector('.TVCountrySelect');
+    const departureSelect = form.querySelector('.TVDepartureSelect');
+    countrySelect.addEventListener('click', () =>
+        openList(countrySelect, window.TV_COUNTRIES, name => { state.country = name; }));
+    departureSelect.addEventListener('click', () =>
+        openList(departureSelect, window.TV_DEPARTURES, name => { state.departure = name; }));
+
+    const render = (hotels) => {
+        for (const hotel of hotels) {
+            for (const tour of hotel.tours.tour) {
+                const card = document.createElement('div');
+                card.className = 'TVSHotelResultItem';
+                card.id = 'tv-tour-' + tour.tourid;
+                card.textContent = [
+                    hotel.hotelname + '*' + hotel.hotelstars,
+                    hotel.regionname + ', ' + hotel.hotelrating,
+                    tour.nights + ' ночей',
+                    tour.flydate,
+                    MEALS[tour.meal],
+                    tour.operatorname,
+                    formatPrice(tour.price),
+                ].join('\n');
+                panel.appendChild(card);
+            }
+        }
+    };
+
+    const search = async () => {
+        panel.innerHTML = '';
+        const [dateFrom, dateTo] = form.querySelectorAll('input');
+        const query = new URLSearchParams({
+            country: state.country,
+            departure: state.departure,
+            datefrom: dateFrom.value,
+            dateto: dateTo.value,
+            nights: form.querySelector('select[name="nights"]').value,
+            adults: form.querySelector('select[name="adults"]').value,
+        });
+        const started = await (await fetch(API + 'search?' + query)).json();
+        const requestId = started.result.requestid;
+        for (let batch = 0; ; batch++) {
+            const payload = await (await fetch(API + 'result?requestid=' + requestId + '&batch=' + batch)).json();
+            render(payload.data.result.hotel);
+            if (payload.data.status.state === 'finished') break;
+        }
+    };
+    form.querySelector('.TVSearchButton').addEventListener('click', () => { search(); });
+
+    form.classList.add('tv-loaded');
+})();
+'''
+
+
+@dataclass
+class StandinConfig:
+    # Туров в выдаче и на сколько JSON-пачек (и порций карточек) они делятся
+    results: int = 60
+    batches: int = 3
+    # Задержки, секунд: ответ страницы, загрузка виджета, весь поиск (делится между пачками)
+    page_latency: float = 0.2
+    widget_latency: float = 0.5
+    search_latency: float = 2.0
+    # Сохраненная страница вместо синтетической (виджет и API - все равно локальные)
+    html: Optional[str] = None
+    seed: int = 1
+
+
+def synthetic_hotels(config: StandinConfig, date_from: Optional[str], nights: int) -> List[Dict[str, Any]]:
+    """Отели в формате пачки результатов TourVisor (по туру на отель, цены и даты - детерминированные)"""
+    rng = random.Random(config.seed)
+    start = parse_date(date_from) or date.today()
+    hotels = []
+    for index in range(config.results):
+        flydate = start + timedelta(days=index % 7)
+        hotels.append({
+            "hotelcode": 1000 + index,
+            "hotelname": f"{HOTEL_PREFIXES[index % len(HOTEL_PREFIXES)]} "
+                         f"{HOTEL_SUFFIXES[index // len(HOTEL_PREFIXES) % len(HOTEL_SUFFIXES)]} {index + 1}",
+            "hotelstars": rng.choice((3, 4, 5)),
+            "hotelrating": round(rng.uniform(3.5, 5.0), 1),
+            "regionname": RESORTS[index % len(RESORTS)],
+            "countryname": None,
+            "tours": {"tour": [{
+                "tourid": f"bench-{index}",
+                "price": rng.randrange(40000, 400000, 100),
+                "currency": "RUB",
+                "nights": nights,
+                "flydate": flydate.strftime(DATE_FORMAT),
+                "meal": MEALS[index % len(MEALS)],
+                "operatorname": OPERATORS[index % len(OPERATORS)]
+            }]}
+        })
+    return hotels
+
+
+class StandinServer:
+    """Локальная копия страницы поиска и API виджета"""
+
+    def __init__(self, config: StandinConfig):
+        self.config = config
+        self.runner: Optional[web.AppRunner] = None
+        self.base_url: Optional[str] = None
+        # requestid -> отели поиска
+        self._searches: Dict[str, List[Dict[str, Any]]] = {}
+        self.requests = 0
+
+    @property
+    def search_url(self) -> str:
+        return f"{self.base_url}/search/"
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get('/search/', self.page)
+        app.router.add_get('/widget.js', self.widget)
+        app.router.add_get('/tourvisor.ru/modsearch/search', self.start_search)
+        app.router.add_get('/tourvisor.ru/modsearch/result', self.result)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def page_html(self) -> str:
+        if self.config.html:
+            with open(self.config.html, encoding="utf-8") as f:
+                return f.read()
+        return STANDIN_PAGE.format(
+            nights="".join(f'<option value="{n}"{" selected" if n == 7 else ""}>{n}</option>' for n in range(1, 31)),
+            adults="".join(f'<option value="{n}"{" selected" if n == 2 else ""}>{n}</option>' for n in range(1, 11)),
+            countries=json.dumps([country.value for country in Country], ensure_ascii=False),
+            departures=json.dumps([departure.value for departure in Departure], ensure_ascii=False)
+        )
+
+    async def page(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.config.page_latency)
+        return web.Response(text=self.page_html(), content_type="text/html")
+
+    async def widget(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.config.widget_latency)
+        return web.Response(text=WIDGET_JS, content_type="application/javascript")
+
+    async def start_search(self, request):
+        self.requests += 1
+        request_id = uuid.uuid4().hex[:10]
+        try:
+            nights = int(request.query.get("nights", "7"))
+        except ValueError:
+            nights = 7
+        self._searches[request_id] = synthetic_hotels(self.config, request.query.get("datefrom"), nights)
+        return web.json_response({"result": {"requestid": request_id}})
+
+    async def result(self, request):
+        """Пачка batch: своя доля отелей; последняя пачка - со статусом finished"""
+        self.requests += 1
+        hotels = self._searches.get(request.query.get("requestid"), [])
+        batches = max(1, self.config.batches)
+        try:
+            batch = min(int(request.query.get("batch", "0")), batches - 1)
+        except ValueError:
+            batch = 0
+        await asyncio.sleep(self.config.search_latency / batches)
+        size = -(-len(hotels) // batches)
+        finished = batch == batches - 1
+        if finished:
+            self._searches.pop(request.query.get("requestid"), None)
+        return web.json_response({"data": {
+            "status": {"state": "finished" if finished else "searching", "hotelsfound": len(hotels)},
+            "result": {"hotel": hotels[batch * size:(batch + 1) * size]}
+        }})
+
+
+def phase_times(started: float, stamps: Dict[str, float]) -> Dict[str, Optional[float]]:
+    """Длительность каждой фазы, секунд (None - стадия не была достигнута)"""
+    times = {}
+    # Фаза длится от предыдущей отмеченной стадии, как в гистограмме tourvisor_search_phase_seconds
+    previous = started
+    for stage, name in STAGE_PHASES.items():
+        at = stamps.get(stage)
+        times[name] = round(at - previous, 4) if at is not None else None
+        previous = at if at is not None else previous
+    for name, begin, end in TOTAL_PHASES:
+        begin_at = started if begin is None else stamps.get(begin)
+        end_at = stamps.get(end)
+        times[name] = round(end_at - begin_at, 4) if begin_at is not None and end_at is not None else None
+    return times
+
+
+def summarize(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {
+        "min": round(ordered[0], 4),
+        "median": round(percentile(ordered, 0.5), 4),
+        "p90": round(percentile(ordered, 0.9), 4),
+        "max": round(ordered[-1], 4),
+        "mean": round(sum(ordered) / len(ordered), 4)
+    }
+
+
+async def run_once(api: FixedTourvisorAPI, params: TourSearchParams, expected: int) -> Dict[str, Any]:
+    stamps: Dict[str, float] = {}
+    started = time.monotonic()
+    # Задача наследует подписку на стадии из контекста
+    with track_stages(lambda stage: stamps.setdefault(stage, time.monotonic())):
+        search = asyncio.ensure_future(api.search_tours(params))
+    tours = await search
+    return {
+        "ok": len(tours) == expected,
+        "tours": len(tours),
+        "elapsed": round(time.monotonic() - started, 4),
+        "phases": phase_times(started, stamps)
+    }
+
+
+async def run_benchmark(config: StandinConfig, runs: int = 5, warmup: int = 1, concurrency: int = 1,
+                        extraction: str = "xhr") -> Dict[str, Any]:
+    """Прогоны search_tours против локальной копии; первые warmup прогонов в сводку не входят"""
+    server = StandinServer(config)
+    await server.start()
+    pool = BrowserPool(size=concurrency, headless=True, slow_mo=0, resource_policy=ResourcePolicy.from_env())
+    api = FixedTourvisorAPI(pool=pool, extraction=extraction, search_url=server.search_url)
+    params = TourSearchParams(country=Country.TURKEY, departure=Departure.MOSCOW,
+                              date_from=(date.today() + timedelta(days=30)).strftime(DATE_FORMAT),
+                              date_to=(date.today() + timedelta(days=44)).strftime(DATE_FORMAT))
+    results = []
+    try:
+        started = time.monotonic()
+        await pool.start()
+        launch = time.monotonic() - started
+
+        total = warmup + runs
+        while len(results) < total:
+            wave = min(concurrency, total - len(results))
+            results.extend(await asyncio.gather(*(run_once(api, params, config.results) for _ in range(wave))))
+    finally:
+        await api.close()
+        await pool.close()
+        await server.close()
+
+    for index, result in enumerate(results):
+        result["run"] = index + 1
+        result["warmup"] = index < warmup
+    measured = [result for result in results if not result["warmup"]]
+    ok = [result for result in measured if result["ok"]]
+    return {
+        "config": dict(asdict(config), runs=runs, warmup=warmup, concurrency=concurrency, extraction=extraction),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "waits": asdict(WaitConfig.from_env()),
+            "resource_policy": os.environ.get("TOURVISOR_RESOURCE_POLICY", "1") != "0",
+            "packed_cards": os.environ.get("TOURVISOR_PACKED_CARDS", "1") != "0"
+        },
+        "launch": round(launch, 4),
+        "ok_runs": len(ok),
+        "failed_runs": len(measured) - len(ok),
+        "server_requests": server.requests,
+        # Сводка только по успешным прогонам: неполная выдача искажает фазы ожидания
+        "summary": {name: summarize([result["phases"][name] for result in ok if result["phases"][name] is not None])
+                    for name in PHASE_NAMES},
+        "runs": results
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк поиска FixedTourvisorAPI")
+    parser.add_argument("--runs", type=int, default=5, help="измеряемых прогонов")
+    parser.add_argument("--warmup", type=int, default=1, help="прогонов прогрева (не входят в сводку)")
+    parser.add_argument("--concurrency", type=int, default=1, help="одновременных поисков (страниц пула)")
+    parser.add_argument("--results", type=int, default=60, help="туров в выдаче")
+    parser.add_argument("--batches", type=int, default=3, help="JSON-пачек выдачи")
+    parser.add_argument("--page-latency", type=float, default=0.2, help="задержка ответа страницы, с")
+    parser.add_argument("--widget-latency", type=float, default=0.5, help="задержка загрузки виджета, с")
+    parser.add_argument("--search-latency", type=float, default=2.0, help="длительность поиска на сервере, с")
+    parser.add_argument("--extraction", choices=("xhr", "dom"), default="xhr", help="источник туров")
+    parser.add_argument("--html", help="сохраненная страница поиска вместо синтетической")
+    parser.add_argument("--seed", type=int, default=1, help="зерно синтетической выдачи")
+    parser.add_argument("--output", help="файл для JSON (по умолчанию - stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = StandinConfig(results=args.results, batches=args.batches, page_latency=args.page_latency,
+                           widget_latency=args.widget_latency, search_latency=args.search_latency,
+                           html=args.html, seed=args.seed)
+    # Журнал поиска (print) - в stderr, чтобы stdout остался чистым JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run_benchmark(config, runs=args.runs, warmup=args.warmup,
+                                           concurrency=args.concurrency, extraction=args.extraction))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"📊 Результаты сохранены: {args.output} (успешных прогонов: {report['ok_runs']})", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Пул браузеров Chromium для FixedTourvisorAPI
+Chromium запускается один раз на процесс, вызовы берут страницы из пула и возвращают их
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from playwright.async_api import async_playwright
+
+from waits import WaitConfig
+from resource_policy import ResourcePolicy
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+BROWSER_LAUNCH_SECONDS = get_metrics().histogram("tourvisor_browser_launch_seconds", "Запуск Chromium")
+POOL_WAIT_SECONDS = get_metrics().histogram("tourvisor_pool_wait_seconds", "Ожидание свободной страницы пула")
+POOL_SATURATED = get_metrics().counter("tourvisor_pool_saturated_total",
+                                       "Поиски, которым не хватило свободной страницы пула")
+POOL_IN_USE = get_metrics().gauge("tourvisor_pool_pages_in_use", "Занятые страницы пула")
+POOL_SIZE = get_metrics().gauge("tourvisor_pool_size", "Размер пула страниц")
+
+# Параметры контекста, под которые настроен парсер eto.travel
+DEFAULT_CONTEXT_OPTIONS = {
+    "viewport": {'width': 1440, 'height': 900},
+    "user_agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36",
+    "locale": "ru-RU",
+    "timezone_id": "Europe/Moscow",
+}
+
+# Флаги для запуска в контейнерах (Render/Railway/Docker)
+DEFAULT_LAUNCH_ARGS = ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
+
+
+@dataclass
+class PoolSlot:
+    """Слот пула: отдельный BrowserContext со своей страницей"""
+    context: Any
+    page: Any
+    generation: int
+    uses: int = 0
+
+
+class BrowserPool:
+    def __init__(self, size: int = 2, headless: bool = True, slow_mo: int = 500,
+                 launch_args: Optional[List[str]] = None,
+                 context_options: Optional[Dict[str, Any]] = None,
+                 max_uses_per_slot: int = 50,
+                 health_check_interval: float = 30.0,
+                 resource_policy: Optional[ResourcePolicy] = None):
+        self.size = size
+        self.headless = headless
+        self.slow_mo = slow_mo
+        self.launch_args = launch_args if launch_args is not None else list(DEFAULT_LAUNCH_ARGS)
+        self.context_options = context_options or dict(DEFAULT_CONTEXT_OPTIONS)
+        self.max_uses_per_slot = max_uses_per_slot
+        self.health_check_interval = health_check_interval
+        # Картинки, шрифты и трекеры отклоняются в каждом контексте пула (None - грузить все)
+        self.resource_policy = resource_policy
+
+        self.playwright = None
+        self.browser = None
+        # Поколение браузера: слоты из прошлого поколения после перезапуска выбрасываются
+        self.generation = 0
+        self.relaunches = 0
+        self.in_use = 0
+
+        self._free: Optional[asyncio.Queue] = None
+        self._launch_lock: Optional[asyncio.Lock] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._started = False
+
+    async def start(self):
+        """Запуск Chromium и фоновой проверки здоровья (идемпотентно)"""
+        if self._started:
+            return
+        self._free = asyncio.Queue()
+        self._launch_lock = asyncio.Lock()
+        # Слоты создаются лениво: None в очереди означает "свободное место без страницы"
+        for _ in range(self.size):
+            self._free.put_nowait(None)
+        POOL_SIZE.set(self.size)
+        self._started = True
+        await self._ensure_browser()
+        if self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        """Остановка пула вместе с браузером"""
+        if not self._started:
+            return
+        self._started = False
+        if self._health_task:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await self._shutdown_browser()
+        self._free = None
+
+    @asynccontextmanager
+    async def page(self):
+        """Взять страницу из пула на время одного поиска"""
+        await self.start()
+        if self._free.empty():
+            POOL_SATURATED.inc()
+        started = time.monotonic()
+        slot = await self._free.get()
+        POOL_WAIT_SECONDS.observe(time.monotonic() - started)
+        self.in_use += 1
+        POOL_IN_USE.set(self.in_use)
+        try:
+            if not self._slot_alive(slot):
+                await self._discard_slot(slot)
+                slot = await self._new_slot()
+            slot.uses += 1
+            yield slot.page
+        except BaseException:
+            # После ошибки состояние страницы неизвестно - пересоздаем слот
+            await self._discard_slot(slot)
+            slot = None
+            raise
+        finally:
+            self.in_use -= 1
+            POOL_IN_USE.set(self.in_use)
+            if slot is not None and (not self._slot_alive(slot) or slot.uses >= self.max_uses_per_slot):
+                # Периодически пересоздаем контекст, чтобы не копить память страницы
+                await self._discard_slot(slot)
+                slot = None
+            if self._free is not None:
+                self._free.put_nowait(slot)
+
+    async def health_check(self) -> bool:
+        """Проверить браузер и перезапустить его при падении"""
+        if not self._started:
+            return False
+        try:
+            await self._ensure_browser()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Не удалось перезапустить Chromium: {e}")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "available": self._free.qsize() if self._free is not None else 0,
+            "connected": self._browser_connected(),
+            "generation": self.generation,
+            "relaunches": self.relaunches,
+            "resources": self.resource_policy.stats() if self.resource_policy else None
+        }
+
+    def _browser_connected(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+    def _slot_alive(self, slot: Optional[PoolSlot]) -> bool:
+        return (slot is not None
+                and slot.generation == self.generation
+                and self._browser_connected()
+                and not slot.page.is_closed())
+
+    async def _ensure_browser(self):
+        async with self._launch_lock:
+            if self._browser_connected():
+                return
+            if self.browser is not None:
+                logger.warning("⚠️ Chromium недоступен, перезапускаю браузер")
+                self.relaunches += 1
+            await self._shutdown_browser()
+            started = time.monotonic()
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(
+                headless=self.headless,
+                slow_mo=self.slow_mo,
+                args=self.launch_args
+            )
+            BROWSER_LAUNCH_SECONDS.observe(time.monotonic() - started)
+            self.generation += 1
+            logger.info(f"✅ Chromium запущен (поколение {self.generation})")
+
+    async def _shutdown_browser(self):
+        browser, playwright = self.browser, self.playwright
+        self.browser = None
+        self.playwright = None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        if playwright is not None:
+            try:
+                await playwright.stop()
+            except Exception:
+                pass
+
+    async def _new_slot(self) -> PoolSlot:
+        await self._ensure_browser()
+        context = await self.browser.new_context(**self.context_options)
+        if self.resource_policy:
+            await self.resource_policy.attach(context)
+        page = await context.new_page()
+        return PoolSlot(context=context, page=page, generation=self.generation)
+
+    async def _discard_slot(self, slot: Optional[PoolSlot]):
+        if slot is None:
+            return
+        try:
+            await slot.context.close()
+        except Exception:
+            pass
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.health_check()
+
+
+_shared_pool: Optional[BrowserPool] = None
+
+
+def get_browser_pool(headless: Optional[bool] = None) -> BrowserPool:
+    """Общий на процесс пул браузеров (настраивается через переменные окружения)"""
+    global _shared_pool
+    if _shared_pool is None:
+        if headless is None:
+            headless = os.environ.get("TOURVISOR_HEADLESS", "0") == "1"
+        _shared_pool = BrowserPool(
+            size=int(os.environ.get("TOURVISOR_POOL_SIZE", "2")),
+            headless=headless,
+            slow_mo=WaitConfig.from_env().slow_mo,
+            resource_policy=ResourcePolicy.from_env()
+        )
+    return _shared_pool
@@ -0,0 +1,190 @@
+"""
+Поиск туров напрямую через HTTP-протокол TourVisor, без Chromium
+Запускает поиск, опрашивает результаты и разбирает тот же JSON, что перехватывает виджет eto.travel
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from fixed_departure_api import Tour, TourCallback, TourSearchParams, Country, Departure
+from tourvisor_json import ListingTracker, parse_result_payload, search_state
+from search_progress import report_stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://tourvisor.ru/xml"
+
+
+class DirectAPIError(Exception):
+    """Ошибка протокола TourVisor (после нее поиск уходит в Playwright)"""
+
+
+class DirectTourvisorAPI:
+    def __init__(self, base_url: Optional[str] = None, auth_login: Optional[str] = None,
+                 auth_pass: Optional[str] = None, connection_limit: int = 20,
+                 poll_interval: float = 1.5, search_timeout: float = 60.0,
+                 request_timeout: float = 15.0, harvest_budget: Optional[float] = None):
+        self.base_url = (base_url or os.environ.get("TOURVISOR_API_BASE", DEFAULT_BASE_URL)).rstrip('/')
+        self.auth_login = auth_login or os.environ.get("TOURVISOR_AUTH_LOGIN", "")
+        self.auth_pass = auth_pass or os.environ.get("TOURVISOR_AUTH_PASS", "")
+        self.connection_limit = connection_limit
+        self.poll_interval = poll_interval
+        self.search_timeout = search_timeout
+        self.request_timeout = request_timeout
+        # Сколько секунд максимум тратить на следующие страницы результатов при max_results
+        self.harvest_budget = harvest_budget or float(os.environ.get("TOURVISOR_HARVEST_BUDGET", "60"))
+        self.session: Optional[aiohttp.ClientSession] = None
+
+        # Справочники TourVisor: название -> id (загружаются один раз)
+        self.country_ids: Dict[str, str] = {}
+        self.departure_ids: Dict[str, str] = {}
+        self._lists_lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            # Keep-alive пул соединений: запросы поиска и опроса идут по уже открытым сокетам
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+            self._lists_lock = asyncio.Lock()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def search_tours(self, params: TourSearchParams, on_tour: Optional[TourCallback] = None) -> List[Tour]:
+        await self.start()
+        country = params.country.value if isinstance(params.country, Country) else params.country
+        departure = params.departure.value if isinstance(params.departure, Departure) else params.departure
+        await self._load_lists()
+
+        if country not in self.country_ids:
+            raise DirectAPIError(f"Страна не найдена в справочнике TourVisor: {country}")
+        if departure not in self.departure_ids:
+            raise DirectAPIError(f"Город вылета не найден в справочнике TourVisor: {departure}")
+
+        query = {
+            "departure": self.departure_ids[departure],
+            "country": self.country_ids[country],
+            "datefrom": params.date_from,
+            "dateto": params.date_to,
+            "nightsfrom": params.nights_from,
+            "nightsto": params.nights_to,
+            "adults": params.adults,
+            "child": params.children,
+        }
+        if params.price_min:
+            query["pricefrom"] = params.price_min
+        if params.price_max:
+            query["priceto"] = params.price_max
+        if params.stars:
+            query["stars"] = params.stars
+
+        started = await self._get("search.php", query)
+        request_id = (started.get("result") or {}).get("requestid")
+        if not request_id:
+            raise DirectAPIError(f"TourVisor не вернул requestid: {started}")
+        report_stage("submitted")
+
+        tours = await self._poll_results(request_id, country, on_tour, params.max_results)
+        return tours[:params.max_results] if params.max_results else tours
+
+    async def _poll_results(self, request_id: str, country: str, on_tour: Optional[TourCallback] = None,
+                            max_results: Optional[int] = None) -> List[Tour]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.search_timeout
+        tours: Dict[str, Tour] = {}
+        listing = ListingTracker()
+
+        def merge(payload) -> int:
+            listing.update(payload)
+            # Каждая пачка склеивается с предыдущими по ключу тура, новые туры отдаются сразу
+            added = 0
+            for record in parse_result_payload(payload, country):
+                key = record.pop("key")
+                is_new = key not in tours
+                tours[key] = Tour(**record)
+                if is_new:
+                    added += 1
+                    if on_tour:
+                        on_tour(tours[key])
+            return added
+
+        while True:
+            payload = await self._get("result.php", {"requestid": request_id, "type": "result"})
+            merge(payload)
+            if search_state(payload) == "finished" or loop.time() >= deadline:
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        if listing.complete:
+            # Пришли все найденные отели - из выдачи можно отвечать на более узкие запросы
+            report_stage("results_exhausted")
+            return list(tours.values())
+
+        # Первая страница результатов - только часть отелей; остальные забираем постранично
+        page = 1
+        deadline = loop.time() + self.harvest_budget
+        while max_results and len(tours) < max_results and loop.time() < deadline:
+            page += 1
+            payload = await self._get("result.php", {"requestid": request_id, "type": "result", "page": page})
+            if not merge(payload):
+                # Страница без новых туров - выдача получена целиком
+                report_stage("results_exhausted")
+                break
+
+        return list(tours.values())
+
+    async def _load_lists(self):
+        if self.country_ids and self.departure_ids:
+            return
+        async with self._lists_lock:
+            if self.country_ids and self.departure_ids:
+                return
+            payload = await self._get("list.php", {"type": "departure,country"})
+            lists = payload.get("lists") or {}
+            self.departure_ids = self._list_ids(lists.get("departures"), "departure")
+            self.country_ids = self._list_ids(lists.get("countries"), "country")
+
+    @staticmethod
+    def _list_ids(section: Any, item_key: str) -> Dict[str, str]:
+        items = section.get(item_key, []) if isinstance(section, dict) else []
+        if isinstance(items, dict):
+            items = [items]
+        return {item["name"]: str(item["id"]) for item in items if "name" in item and "id" in item}
+
+    async def _get(self, endpoint: str, query: Dict[str, Any]) -> Dict[str, Any]:
+        query = dict(query, format="json")
+        if self.auth_login:
+            query["authlogin"] = self.auth_login
+            query["authpass"] = self.auth_pass
+        try:
+            async with self.session.get(f"{self.base_url}/{endpoint}", params=query) as response:
+                if response.status != 200:
+                    raise DirectAPIError(f"{endpoint}: HTTP {response.status}")
+                payload = await response.json(content_type=None)
+        except aiohttp.ClientError as e:
+            raise DirectAPIError(f"{endpoint}: {e}") from e
+        except asyncio.TimeoutError as e:
+            raise DirectAPIError(f"{endpoint}: таймаут запроса") from e
+        if not isinstance(payload, dict):
+            raise DirectAPIError(f"{endpoint}: неожиданный ответ")
+        data = payload.get("data")
+        error = payload.get("error") or (data.get("error") if isinstance(data, dict) else None)
+        if error:
+            raise DirectAPIError(f"{endpoint}: {error}")
+        return payload
@@ -1,11 +1,21 @@
 from playwright.async_api import async_playwright
 import asyncio
 import json
-import re
-from typing import Dict, List, Optional, Union
+import os
+import time
+from typing import Callable, Dict, List, Optional, Union
 from dataclasses import dataclass
 from enum import Enum
 
+from browser_pool import BROWSER_LAUNCH_SECONDS, BrowserPool, DEFAULT_CONTEXT_OPTIONS, DEFAULT_LAUNCH_ARGS
+from waits import WaitConfig, WaitEngine
+from resource_policy import ResourcePolicy
+from tourvisor_json import ResultCapture
+from search_progress import StageTimer, report_stage, track_stages
+from tour_format import print_tour
+from tour_model import Tour, parse_date, parse_float
+from metrics import get_metrics
+
 class Country(Enum):
     TURKEY = "Турция"
     EGYPT = "Египет" 
@@ -56,24 +66,205 @@ class TourSearchParams:
     price_max: Optional[int] = None
     resort: str = "любой"
     stars: Optional[int] = None
+    # Догружать выдачу ("показать еще", прокрутка), пока не наберется столько туров (None - только первая страница)
+    max_results: Optional[int] = None
+    # Отбор готового результата: сортировка ("price", "rating", "stars") и сколько туров вернуть
+    sort_by: Optional[str] = None
+    limit: Optional[int] = None
 
-@dataclass
-class Tour:
-    hotel: str
-    price: str
-    nights: str
-    date: str
-    date_to: str
-    meal: str
-    operator: str
-    resort: str
-    stars: str
-    rating: str
-    country: str = "N/A"
+# Поля TourSearchParams, которые не меняют сам поиск (и не входят в ключ кэша)
+VIEW_FIELDS = ("sort_by", "limit")
+
+# Вызывается для каждого тура, как только он найден (до окончания поиска)
+TourCallback = Callable[[Tour], None]
+
+SEARCH_PHASE_SECONDS = get_metrics().histogram(
+    "tourvisor_search_phase_seconds", "Длительность фаз поиска в браузере (goto, шаги формы, ожидание выдачи, разбор)",
+    ["phase"])
+# result: ok или empty (пустая выдача); поиски, прерванные ошибкой, считает SEARCH_ERRORS
+SEARCHES = get_metrics().counter("tourvisor_searches_total", "Поиски в браузере", ["result"])
+SEARCH_ERRORS = get_metrics().counter("tourvisor_search_errors_total", "Поиски в браузере, прерванные ошибкой")
+SELECTOR_FALLBACKS = get_metrics().counter(
+    "tourvisor_selector_fallbacks_total", "Шаги, выполненные запасным селектором или способом", ["step"])
+
+# Страница поиска с виджетом TourVisor (TOURVISOR_SEARCH_URL - например, локальная копия для бенчмарка)
+SEARCH_URL = "https://eto.travel/search/"
+
+# Кнопки догрузки выдачи; если ни одна не найдена, ищется ссылка/кнопка с текстом "Показать еще"
+SHOW_MORE_SELECTORS = ['.TVResultMoreButton', '.TVShowMoreButton', '.TVMoreButton', '.TVPaginationNext']
+
+# Догрузка следующей порции: прокрутка (виртуальный список) и клик по "показать еще".
+# Возвращает true, если что-то было сделано
+JS_SHOW_MORE = '''
+(selectors) => {
+    const visible = (el) => {
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0 && !el.disabled;
+    };
+    const panel = document.getElementById('TVResultPanel');
+    const before = window.scrollY + (panel ? panel.scrollTop : 0);
+    window.scrollTo(0, document.body.scrollHeight);
+    if (panel) panel.scrollTop = panel.scrollHeight;
+    const scrolled = window.scrollY + (panel ? panel.scrollTop : 0) > before;
+
+    let button = null;
+    for (const selector of selectors) {
+        button = Array.from(document.querySelectorAll(selector)).find(visible);
+        if (button) break;
+    }
+    if (!button) {
+        const root = panel ? panel.parentElement || panel : document.body;
+        button = Array.from(root.querySelectorAll('button, a, span, div')).find(el =>
+            el.children.length === 0 && /показать\\s+(ещ[её]|больше)/i.test(el.textContent.trim()) && visible(el));
+    }
+    if (button) button.click();
+    return Boolean(button) || scrolled;
+}
+'''
+
+# Есть ли что догружать, без прокрутки и кликов: видимая кнопка "показать еще"
+# или список выдачи, прокрученный не до конца
+JS_HAS_MORE = '''
+(selectors) => {
+    const visible = (el) => {
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0 && !el.disabled;
+    };
+    for (const selector of selectors) {
+        if (Array.from(document.querySelectorAll(selector)).some(visible)) return true;
+    }
+    const panel = document.getElementById('TVResultPanel');
+    const root = panel ? panel.parentElement || panel : document.body;
+    if (Array.from(root.querySelectorAll('button, a, span, div')).some(el =>
+        el.children.length === 0 && /показать\\s+(ещ[её]|больше)/i.test(el.textContent.trim()) && visible(el))) {
+        return true;
+    }
+    return Boolean(panel) && panel.scrollHeight - panel.scrollTop - panel.clientHeight > 1;
+}
+'''
+
+# Разбор карточек выдачи за один проход: регулярные выражения создаются один раз, текст карточки
+# делится на строки один раз, через CDP возвращаются только поля (упакованными массивами в порядке CARD_FIELDS)
+CARD_FIELDS = ("id", "hotel", "price", "stars", "resort", "rating", "nights", "date", "meal", "operator")
+RESULT_CARD_SELECTOR = ".TVSHotelResultItem, .TVResultListViewItem"
+
+JS_EXTRACT_CARDS = r'''
+([selector, fields, packed]) => {
+    const panel = document.getElementById('TVResultPanel');
+    if (!panel || panel.children.length === 0) return [];
+
+    const PRICE = /(\d{1,3}[\s\.]?\d{3})\s*(?:руб|₽)/i;
+    const HAS_HOTEL = /^[A-ZА-ЯЁ][\w\s\-\.]{3,50}\*/;
+    const HOTEL_FULL = /^([A-ZА-ЯЁ][\w\s\-\.]{3,50})\*([A-ZА-ЯЁ][\w\s\-\.,]{3,30}),\s*([\d.]+)/;
+    const HOTEL_STARS = /^([A-ZА-ЯЁ][\w\s\-\.]{3,50})\*([\d.]+)/;
+    const HOTEL_RESORT = /^([A-ZА-ЯЁ][\w\s\-\.]{3,50})\*([A-ZА-ЯЁ][\w\s\-\.,]{3,30}),/;
+    const HOTEL_ANY = /^([A-ZА-ЯЁ][\w\s\-\.]{3,50})\*/;
+    const CAPITAL = /^[A-ZА-ЯЁ]/;
+    const LONG_NUMBER = /\d{3,}/;
+    const RATING = /,\s*([\d.]+)$/;
+    const NIGHTS = /(\d+)\s*ноч/i;
+    const DATE = /(\d{2}[\.\/\-]\d{2}[\.\/\-]\d{4})/;
+    const PRICE_SEPARATORS = /[\s\.]/g;
+    const MEALS = [
+        [/all\s*inclusive|ai/i, 'All Inclusive'],
+        [/ultra\s*all\s*inclusive|uai/i, 'Ultra All Inclusive'],
+        [/full\s*board|fb/i, 'Full Board'],
+        [/half\s*board|hb/i, 'Half Board'],
+        [/bed\s*breakfast|bb/i, 'Bed & Breakfast'],
+    ];
+    const OPERATORS = [
+        [/anex\s*tour/i, 'Anex Tour'],
+        [/tui/i, 'TUI'],
+        [/coral\s*travel/i, 'Coral Travel'],
+        [/biblio[-\s]?globus/i, 'Biblio-Globus'],
+        [/pegas\s*touristik/i, 'Pegas Touristik'],
+    ];
+    const RESORTS = ['Дубай', 'Абу-Даби', 'Шарджа', 'Рас-аль-Хайма', 'Аджман', 'Умм-аль-Кувейн',
+                     'Анталия', 'Белек', 'Кемер', 'Сиде', 'Алания', 'Мармарис', 'Бодрум',
+                     'Шарм-эль-Шейх', 'Хургада', 'Дахаб', 'Марса-Алам'];
+    const firstMatch = (rules, text) => {
+        for (const [pattern, label] of rules) if (pattern.test(text)) return label;
+        return null;
+    };
+
+    const rows = [];
+    for (const card of panel.querySelectorAll(selector)) {
+        const text = card.textContent || '';
+        const priceMatch = text.match(PRICE);
+        if (!priceMatch || !HAS_HOTEL.test(text)) continue;
+        const rect = card.getBoundingClientRect();
+        if (rect.height <= 50 || rect.width <= 150) continue;
+
+        // Один проход по строкам: каждое поле берется из первой подходящей строки
+        let hotel = null, stars = null, resort = null, rating = null;
+        for (const raw of text.split('\n')) {
+            const line = raw.trim();
+            if (!line) continue;
+            if (hotel === null) {
+                const match = line.match(HOTEL_FULL) || line.match(HOTEL_ANY);
+                if (match) {
+                    hotel = match[1].trim();
+                } else if (CAPITAL.test(line) && line.length > 5 && line.length < 60 && !LONG_NUMBER.test(line) &&
+                           !line.includes('Поделиться') && !line.includes('Найти')) {
+                    hotel = line;
+                }
+            }
+            if (stars === null) {
+                const match = line.match(HOTEL_STARS);
+                if (match) stars = match[2];
+            }
+            if (resort === null) {
+                const match = line.match(HOTEL_RESORT);
+                if (match) resort = match[2].trim();
+            }
+            if (rating === null) {
+                const match = line.match(RATING);
+                if (match) rating = match[1];
+            }
+            if (hotel !== null && stars !== null && resort !== null && rating !== null) break;
+        }
+        if (hotel === null || hotel.length <= 3) continue;
+        if (resort === null) resort = RESORTS.find(name => text.includes(name)) || null;
+
+        const nights = text.match(NIGHTS);
+        const date = text.match(DATE);
+        const row = [
+            card.id || null,
+            hotel,
+            priceMatch[1].replace(PRICE_SEPARATORS, ''),
+            stars,
+            resort,
+            rating,
+            nights ? nights[1] : null,
+            date ? date[1] : null,
+            firstMatch(MEALS, text),
+            firstMatch(OPERATORS, text),
+        ];
+        rows.push(packed ? row : Object.fromEntries(fields.map((field, i) => [field, row[i]])));
+    }
+    return rows;
+}
+'''
 
 class FixedTourvisorAPI:
-    def __init__(self, headless: bool = False):
+    def __init__(self, headless: bool = False, pool: Optional[BrowserPool] = None,
+                 wait_config: Optional[WaitConfig] = None, extraction: Optional[str] = None,
+                 harvest_budget: Optional[float] = None, resource_policy: Optional[ResourcePolicy] = None,
+                 search_url: Optional[str] = None):
         self.headless = headless
+        self.search_url = search_url or os.environ.get("TOURVISOR_SEARCH_URL", SEARCH_URL)
+        self.waits = WaitEngine(wait_config)
+        # Сколько секунд максимум тратить на догрузку выдачи при max_results
+        self.harvest_budget = harvest_budget or float(os.environ.get("TOURVISOR_HARVEST_BUDGET", "60"))
+        # "xhr" - туры из JSON-ответов TourVisor (DOM как запасной вариант), "dom" - только разбор карточек
+        self.extraction = extraction or os.environ.get("TOURVISOR_EXTRACTION", "xhr")
+        # Карточки DOM через CDP: массивами в порядке CARD_FIELDS (по умолчанию) или объектами
+        self.packed_cards = os.environ.get("TOURVISOR_PACKED_CARDS", "1") != "0"
+        # Общий пул браузеров: если задан, страницы берутся из него вместо собственного Chromium
+        self.pool = pool
+        # Политика ресурсов собственного контекста (у пула - своя)
+        self.resource_policy = resource_policy or ResourcePolicy.from_env()
+        self.playwright = None
         self.browser = None
         self.context = None
         self.page = None
@@ -99,46 +290,180 @@ class FixedTourvisorAPI:
         await self.close()
     
     async def start(self):
+        if self.pool:
+            await self.pool.start()
+            return
         if not self.browser:
+            started = time.monotonic()
             self.playwright = await async_playwright().start()
             self.browser = await self.playwright.chromium.launch(
                 headless=self.headless, 
-                slow_mo=500
-            )
-            self.context = await self.browser.new_context(
-                viewport={'width': 1440, 'height': 900},
-                user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36",
-                locale="ru-RU",
-                timezone_id="Europe/Moscow",
+                slow_mo=self.waits.config.slow_mo,
+                args=DEFAULT_LAUNCH_ARGS
             )
+            BROWSER_LAUNCH_SECONDS.observe(time.monotonic() - started)
+            self.context = await self.browser.new_context(**DEFAULT_CONTEXT_OPTIONS)
+            if self.resource_policy:
+                await self.resource_policy.attach(self.context)
             self.page = await self.context.new_page()
     
     async def close(self):
+        # Пул живет весь процесс и закрывается своим владельцем
         if self.browser:
             await self.browser.close()
             self.browser = None
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
     
-    async def search_tours(self, params: TourSearchParams) -> List[Tour]:
-        await self.start()
+    async def search_tours(self, params: TourSearchParams, on_tour: Optional[TourCallback] = None) -> List[Tour]:
+        if self.pool:
+            # Ошибка запуска браузера - не ошибка поиска, она уходит вызывающему
+            await self.pool.start()
+            try:
+                # Ошибка поиска должна выйти из page(): пул пересоздаст страницу, а не вернет сломанную следующему
+                async with self.pool.page() as page:
+                    return await self._search_on_page(page, params, on_tour)
+            except Exception as e:
+                return self._search_failed(e)
         
+        await self.start()
         try:
-            await self.page.goto("https://eto.travel/search/", timeout=120000)
-            await asyncio.sleep(8)
+            return await self._search_on_page(self.page, params, on_tour)
+        except Exception as e:
+            return self._search_failed(e)
+    
+    def _search_failed(self, error: Exception) -> List[Tour]:
+        SEARCH_ERRORS.inc()
+        print(f"❌ Ошибка поиска: {error}")
+        return []
+    
+    async def _search_on_page(self, page, params: TourSearchParams,
+                              on_tour: Optional[TourCallback] = None) -> List[Tour]:
+        """Поиск на взятой странице с замером фаз (время ожидания страницы пула сюда не входит)"""
+        with track_stages(StageTimer(lambda phase, seconds: SEARCH_PHASE_SECONDS.observe(seconds, phase=phase)).mark):
+            tours = await self._run_search(page, params, on_tour)
+        SEARCHES.inc(result="ok" if tours else "empty")
+        return tours
+    
+    async def _run_search(self, page, params: TourSearchParams,
+                          on_tour: Optional[TourCallback] = None) -> List[Tour]:
+        waiter = self.waits.attach(page)
+        # Слушатель ответов ставим до goto, чтобы не пропустить ни одной пачки результатов
+        capture = None
+        if self.extraction == "xhr":
+            on_record = (lambda fields: on_tour(Tour(**fields))) if on_tour else None
+            capture = ResultCapture(page, self._country_value(params), on_record)
+        try:
+            await page.goto(self.search_url, timeout=120000)
+            report_stage("navigated")
+            await waiter.page_ready()
+            report_stage("page_loaded")
             
-            await self.page.wait_for_selector('.tv-search-form.tv-loaded', timeout=30000)
-            await asyncio.sleep(3)
+            await self._fill_form_correctly(page, params, waiter)
+            
+            if capture:
+                tours = await self._wait_captured_tours(capture, waiter)
+                report_stage("results_ready")
+                if tours:
+                    report_stage("extracted")
+                    if params.max_results:
+                        # Новые пачки JSON перехватываются тем же слушателем и склеиваются по ключу тура
+                        async def collect_json() -> int:
+                            return len(capture.records)
+                        
+                        await self._harvest(page, params, waiter, collect_json, len(tours))
+                        tours = [Tour(**fields) for fields in capture.tour_fields()][:params.max_results]
+                    if capture.listing.complete:
+                        # Финальная пачка со всеми найденными отелями - выдача получена целиком
+                        report_stage("results_exhausted")
+                    print(f"✅ Туры получены из JSON TourVisor: {len(tours)}")
+                    return tours
+                SELECTOR_FALLBACKS.inc(step="result_json")
+                print("⚠️ JSON TourVisor не перехвачен, разбираю карточки выдачи")
+            else:
+                await waiter.results()
+                report_stage("results_ready")
             
-            await self._fill_form_correctly(params)
-            await asyncio.sleep(20)
+            # Ключи уже разобранных карточек: при догрузке разбираются только новые
+            seen = set()
+            tours = await self._extract_tours(page, params, seen)
+            report_stage("extracted")
+            # Карточки выдачи разбираются одним проходом - отдаем их все сразу
+            if on_tour:
+                for tour in tours:
+                    on_tour(tour)
             
-            tours = await self._extract_tours(params)
+            if params.max_results:
+                async def collect_cards() -> int:
+                    new_tours = await self._extract_tours(page, params, seen)
+                    if on_tour:
+                        for tour in new_tours:
+                            on_tour(tour)
+                    tours.extend(new_tours)
+                    return len(tours)
+                
+                await self._harvest(page, params, waiter, collect_cards, len(tours))
+                tours = tours[:params.max_results]
+            elif not await page.evaluate(JS_HAS_MORE, SHOW_MORE_SELECTORS):
+                # Догружать нечего - первая страница и есть вся выдача
+                report_stage("results_exhausted")
             return tours
             
-        except Exception as e:
-            print(f"❌ Ошибка поиска: {e}")
-            return []
+        finally:
+            waiter.detach()
+            if capture:
+                capture.detach()
+    
+    async def _wait_captured_tours(self, capture: ResultCapture, waiter) -> List[Tour]:
+        """Ждем финальную пачку JSON или стабилизацию выдачи - что наступит раньше"""
+        finished = asyncio.create_task(capture.wait_finished(self.waits.config.results_timeout))
+        rendered = asyncio.create_task(waiter.results())
+        done, pending = await asyncio.wait({finished, rendered}, return_when=asyncio.FIRST_COMPLETED)
+        
+        # Поиск завершился, но результаты могли еще не прийти - дожидаемся отрисовки выдачи
+        if finished in done and not capture.records:
+            await rendered
+        for task in pending:
+            if not task.done():
+                task.cancel()
+        
+        return [Tour(**fields) for fields in capture.tour_fields()]
     
-    async def _fill_form_correctly(self, params: TourSearchParams):
+    async def _harvest(self, page, params: TourSearchParams, waiter, collect, count: int):
+        """Догружать выдачу, пока не наберется max_results туров, не кончится бюджет или выдача"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.harvest_budget
+        batches = 0
+        while count < params.max_results:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                print(f"⏱️ Бюджет догрузки исчерпан: {count} туров")
+                break
+            if not await page.evaluate(JS_SHOW_MORE, SHOW_MORE_SELECTORS):
+                # Кнопки догрузки нет - выдача получена целиком, из нее можно отвечать на более узкие запросы
+                report_stage("results_exhausted")
+                break
+            try:
+                await asyncio.wait_for(self._wait_more(waiter), remaining)
+            except asyncio.TimeoutError:
+                pass
+            new_count = await collect()
+            if new_count <= count:
+                break
+            batches += 1
+            count = new_count
+        if batches:
+            print(f"📄 Догружено порций выдачи: {batches}, всего туров: {count}")
+    
+    async def _wait_more(self, waiter):
+        await waiter.settle()
+        await waiter.results()
+    
+    def _country_value(self, params: TourSearchParams) -> str:
+        return params.country.value if isinstance(params.country, Country) else params.country
+    
+    async def _fill_form_correctly(self, page, params: TourSearchParams, waiter):
         print(f"🔍 Заполняю форму: {params.country} из {params.departure}")
         
         # 1. Выбор страны
@@ -146,14 +471,16 @@ class FixedTourvisorAPI:
         country_selector = self.country_selectors.get(country_value, f"text={country_value}")
         
         try:
-            await self.page.click('.TVCountrySelect')
-            await asyncio.sleep(2)
-            await self.page.click(country_selector)
+            await page.click('.TVCountrySelect')
+            await waiter.dropdown(country_selector)
+            await page.click(country_selector)
             print(f"✅ Страна выбрана: {country_value}")
         except Exception as e:
+            SELECTOR_FALLBACKS.inc(step="country_failed")
             print(f"⚠️ Ошибка выбора страны: {e}")
         
-        await asyncio.sleep(3)
+        await waiter.settle()
+        report_stage("country_selected")
         
         # 2. ВЫБОР ГОРОДА ВЫЛЕТА (ИСПРАВЛЕНО)
         departure_value = params.departure.value if isinstance(params.departure, Departure) else params.departure
@@ -171,16 +498,19 @@ class FixedTourvisorAPI:
         departure_field_clicked = False
         for selector in departure_field_selectors:
             try:
-                departure_field = await self.page.wait_for_selector(selector, timeout=3000)
+                departure_field = await page.wait_for_selector(selector, timeout=3000)
                 if departure_field:
                     await departure_field.click()
                     print(f"✅ Поле вылета открыто: {selector}")
                     departure_field_clicked = True
+                    if selector != departure_field_selectors[0]:
+                        SELECTOR_FALLBACKS.inc(step="departure_field")
                     break
             except:
                 continue
         
         if not departure_field_clicked:
+            SELECTOR_FALLBACKS.inc(step="departure_field_js")
             print("⚠️ Поле вылета не найдено, пробую JavaScript...")
             # Пробуем найти и кликнуть по элементу с текстом "Город вылета"
             js_find_departure_field = '''
@@ -206,10 +536,10 @@ class FixedTourvisorAPI:
                 return 'Departure field not found';
             }
             '''
-            result = await self.page.evaluate(js_find_departure_field)
+            result = await page.evaluate(js_find_departure_field)
             print(f"🔍 JavaScript: {result}")
         
-        await asyncio.sleep(2)
+        await waiter.dropdown(f"text={departure_value}")
         
         # Теперь ищем нужный город в выпадающем списке
         departure_found = False
@@ -224,16 +554,19 @@ class FixedTourvisorAPI:
         
         for selector in direct_selectors:
             try:
-                departure_option = await self.page.wait_for_selector(selector, timeout=2000)
+                departure_option = await page.wait_for_selector(selector, timeout=2000)
                 if departure_option:
                     await departure_option.click()
                     print(f"✅ Город вылета выбран: {departure_value}")
                     departure_found = True
+                    if selector != direct_selectors[0]:
+                        SELECTOR_FALLBACKS.inc(step="departure_option")
                     break
             except:
                 continue
         
         if not departure_found:
+            SELECTOR_FALLBACKS.inc(step="departure_option_js")
             print("⚠️ Город не найден в прямых селекторах, пробую JavaScript...")
             js_find_city = f'''
             () => {{
@@ -250,14 +583,15 @@ class FixedTourvisorAPI:
                 return 'City not found';
             }}
             '''
-            result = await self.page.evaluate(js_find_city)
+            result = await page.evaluate(js_find_city)
             print(f"🔍 Поиск города: {result}")
         
-        await asyncio.sleep(3)
+        await waiter.settle()
+        report_stage("departure_selected")
         
         # 3. Даты
         try:
-            date_inputs = await self.page.query_selector_all('input[type="date"], input[placeholder*="дата"]')
+            date_inputs = await page.query_selector_all('input[type="date"], input[placeholder*="дата"]')
             if len(date_inputs) >= 1:
                 await date_inputs[0].fill(params.date_from)
                 print(f"✅ Дата с: {params.date_from}")
@@ -267,196 +601,71 @@ class FixedTourvisorAPI:
         except Exception as e:
             print(f"⚠️ Ошибка дат: {e}")
         
-        await asyncio.sleep(3)
+        await waiter.settle()
+        report_stage("dates_filled")
         
         # 4. Ночи
         try:
-            night_selects = await self.page.query_selector_all('select[name*="night"], select[name*="duration"]')
+            night_selects = await page.query_selector_all('select[name*="night"], select[name*="duration"]')
             if night_selects:
                 await night_selects[0].select_option(str(params.nights_from))
                 print(f"✅ Ночи: {params.nights_from}")
         except Exception as e:
             print(f"⚠️ Ошибка ночей: {e}")
         
-        await asyncio.sleep(3)
+        await waiter.settle()
+        report_stage("nights_selected")
         
         # 5. Туристы
         try:
-            adult_selects = await self.page.query_selector_all('select[name*="adult"]')
+            adult_selects = await page.query_selector_all('select[name*="adult"]')
             if adult_selects:
                 await adult_selects[0].select_option(str(params.adults))
                 print(f"✅ Взрослые: {params.adults}")
         except Exception as e:
             print(f"⚠️ Ошибка туристов: {e}")
         
-        await asyncio.sleep(3)
+        await waiter.settle()
+        report_stage("tourists_selected")
         
         # 6. Кнопка поиска
         try:
-            await self.page.click('.TVSearchButton')
+            await page.click('.TVSearchButton')
             print("✅ Поиск запущен")
         except Exception as e:
+            SELECTOR_FALLBACKS.inc(step="search_button")
             print(f"⚠️ Ошибка поиска: {e}")
-            await self.page.keyboard.press('Enter')
+            await page.keyboard.press('Enter')
+        report_stage("submitted")
     
-    async def _extract_tours(self, params: TourSearchParams) -> List[Tour]:
-        js_search = f'''
-        () => {{
-            const tours = [];
-            const tvPanel = document.getElementById('TVResultPanel');
-            
-            if (tvPanel && tvPanel.children.length > 0) {{
-                const hotelCards = tvPanel.querySelectorAll('.TVSHotelResultItem, .TVResultListViewItem');
-                
-                for (let card of hotelCards) {{
-                    const text = card.textContent || '';
-                    const hasPrice = /\\d{{1,3}}[\\s\\.]?\\d{{3}}\\s*(?:руб|₽)/i.test(text);
-                    const hasHotelName = /^[A-ZА-ЯЁ][\\w\\s\\-\\.]{{3,50}}\\*/.test(text);
-                    
-                    if (hasPrice && hasHotelName) {{
-                        const rect = card.getBoundingClientRect();
-                        if (rect.height > 50 && rect.width > 150) {{
-                            const tourData = {{
-                                text: text.substring(0, 3000),
-                                className: card.className,
-                                id: card.id
-                            }};
-                            
-                            tourData.hotel = extractHotelName(text);
-                            tourData.price = extractPrice(text);
-                            tourData.stars = extractStars(text);
-                            tourData.resort = extractResort(text);
-                            tourData.rating = extractRating(text);
-                            tourData.nights = extractNights(text);
-                            tourData.date = extractDate(text);
-                            tourData.meal = extractMeal(text);
-                            tourData.operator = extractOperator(text);
-                            
-                            if (tourData.hotel !== 'N/A' && tourData.hotel.length > 3) {{
-                                tours.push(tourData);
-                            }}
-                        }}
-                    }}
-                }}
-            }}
-            
-            function extractHotelName(text) {{
-                const lines = text.split('\\n').map(l => l.trim()).filter(l => l);
-                for (let line of lines) {{
-                    const match = line.match(/^([A-ZА-ЯЁ][\\w\\s\\-\\.]{{3,50}})\\*([A-ZА-ЯЁ][\\w\\s\\-\\.,]{{3,30}}),\\s*([\\d.]+)/);
-                    if (match) {{
-                        return match[1].trim();
-                    }}
-                    const starMatch = line.match(/^([A-ZА-ЯЁ][\\w\\s\\-\\.]{{3,50}})\\*/);
-                    if (starMatch) {{
-                        return starMatch[1].trim();
-                    }}
-                    if (/^[A-ZА-ЯЁ]/.test(line) && line.length > 5 && line.length < 60 && 
-                        !/\\d{{3,}}/.test(line) &&
-                        !line.includes('Поделиться') && !line.includes('Найти')) {{
-                        return line;
-                    }}
-                }}
-                return 'N/A';
-            }}
-            
-            function extractPrice(text) {{
-                const match = text.match(/(\\d{{1,3}}[\\s\\.]?\\d{{3}})\\s*(?:руб|₽)/i);
-                return match ? match[1].replace(/[\\s\\.]/g, '') + ' руб' : 'N/A';
-            }}
-            
-            function extractStars(text) {{
-                const lines = text.split('\\n').map(l => l.trim()).filter(l => l);
-                for (let line of lines) {{
-                    const match = line.match(/^([A-ZА-ЯЁ][\\w\\s\\-\\.]{{3,50}})\\*([\\d.]+)/);
-                    if (match) {{
-                        return match[2] + '★';
-                    }}
-                }}
-                return 'N/A';
-            }}
-            
-            function extractResort(text) {{
-                const lines = text.split('\\n').map(l => l.trim()).filter(l => l);
-                for (let line of lines) {{
-                    const match = line.match(/^([A-ZА-ЯЁ][\\w\\s\\-\\.]{{3,50}})\\*([A-ZА-ЯЁ][\\w\\s\\-\\.,]{{3,30}}),/);
-                    if (match) {{
-                        return match[2].trim();
-                    }}
-                }}
-                
-                const resorts = ['Дубай', 'Абу-Даби', 'Шарджа', 'Рас-аль-Хайма', 'Аджман', 'Умм-аль-Кувейн',
-                               'Анталия', 'Белек', 'Кемер', 'Сиде', 'Алания', 'Мармарис', 'Бодрум',
-                               'Шарм-эль-Шейх', 'Хургада', 'Дахаб', 'Марса-Алам'];
-                for (let resort of resorts) {{
-                    if (text.includes(resort)) {{
-                        return resort;
-                    }}
-                }}
-                return 'N/A';
-            }}
-            
-            function extractRating(text) {{
-                const lines = text.split('\\n').map(l => l.trim()).filter(l => l);
-                for (let line of lines) {{
-                    const match = line.match(/,\\s*([\\d.]+)$/);
-                    if (match) {{
-                        return match[1] + '⭐';
-                    }}
-                }}
-                return 'N/A';
-            }}
-            
-            function extractNights(text) {{
-                const match = text.match(/(\\d+)\\s*ноч/i);
-                return match ? match[1] + ' ночей' : 'N/A';
-            }}
-            
-            function extractDate(text) {{
-                const match = text.match(/(\\d{{2}}[\\.\\/\\-]\\d{{2}}[\\.\\/\\-]\\d{{4}})/);
-                return match ? match[1] : 'N/A';
-            }}
-            
-            function extractMeal(text) {{
-                if (/all\\s*inclusive|ai/i.test(text)) return 'All Inclusive';
-                if (/ultra\\s*all\\s*inclusive|uai/i.test(text)) return 'Ultra All Inclusive';
-                if (/full\\s*board|fb/i.test(text)) return 'Full Board';
-                if (/half\\s*board|hb/i.test(text)) return 'Half Board';
-                if (/bed\\s*breakfast|bb/i.test(text)) return 'Bed & Breakfast';
-                return 'N/A';
-            }}
-            
-            function extractOperator(text) {{
-                if (/anex\\s*tour/i.test(text)) return 'Anex Tour';
-                if (/tui/i.test(text)) return 'TUI';
-                if (/coral\\s*travel/i.test(text)) return 'Coral Travel';
-                if (/biblio[-\\s]?globus/i.test(text)) return 'Biblio-Globus';
-                if (/pegas\\s*touristik/i.test(text)) return 'Pegas Touristik';
-                return 'N/A';
-            }}
-            
-            return tours;
-        }}
-        '''
-        
-        results = await self.page.evaluate(js_search)
+    async def _extract_tours(self, page, params: TourSearchParams, seen: Optional[set] = None) -> List[Tour]:
+        """Разбор карточек #TVResultPanel; с seen - только карточек, которых еще не было"""
+        rows = await page.evaluate(JS_EXTRACT_CARDS, [RESULT_CARD_SELECTOR, CARD_FIELDS, self.packed_cards])
+        if not self.packed_cards:
+            rows = [[row[field] for field in CARD_FIELDS] for row in rows]
+        country = params.country.value if isinstance(params.country, Country) else params.country
         
         tours = []
-        for result in results:
-            tour = Tour(
-                hotel=result['hotel'],
-                price=result['price'],
-                nights=result['nights'],
-                date=result['date'],
-                date_to='N/A',
-                meal=result['meal'],
-                operator=result['operator'],
-                resort=result['resort'],
-                stars=result['stars'],
-                rating=result['rating'],
-                country=params.country.value if isinstance(params.country, Country) else params.country
-            )
-            tours.append(tour)
+        for _, hotel, price, stars, resort, rating, nights, date, meal, operator in rows:
+            # Ключ по содержимому карточки: виртуальный список переиспользует узлы DOM (и их id) для новых туров
+            # и заново отрисовывает уже разобранные - отметки на узлах и id для этого ненадежны
+            key = (hotel, price, date, nights, meal, operator)
+            if seen is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            tours.append(Tour(
+                hotel=hotel,
+                price=int(price) if price else None,
+                nights=int(nights) if nights else None,
+                date=parse_date(date),
+                meal=meal,
+                operator=operator,
+                resort=resort,
+                stars=parse_float(stars),
+                rating=parse_float(rating),
+                country=country
+            ))
         
         return tours
     
@@ -470,26 +679,15 @@ class FixedTourvisorAPI:
         
         for i, tour in enumerate(tours[:15], 1):
             print(f"\n📍 Тур #{i}")
-            print(f"🏨 {tour.hotel}")
-            if tour.stars != 'N/A':
-                print(f"⭐ {tour.stars}")
-            if tour.resort != 'N/A':
-                print(f"🏖️ {tour.resort}")
-            if tour.rating != 'N/A':
-                print(f"📊 Рейтинг: {tour.rating}")
-            if tour.price != 'N/A':
-                print(f"💰 Цена: {tour.price}")
-            if tour.nights != 'N/A':
-                print(f"🌙 Ночей: {tour.nights}")
-            if tour.date != 'N/A':
-                print(f"📅 Дата: {tour.date}")
-            if tour.meal != 'N/A':
-                print(f"🍽️ Питание: {tour.meal}")
+            print_tour(tour)
             print("-" * 50)
 
 # Тестовые функции
 async def test_departure_cities():
-    """Тест разных городов вылета"""
+    """Тест разных городов вылета: все города ищутся одновременно на страницах общего пула"""
+    # Импорт здесь: batch_search сам импортирует этот модуль
+    from batch_search import run_batch
+    
     cities_to_test = [
         (Departure.MOSCOW, "Москва"),
         (Departure.ALMATY, "Алматы"),
@@ -497,10 +695,8 @@ async def test_departure_cities():
         (Departure.KAZAN, "Казань")
     ]
     
-    for departure_enum, departure_name in cities_to_test:
-        print(f"\n🔍 Тестирование города вылета: {departure_name}")
-        
-        params = TourSearchParams(
+    variants = [
+        TourSearchParams(
             country=Country.TURKEY,
             departure=departure_enum,
             date_from="01.06.2026",
@@ -510,18 +706,29 @@ async def test_departure_cities():
             adults=2,
             price_max=100000
         )
+        for departure_enum, _ in cities_to_test
+    ]
+    
+    pool = BrowserPool(size=len(variants), headless=False, slow_mo=WaitConfig.from_env().slow_mo,
+                       resource_policy=ResourcePolicy.from_env())
+    api = FixedTourvisorAPI(pool=pool)
+    try:
+        print(f"\n🔍 Тестирование городов вылета: {', '.join(name for _, name in cities_to_test)}")
+        results = await run_batch(api, variants, concurrency=len(variants))
+    finally:
+        await api.close()
+        await pool.close()
+    
+    for (_, departure_name), result in zip(cities_to_test, results):
+        tours = result.tours
+        api.print_tours(tours, f"ТУРЫ ИЗ {departure_name.upper()}")
         
-        async with FixedTourvisorAPI() as api:
-            tours = await api.search_tours(params)
-            api.print_tours(tours, f"ТУРЫ ИЗ {departure_name.upper()}")
-            
-            if tours:
-                min_price = min([int(re.sub(r'\D', '', t.price)) for t in tours if t.price != 'N/A'])
-                print(f"📊 {departure_name}: {len(tours)} туров, от {min_price:,} руб")
-            else:
-                print(f"❌ {departure_name}: туров не найдено")
-        
-        await asyncio.sleep(5)  # Пауза между тестами
+        if tours:
+            prices = [t.price for t in tours if t.price is not None]
+            min_price = f"от {min(prices):,} руб" if prices else "без цен"
+            print(f"📊 {departure_name}: {len(tours)} туров, {min_price} ({result.elapsed:.1f} с)")
+        else:
+            print(f"❌ {departure_name}: туров не найдено")
 
 if __name__ == "__main__":
     asyncio.run(test_departure_cities())
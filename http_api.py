@@ -0,0 +1,512 @@
+"""
+Общая логика HTTP API TourVisor
+Используется Flask-сервером (http_server.py) и асинхронным сервером (async_http_server.py).
+Пул браузеров, бэкенд, кэши и задания живут в одном долгоживущем цикле событий.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from datetime import datetime
+
+from fixed_departure_api import TourSearchParams, Country, Departure
+from browser_pool import get_browser_pool
+from search_backends import create_search_backend
+from tour_cache import get_result_cache
+from result_store import get_result_store
+from singleflight import get_single_flight
+from jobs import JobQueueFull, create_job_manager
+from batch_search import BatchError, batch_concurrency, batch_json, expand_batch, run_batch
+from tour_format import tour_json
+from tour_filters import filter_tours, filtered_callback, order_tours, refine_tours, validate_view
+from tour_stats import tour_stats, validate_group_by
+from price_calendar import price_calendar, validate_calendar
+from prefetch import create_prefetcher
+from route_watch import WatchLimitReached, create_route_watcher
+from metrics import PROMETHEUS_CONTENT_TYPE, get_metrics
+
+logger = logging.getLogger(__name__)
+
+VERSION = "1.0.0"
+
+# (метод, путь, описание) - для /stats, 404 и стартового сообщения
+ENDPOINTS = [
+    ("GET", "/health", "Проверка здоровья"),
+    ("POST", "/search_tours", "Основной поиск"),
+    ("POST", "/search_tours/stream", "Поиск с выдачей туров по мере появления (NDJSON/SSE)"),
+    ("POST", "/quick_search", "Поиск по тексту"),
+    ("POST", "/batch_search", "Пакетный поиск по нескольким городам/странам"),
+    ("POST", "/tour_stats", "Статистика цен по курортам/операторам/питанию"),
+    ("POST", "/price_calendar", "Минимальная цена на каждую дату вылета"),
+    ("POST", "/watch_route", "Наблюдение за маршрутом: сервер сам перепроверяет поиск"),
+    ("GET", "/watch_route/<id>", "Изменения цен с прошлого опроса (?since=<версия>)"),
+    ("DELETE", "/watch_route/<id>", "Снять наблюдение"),
+    ("GET", "/jobs/<id>", "Статус фонового поиска"),
+    ("GET", "/get_countries", "Список стран"),
+    ("GET", "/get_departures", "Список городов"),
+    ("GET", "/stats", "Статистика"),
+    ("GET", "/metrics", "Метрики в формате Prometheus"),
+]
+
+
+class RequestError(Exception):
+    """Ошибка в запросе клиента"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def wants_job(data, args):
+    """Режим задания: {"async": true} в теле или ?mode=job"""
+    return bool(data.get("async")) or args.get("mode") == "job"
+
+
+def wants_sse(args, accept):
+    """Формат потока: SSE по ?format=sse или Accept: text/event-stream, иначе NDJSON"""
+    return args.get("format") == "sse" or "text/event-stream" in (accept or "")
+
+
+def stream_content_type(sse):
+    return "text/event-stream; charset=utf-8" if sse else "application/x-ndjson; charset=utf-8"
+
+
+def format_event(event, sse):
+    """Событие потока -> строка NDJSON или кадр SSE"""
+    data = json.dumps(event, ensure_ascii=False)
+    if sse:
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+class HTTPWrapper:
+    def __init__(self, loop=None):
+        # Бэкенд выбирается через TOURVISOR_BACKEND (playwright | direct)
+        self.backend_kind = os.environ.get("TOURVISOR_BACKEND", "playwright")
+        # Кэш общий для всех потоков Flask и того же вида, что у MCP сервера
+        self.cache = get_result_cache()
+        # SQLite переживает перезапуски и общий для всех воркеров gunicorn
+        self.store = get_result_store()
+        self.pool = get_browser_pool(headless=True)
+        self.backend = create_search_backend(self.backend_kind, pool=self.pool, cache=self.cache,
+                                             store=self.store, concurrency=batch_concurrency(self.pool))
+        # Фоновые задания выполняются в том же цикле, что и обычные поиски
+        self.jobs = create_job_manager(loop)
+        # Популярные поиски обновляются в фоне до истечения кэша (TOURVISOR_PREFETCH=0 отключает)
+        self.prefetcher = create_prefetcher(self.backend, self.pool)
+        # Наблюдаемые маршруты перепроверяются в том же цикле (TOURVISOR_WATCH=0 отключает)
+        self.watcher = create_route_watcher(self.backend, batch_concurrency(self.pool))
+
+    def start_background(self):
+        """Запустить фоновое обновление и перепроверку маршрутов в цикле обертки (один раз на процесс - зовет сервер)"""
+        if self.prefetcher is not None:
+            self.prefetcher.start(self.loop)
+        if self.watcher is not None:
+            self.watcher.start(self.loop)
+
+    @property
+    def loop(self):
+        return self.jobs.loop
+
+    def run(self, coro):
+        """Выполнить корутину в общем цикле событий и дождаться результата (для потоков Flask)"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        if self.watcher is not None:
+            self.watcher.close()
+        await self.backend.close()
+        await self.pool.close()
+
+    def params_from_json(self, data):
+        """JSON запроса /search_tours -> TourSearchParams"""
+        if not data:
+            raise RequestError("No JSON data provided")
+
+        # Валидация обязательных полей
+        if 'country' not in data:
+            raise RequestError("Country is required")
+
+        if 'departure' not in data:
+            raise RequestError("Departure city is required")
+
+        # Конвертируем аргументы
+        country = data.get("country")
+        departure = data.get("departure")
+
+        # Ищем в Enum
+        country_enum = None
+        for c in Country:
+            if c.value == country:
+                country_enum = c
+                break
+
+        departure_enum = None
+        for d in Departure:
+            if d.value == departure:
+                departure_enum = d
+                break
+
+        if not country_enum:
+            raise RequestError(f"Unknown country: {country}")
+
+        if not departure_enum:
+            raise RequestError(f"Unknown departure city: {departure}")
+
+        try:
+            validate_view(data.get("sort_by"), data.get("limit"))
+        except ValueError as e:
+            raise RequestError(str(e))
+
+        # Создаем параметры
+        return TourSearchParams(
+            country=country_enum,
+            departure=departure_enum,
+            date_from=data.get("date_from", "01.12.2025"),
+            date_to=data.get("date_to", "31.12.2025"),
+            nights_from=data.get("nights_from", 7),
+            nights_to=data.get("nights_to", 7),
+            adults=data.get("adults", 2),
+            children=data.get("children", 0),
+            price_min=data.get("price_min"),
+            price_max=data.get("price_max"),
+            stars=data.get("stars"),
+            meal=data.get("meal", "любой"),
+            resort=data.get("resort", "любой"),
+            max_results=data.get("max_results"),
+            sort_by=data.get("sort_by"),
+            limit=data.get("limit")
+        )
+
+    def batch_from_json(self, data):
+        """JSON запроса /batch_search -> список TourSearchParams"""
+        try:
+            variants = expand_batch(data)
+        except BatchError as e:
+            raise RequestError(str(e))
+        params = []
+        for index, variant in enumerate(variants):
+            try:
+                params.append(self.params_from_json(variant))
+            except RequestError as e:
+                raise RequestError(f"Variant {index}: {e}", e.status)
+        return params
+
+    def stats_from_json(self, data):
+        """JSON запроса /tour_stats -> (TourSearchParams, поле группировки)"""
+        params = self.params_from_json(data)
+        try:
+            group_by = validate_group_by(data.get("group_by"))
+        except ValueError as e:
+            raise RequestError(str(e))
+        return params, group_by
+
+    def calendar_from_json(self, data):
+        """JSON запроса /price_calendar -> TourSearchParams (диапазон дат проверяется)"""
+        params = self.params_from_json(data)
+        try:
+            validate_calendar(params)
+        except ValueError as e:
+            raise RequestError(str(e))
+        return params
+
+    def watch_from_json(self, data):
+        """JSON запроса /watch_route -> (TourSearchParams, интервал проверки в секундах)"""
+        if self.watcher is None:
+            raise RequestError("Route watching is disabled", 503)
+        params = self.params_from_json(data)
+        try:
+            interval = self.watcher.validate_interval(data.get("interval"))
+        except ValueError as e:
+            raise RequestError(str(e))
+        return params, interval
+
+    def since_from_args(self, args):
+        """?since=<версия> -> int или None (с прошлого опроса)"""
+        since = args.get("since")
+        if since is None:
+            return None
+        try:
+            return int(since)
+        except ValueError:
+            raise RequestError("since must be an integer version")
+
+    def query_from_json(self, data):
+        """JSON запроса /quick_search -> (текст, TourSearchParams)"""
+        if not data or 'query' not in data:
+            raise RequestError("Query is required")
+
+        query = data['query']
+        return query, self.parse_query(query)
+
+    async def search_tours_async(self, params, on_tour=None):
+        """Асинхронная обертка для поиска туров; on_tour(tour) вызывается для каждого тура, прошедшего фильтры"""
+        try:
+            matched = filter_tours(await self.backend.search_tours(params, filtered_callback(on_tour, params)), params)
+            tours = order_tours(matched, params)
+
+            # Конвертируем туры в JSON
+            tours_json = [tour_json(tour) for tour in tours]
+
+            return {"success": True, "tours": tours_json, "count": len(tours_json), "total": len(matched)}
+
+        except Exception as e:
+            logger.error(f"Error in search_tours_async: {str(e)}")
+            logger.error(traceback.format_exc())
+            return {"success": False, "error": str(e)}
+
+    async def stream_search(self, params, emit):
+        """
+        Поиск с событием на каждый тур и итоговым событием summary; emit(event) не должен блокировать
+        Туры уходят по мере появления, поэтому к потоку применяются только фильтры, но не sort_by и limit
+        """
+        started = time.monotonic()
+        streamed = 0
+
+        def on_tour(tour):
+            nonlocal streamed
+            streamed += 1
+            emit({"type": "tour", "tour": tour_json(tour)})
+
+        result = await self.search_tours_async(params, on_tour=on_tour)
+        summary = {
+            "type": "summary",
+            "success": result["success"],
+            "count": streamed,
+            "elapsed": round(time.monotonic() - started, 3)
+        }
+        if not result["success"]:
+            summary["error"] = result["error"]
+        emit(summary)
+
+    async def batch_search_async(self, variants):
+        """Все варианты одновременно на страницах пула"""
+        started = time.monotonic()
+        results = await run_batch(self.backend, variants, batch_concurrency(self.pool))
+        return batch_json(results, tour_json, time.monotonic() - started)
+
+    async def tour_stats_async(self, params, group_by):
+        """Поиск (повторный - из кэша) и сводка цен по группам вместо списка туров"""
+        try:
+            tours = await self.backend.search_tours(params)
+            return {"success": True, **tour_stats(tours, params, group_by)}
+
+        except Exception as e:
+            logger.error(f"Error in tour_stats_async: {str(e)}")
+            logger.error(traceback.format_exc())
+            return {"success": False, "error": str(e)}
+
+    async def price_calendar_async(self, params):
+        """Календарь цен: окна из кэша - сразу, недостающие - параллельно"""
+        try:
+            result = await price_calendar(self.backend, params, batch_concurrency(self.pool), self.cache)
+            return {
+                "success": True,
+                "country": params.country.value,
+                "departure": params.departure.value,
+                **result
+            }
+
+        except Exception as e:
+            logger.error(f"Error in price_calendar_async: {str(e)}")
+            logger.error(traceback.format_exc())
+            return {"success": False, "error": str(e)}
+
+    async def watch_route_async(self, params, interval):
+        """Зарегистрировать наблюдение: (ответ с текущей выдачей, HTTP статус)"""
+        try:
+            watch, route = await self.watcher.watch(params, interval)
+        except WatchLimitReached as e:
+            return {"success": False, "error": str(e)}, 429
+        except Exception as e:
+            logger.error(f"Error in watch_route_async: {str(e)}")
+            return {"success": False, "error": str(e)}, 500
+
+        # Начальная выдача - с сортировкой и limit запроса, дальше только изменения
+        tours = refine_tours(list(route.snapshot.values()), params)
+        return {
+            "success": True,
+            "watch_id": watch.id,
+            "changes_url": f"/watch_route/{watch.id}",
+            **self.watcher.route_status(route),
+            "tours": [tour_json(tour) for tour in tours]
+        }, 201
+
+    async def watch_changes_async(self, watch_id, since=None):
+        changes = self.watcher.changes(watch_id, since) if self.watcher else None
+        if changes is None:
+            return {
+                "success": False,
+                "error": f"Unknown or expired watch: {watch_id}"
+            }, 404
+        return dict(changes, success=True), 200
+
+    async def unwatch_async(self, watch_id):
+        if self.watcher is None or not self.watcher.unwatch(watch_id):
+            return {
+                "success": False,
+                "error": f"Unknown or expired watch: {watch_id}"
+            }, 404
+        return {"success": True, "watch_id": watch_id}, 200
+
+    async def quick_search_async(self, query, params, on_tour=None):
+        """Поиск по текстовому запросу с информацией о разборе"""
+        result = await self.search_tours_async(params, on_tour)
+
+        # Добавляем информацию о парсинге
+        if result["success"]:
+            result["query"] = query
+            result["parsed_params"] = {
+                "country": params.country.value if isinstance(params.country, Country) else params.country,
+                "departure": params.departure.value if isinstance(params.departure, Departure) else params.departure,
+                "nights_from": params.nights_from,
+                "adults": params.adults,
+                "stars": params.stars,
+                "price_max": params.price_max
+            }
+        return result
+
+    def parse_query(self, query):
+        """Парсинг текстового запроса"""
+        # Значения по умолчанию
+        country = Country.TURKEY
+        departure = Departure.MOSCOW
+        nights = 7
+        adults = 2
+        stars = None
+        price_max = None
+
+        query_lower = query.lower()
+
+        # Ищем страну
+        for c in Country:
+            if c.value.lower() in query_lower:
+                country = c
+                break
+
+        # Ищем город вылета
+        for d in Departure:
+            if d.value.lower() in query_lower:
+                departure = d
+                break
+
+        # Ищем количество ночей
+        nights_match = re.search(r'(\d+)\s*(?:ночей|ночи|ночь)', query_lower)
+        if nights_match:
+            nights = int(nights_match.group(1))
+
+        # Ищем количество человек
+        people_match = re.search(r'(\d+)\s*(?:человек|человека|чел)', query_lower)
+        if people_match:
+            adults = int(people_match.group(1))
+
+        # Ищем звезды
+        stars_match = re.search(r'(\d+)\s*(?:звезд|звезды|звезда)', query_lower)
+        if stars_match:
+            stars = int(stars_match.group(1))
+
+        # Ищем цену
+        price_match = re.search(r'до\s*(\d+)\s*(?:руб|рублей)', query_lower)
+        if price_match:
+            price_max = int(price_match.group(1))
+
+        return TourSearchParams(
+            country=country,
+            departure=departure,
+            nights_from=nights,
+            nights_to=nights,
+            adults=adults,
+            stars=stars,
+            price_max=price_max
+        )
+
+    @staticmethod
+    def job_reporter(job):
+        """on_tour для фонового задания: найденные туры сразу видны в partial"""
+        return lambda tour: job.report([tour_json(tour)])
+
+    def submit_job(self, kind, factory):
+        """Поставить поиск в фон: (ответ, HTTP статус)"""
+        try:
+            job = self.jobs.submit(kind, factory)
+        except JobQueueFull as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }, 503
+        return {
+            "success": True,
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/jobs/{job.id}"
+        }, 202
+
+    def job_status(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return {
+                "success": False,
+                "error": f"Unknown or expired job: {job_id}"
+            }, 404
+        return dict(job.to_dict(), success=True), 200
+
+    def health(self):
+        return {
+            "status": "healthy",
+            "timestamp": datetime.now().isoformat(),
+            "version": VERSION
+        }
+
+    def countries(self):
+        countries = [{"name": country.value, "code": country.name} for country in Country]
+        return {
+            "success": True,
+            "countries": countries,
+            "count": len(countries)
+        }
+
+    def departures(self):
+        departures = [{"name": departure.value, "code": departure.name} for departure in Departure]
+        return {
+            "success": True,
+            "departures": departures,
+            "count": len(departures)
+        }
+
+    def stats(self):
+        return {
+            "success": True,
+            "server": "TourVisor HTTP API",
+            "version": VERSION,
+            "endpoints": [f"{method} {path} - {description}" for method, path, description in ENDPOINTS],
+            "supported_countries": len(Country),
+            "supported_departures": len(Departure),
+            "browser_pool": self.pool.stats(),
+            "cache": self.cache.stats(),
+            "store": self.store.stats() if self.store else None,
+            "single_flight": get_single_flight().stats(),
+            "planner": self.backend.stats(),
+            "prefetch": self.prefetcher.stats() if self.prefetcher else None,
+            "watch": self.watcher.stats() if self.watcher else None,
+            "jobs": self.jobs.stats(),
+            # Гистограммы фаз поиска и счетчики: число, среднее и перцентили по корзинам
+            "metrics": get_metrics().summary(),
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def metrics(self):
+        """Тело и Content-Type ответа /metrics"""
+        return get_metrics().render(), PROMETHEUS_CONTENT_TYPE
+
+    def not_found(self):
+        return {
+            "success": False,
+            "error": "Endpoint not found",
+            "available_endpoints": [f"{method} {path}" for method, path, _ in ENDPOINTS]
+        }
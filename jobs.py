@@ -0,0 +1,147 @@
+"""
+Фоновые задания поиска для HTTP API
+POST сразу возвращает id задания, работа идет в долгоживущем цикле событий сервера,
+статус и результат забираются через GET /jobs/<id>
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Слишком много незавершенных заданий"""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str = "queued"  # queued | running | done | failed
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Туры, найденные до завершения задания
+    partial: List[Dict[str, Any]] = field(default_factory=list)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    def report(self, tours_json: List[Dict[str, Any]]):
+        """Промежуточные результаты из выполняющегося поиска"""
+        self.partial.extend(tours_json)
+
+    def to_dict(self) -> Dict[str, Any]:
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "partial_count": len(self.partial),
+            "partial": self.partial if self.status in ("queued", "running") else [],
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = 2, retention: float = 600.0, max_pending: int = 100,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.max_workers = max_workers
+        # Сколько секунд хранить завершенные задания
+        self.retention = retention
+        self.max_pending = max_pending
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        # Цикл событий сервера; без него задания получат собственный поток с циклом
+        self._loop: Optional[asyncio.AbstractEventLoop] = loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Долгоживущий цикл событий (без цикла сервера - фоновый поток, создается при первом обращении)"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="tour-jobs", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, kind: str, factory: Callable[[Job], Awaitable[Dict[str, Any]]]) -> Job:
+        """Поставить задание в очередь; factory(job) возвращает итоговый JSON"""
+        self.purge_expired()
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status in ("queued", "running"))
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"Too many pending jobs: {pending}")
+            job = Job(id=uuid.uuid4().hex, kind=kind)
+            self._jobs[job.id] = job
+        asyncio.run_coroutine_threadsafe(self._run(job, factory), self.loop)
+        return job
+
+    async def _run(self, job: Job, factory):
+        if self._semaphore is None:
+            # Ограничение одновременных заданий; остальные ждут в статусе queued
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        async with self._semaphore:
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                result = await factory(job)
+                job.result = result
+                if result.get("success") is False:
+                    job.status = "failed"
+                    job.error = result.get("error")
+                else:
+                    job.status = "done"
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self.purge_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def purge_expired(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "max_workers": self.max_workers,
+            "retention": self.retention,
+            "jobs": counts
+        }
+
+
+def create_job_manager(loop: Optional[asyncio.AbstractEventLoop] = None) -> JobManager:
+    return JobManager(
+        max_workers=int(os.environ.get("TOURVISOR_JOB_WORKERS", "2")),
+        retention=float(os.environ.get("TOURVISOR_JOB_RETENTION", "600")),
+        max_pending=int(os.environ.get("TOURVISOR_JOB_QUEUE", "100")),
+        loop=loop
+    )
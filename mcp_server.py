@@ -6,9 +6,12 @@ MCP Server для TourVisor API
 
 import asyncio
 import json
+import logging
+import os
 import sys
+import time
 from typing import Any, Dict, List, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
 
 # MCP импорты
@@ -21,94 +24,208 @@ from mcp.types import (
     ListToolsRequest,
     ListToolsResult,
     Tool,
-    TextContent
+    TextContent,
+    ProgressNotification,
+    ProgressNotificationParams,
+    ServerNotification
 )
 
 # Наш API
-from fixed_departure_api import FixedTourvisorAPI, TourSearchParams, Country, Departure
+from fixed_departure_api import Tour, TourSearchParams, Country, Departure
+from browser_pool import get_browser_pool
+from search_backends import create_search_backend
+from tour_cache import get_result_cache
+from result_store import get_result_store
+from search_progress import STAGE_MESSAGES, track_stages
+from batch_search import BatchError, batch_concurrency, batch_json, expand_batch, run_batch
+from tour_format import tour_json
+from tour_filters import SORT_FIELDS, filter_tours, filtered_callback, order_tours, refine_tours, validate_view
+from tour_stats import GROUP_FIELDS, DEFAULT_GROUP_BY, tour_stats, validate_group_by
+from price_calendar import price_calendar, validate_calendar
+from route_watch import create_route_watcher
+
+logger = logging.getLogger(__name__)
+
+
+class ToolProgress:
+    """Уведомления notifications/progress для одного вызова инструмента"""
+
+    def __init__(self, session, progress_token, found_interval: float = 1.0):
+        self.session = session
+        # Без progressToken клиент не просил уведомлений - только копим туры
+        self.progress_token = progress_token
+        # Не чаще одного уведомления "найдено N туров" в found_interval секунд
+        self.found_interval = found_interval
+        self.tours: List[Tour] = []
+        self.step = 0
+        self.closed = False
+        self._last_found_report = 0.0
+        self._sending = set()
+
+    def stage(self, stage: str):
+        self._send(STAGE_MESSAGES.get(stage, stage))
+
+    def tour(self, tour: Tour):
+        self.tours.append(tour)
+        now = time.monotonic()
+        if now - self._last_found_report >= self.found_interval:
+            self._last_found_report = now
+            self._send(f"Найдено туров: {len(self.tours)}")
+
+    def finished(self, count: int):
+        self._send(f"Поиск завершен, найдено туров: {count}")
+
+    def variant_done(self, done: int, total: int, label: str):
+        self._send(f"Готов вариант {label} ({done} из {total})", progress=done, total=total)
+
+    def close(self):
+        """После ответа на вызов уведомления с этим токеном больше не отправляются"""
+        self.closed = True
+
+    def _send(self, message: str, progress: Optional[float] = None, total: Optional[float] = None):
+        if self.closed or self.progress_token is None:
+            return
+        self.step += 1
+        # message - поле новых версий протокола; старые клиенты его игнорируют
+        notification = ServerNotification(ProgressNotification(
+            method="notifications/progress",
+            params=ProgressNotificationParams(progressToken=self.progress_token,
+                                              progress=self.step if progress is None else progress,
+                                              total=total, message=message)
+        ))
+        task = asyncio.ensure_future(self.session.send_notification(notification))
+        self._sending.add(task)
+        task.add_done_callback(self._sent)
+
+    def _sent(self, task: asyncio.Task):
+        self._sending.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"⚠️ Не удалось отправить уведомление о прогрессе: {task.exception()}")
+
 
 class TourMCPServer:
     def __init__(self):
         self.server = Server("tourvisor-api")
+        # Chromium запускается один раз на процесс, вызовы инструментов берут страницы из пула
+        self.pool = get_browser_pool()
+        # Бэкенд выбирается через TOURVISOR_BACKEND (playwright | direct), повторы отдаются из кэша
+        self.tour_api = create_search_backend(pool=self.pool, cache=get_result_cache(),
+                                              store=get_result_store(), concurrency=batch_concurrency(self.pool))
+        # Через сколько секунд отдавать частичный результат (0 - ждать до конца поиска)
+        self.deadline = float(os.environ.get("TOURVISOR_MCP_DEADLINE", "50"))
+        # Поиски, пережившие дедлайн вызова: досчитываются в кэш для повторного запроса
+        self.background_searches = set()
+        # Наблюдаемые маршруты живут, пока жив процесс сервера (сессия клиента)
+        self.watcher = create_route_watcher(self.tour_api, batch_concurrency(self.pool))
         self.setup_handlers()
     
     def setup_handlers(self):
         @self.server.list_tools()
         async def list_tools() -> List[Tool]:
+            # Параметры одного поиска (общие для search_tours и вариантов batch_search)
+            search_properties = {
+                "country": {
+                    "type": "string",
+                    "description": "Страна назначения",
+                    "enum": ["Турция", "Египет", "ОАЭ", "Таиланд", "Кипр", "Греция", "Испания", "Италия", "Франция"]
+                },
+                "departure": {
+                    "type": "string", 
+                    "description": "Город вылета",
+                    "enum": ["Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург", "Казань", 
+                           "Нижний Новгород", "Челябинск", "Омск", "Самара", "Ростов-на-Дону",
+                           "Алматы", "Астана", "Минск", "Брест", "Гродно", "Витебск", "Могилев", "Гомель"]
+                },
+                "date_from": {
+                    "type": "string",
+                    "description": "Дата начала (ДД.ММ.ГГГГ)",
+                    "pattern": r"\d{2}\.\d{2}\.\d{4}"
+                },
+                "date_to": {
+                    "type": "string", 
+                    "description": "Дата окончания (ДД.ММ.ГГГГ)",
+                    "pattern": r"\d{2}\.\d{2}\.\d{4}"
+                },
+                "nights_from": {
+                    "type": "integer",
+                    "description": "Количество ночей от",
+                    "minimum": 1,
+                    "maximum": 30
+                },
+                "nights_to": {
+                    "type": "integer",
+                    "description": "Количество ночей до", 
+                    "minimum": 1,
+                    "maximum": 30
+                },
+                "adults": {
+                    "type": "integer",
+                    "description": "Количество взрослых",
+                    "minimum": 1,
+                    "maximum": 10
+                },
+                "children": {
+                    "type": "integer",
+                    "description": "Количество детей",
+                    "minimum": 0,
+                    "maximum": 10
+                },
+                "price_min": {
+                    "type": "integer",
+                    "description": "Минимальная цена в рублях",
+                    "minimum": 0
+                },
+                "price_max": {
+                    "type": "integer",
+                    "description": "Максимальная цена в рублях",
+                    "minimum": 0
+                },
+                "stars": {
+                    "type": "integer",
+                    "description": "Звездность отеля (не ниже)",
+                    "minimum": 1,
+                    "maximum": 5
+                },
+                "meal": {
+                    "type": "string",
+                    "description": "Тип питания",
+                    "enum": ["любой", "All Inclusive", "Ultra All Inclusive", "Full Board", "Half Board", "Bed & Breakfast"]
+                },
+                "resort": {
+                    "type": "string",
+                    "description": "Курорт (или 'любой')"
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": "Догружать выдачу (\"показать еще\"), пока не наберется столько туров",
+                    "minimum": 1,
+                    "maximum": 1000
+                },
+                "sort_by": {
+                    "type": "string",
+                    "description": "Сортировка результата: price - сначала дешевые, rating и stars - сначала лучшие",
+                    "enum": list(SORT_FIELDS)
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Вернуть не больше стольких туров (после фильтров и сортировки)",
+                    "minimum": 1,
+                    "maximum": 1000
+                },
+                "deadline": {
+                    "type": "number",
+                    "description": "Через сколько секунд вернуть уже найденные туры, не дожидаясь конца поиска",
+                    "minimum": 1
+                }
+            }
+            
             return [
                 Tool(
                     name="search_tours",
                     description="Поиск туров через TourVisor API",
                     inputSchema={
                         "type": "object",
-                        "properties": {
-                            "country": {
-                                "type": "string",
-                                "description": "Страна назначения",
-                                "enum": ["Турция", "Египет", "ОАЭ", "Таиланд", "Кипр", "Греция", "Испания", "Италия", "Франция"]
-                            },
-                            "departure": {
-                                "type": "string", 
-                                "description": "Город вылета",
-                                "enum": ["Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург", "Казань", 
-                                       "Нижний Новгород", "Челябинск", "Омск", "Самара", "Ростов-на-Дону",
-                                       "Алматы", "Астана", "Минск", "Брест", "Гродно", "Витебск", "Могилев", "Гомель"]
-                            },
-                            "date_from": {
-                                "type": "string",
-                                "description": "Дата начала (ДД.ММ.ГГГГ)",
-                                "pattern": r"\d{2}\.\d{2}\.\d{4}"
-                            },
-                            "date_to": {
-                                "type": "string", 
-                                "description": "Дата окончания (ДД.ММ.ГГГГ)",
-                                "pattern": r"\d{2}\.\d{2}\.\d{4}"
-                            },
-                            "nights_from": {
-                                "type": "integer",
-                                "description": "Количество ночей от",
-                                "minimum": 1,
-                                "maximum": 30
-                            },
-                            "nights_to": {
-                                "type": "integer",
-                                "description": "Количество ночей до", 
-                                "minimum": 1,
-                                "maximum": 30
-                            },
-                            "adults": {
-                                "type": "integer",
-                                "description": "Количество взрослых",
-                                "minimum": 1,
-                                "maximum": 10
-                            },
-                            "children": {
-                                "type": "integer",
-                                "description": "Количество детей",
-                                "minimum": 0,
-                                "maximum": 10
-                            },
-                            "price_max": {
-                                "type": "integer",
-                                "description": "Максимальная цена в рублях",
-                                "minimum": 0
-                            },
-                            "stars": {
-                                "type": "integer",
-                                "description": "Количество звезд отеля",
-                                "minimum": 1,
-                                "maximum": 5
-                            },
-                            "meal": {
-                                "type": "string",
-                                "description": "Тип питания",
-                                "enum": ["любой", "All Inclusive", "Ultra All Inclusive", "Full Board", "Half Board", "Bed & Breakfast"]
-                            },
-                            "resort": {
-                                "type": "string",
-                                "description": "Курорт (или 'любой')"
-                            }
-                        },
+                        "properties": search_properties,
                         "required": ["country", "departure"]
                     }
                 ),
@@ -137,10 +254,121 @@ class TourMCPServer:
                             "query": {
                                 "type": "string",
                                 "description": "Текстовый запрос (например: 'Дубай из Москвы на 5 ночей 5 звезд')"
+                            },
+                            "deadline": {
+                                "type": "number",
+                                "description": "Через сколько секунд вернуть уже найденные туры, не дожидаясь конца поиска",
+                                "minimum": 1
                             }
                         },
                         "required": ["query"]
                     }
+                ),
+                Tool(
+                    name="batch_search",
+                    description="Пакетный поиск: одна поездка из нескольких городов вылета и/или в несколько стран одновременно",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            **{key: value for key, value in search_properties.items()
+                               if key not in ("country", "departure", "deadline")},
+                            "countries": {
+                                "type": "array",
+                                "description": "Страны (все сочетания с departures)",
+                                "items": search_properties["country"]
+                            },
+                            "departures": {
+                                "type": "array",
+                                "description": "Города вылета (все сочетания с countries)",
+                                "items": search_properties["departure"]
+                            },
+                            "variants": {
+                                "type": "array",
+                                "description": "Явный список вариантов (вместо countries/departures); общие поля можно не повторять",
+                                "items": {
+                                    "type": "object",
+                                    "properties": search_properties
+                                }
+                            }
+                        }
+                    }
+                ),
+                Tool(
+                    name="tour_stats",
+                    description="Сводка цен по курортам, операторам или питанию: число туров, мин./медиана/90-я перцентиль "
+                                "цены и самый дешевый отель в каждой группе (вместо списка туров)",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            **{key: value for key, value in search_properties.items()
+                               if key not in ("sort_by", "limit")},
+                            "group_by": {
+                                "type": "string",
+                                "description": "Поле группировки",
+                                "enum": list(GROUP_FIELDS),
+                                "default": DEFAULT_GROUP_BY
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": "Сколько групп вернуть (от самой дешевой медианы)",
+                                "minimum": 1,
+                                "maximum": 1000
+                            }
+                        },
+                        "required": ["country", "departure"]
+                    }
+                ),
+                Tool(
+                    name="price_calendar",
+                    description="Календарь цен: минимальная цена и отель на каждую дату вылета в диапазоне "
+                                "(\"в какой день дешевле всего лететь\")",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {key: value for key, value in search_properties.items()
+                                       if key not in ("sort_by", "limit", "deadline")},
+                        "required": ["country", "departure", "date_from", "date_to"]
+                    }
+                ),
+                Tool(
+                    name="watch_route",
+                    description="Следить за ценами поиска: сервер сам перепроверяет его раз в interval секунд. "
+                                "Возвращает watch_id и текущую выдачу, изменения потом забираются через watch_changes",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            **{key: value for key, value in search_properties.items() if key != "deadline"},
+                            "interval": {
+                                "type": "number",
+                                "description": "Как часто перепроверять поиск, секунд",
+                                "minimum": self.watcher.min_interval if self.watcher else 0
+                            }
+                        },
+                        "required": ["country", "departure"]
+                    }
+                ),
+                Tool(
+                    name="watch_changes",
+                    description="Изменения наблюдаемого поиска с прошлого вызова: новые туры, исчезнувшие "
+                                "и изменения цены (вместо повторного полного поиска)",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "watch_id": {
+                                "type": "string",
+                                "description": "Идентификатор из watch_route"
+                            },
+                            "since": {
+                                "type": "integer",
+                                "description": "Версия, с которой показать изменения (по умолчанию - с прошлого вызова)",
+                                "minimum": 0
+                            },
+                            "stop": {
+                                "type": "boolean",
+                                "description": "Снять наблюдение после ответа"
+                            }
+                        },
+                        "required": ["watch_id"]
+                    }
                 )
             ]
         
@@ -155,6 +383,16 @@ class TourMCPServer:
                     return await self.get_departures(arguments)
                 elif name == "quick_search":
                     return await self.quick_search(arguments)
+                elif name == "batch_search":
+                    return await self.batch_search(arguments)
+                elif name == "tour_stats":
+                    return await self.tour_stats(arguments)
+                elif name == "price_calendar":
+                    return await self.price_calendar(arguments)
+                elif name == "watch_route":
+                    return await self.watch_route(arguments)
+                elif name == "watch_changes":
+                    return await self.watch_changes(arguments)
                 else:
                     return CallToolResult(
                         content=[TextContent(type="text", text=f"Неизвестный инструмент: {name}")]
@@ -164,99 +402,280 @@ class TourMCPServer:
                     content=[TextContent(type="text", text=f"Ошибка: {str(e)}")]
                 )
     
+    async def run_search(self, params: TourSearchParams, deadline: Optional[float] = None):
+        """
+        Поиск с уведомлениями о прогрессе: (туры после фильтров, sort_by и limit; сколько найдено туров,
+        прошедших фильтры, до limit; завершен ли поиск к дедлайну)
+        """
+        ctx = self.server.request_context
+        progress = ToolProgress(ctx.session, ctx.meta.progressToken if ctx.meta else None)
+        deadline = self.deadline if deadline is None else deadline
+        
+        # Задача наследует подписку на стадии из контекста
+        with track_stages(progress.stage):
+            on_tour = filtered_callback(progress.tour, params)
+            search = asyncio.ensure_future(self.tour_api.search_tours(params, on_tour))
+        try:
+            done, _ = await asyncio.wait({search}, timeout=deadline or None)
+            if search in done:
+                matched = filter_tours(search.result(), params)
+                tours = order_tours(matched, params)
+                progress.finished(len(tours))
+                # total в обоих исходах считается одинаково - по турам, прошедшим фильтры
+                return tours, len(matched), True
+        finally:
+            progress.close()
+        
+        # Поиск продолжается и попадет в кэш: повторный вызов заберет готовый результат
+        # или присоединится к этому же поиску, а не запустит второй браузер
+        self.background_searches.add(search)
+        search.add_done_callback(self._background_done)
+        # До дедлайна известны только туры, уже прошедшие фильтры
+        return order_tours(list(progress.tours), params), len(progress.tours), False
+    
+    def _background_done(self, task: asyncio.Task):
+        self.background_searches.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"⚠️ Поиск после дедлайна завершился ошибкой: {task.exception()}")
+    
+    def completion_fields(self, complete: bool) -> Dict[str, Any]:
+        if complete:
+            return {"complete": True}
+        return {
+            "complete": False,
+            "note": "Поиск не уложился в дедлайн, показаны найденные к этому моменту туры. "
+                    "Поиск продолжается - повторите запрос позже, чтобы получить полный результат."
+        }
+    
+    def params_from_arguments(self, arguments: Dict[str, Any]) -> TourSearchParams:
+        """Аргументы инструмента -> TourSearchParams (ValueError для неизвестной страны или города)"""
+        # Конвертируем аргументы в параметры
+        country = arguments.get("country", "Турция")
+        departure = arguments.get("departure", "Москва")
+        
+        # Ищем в Enum
+        country_enum = None
+        for c in Country:
+            if c.value == country:
+                country_enum = c
+                break
+        
+        departure_enum = None
+        for d in Departure:
+            if d.value == departure:
+                departure_enum = d
+                break
+        
+        if not country_enum:
+            raise ValueError(f"Неизвестная страна: {country}")
+        
+        if not departure_enum:
+            raise ValueError(f"Неизвестный город вылета: {departure}")
+        
+        validate_view(arguments.get("sort_by"), arguments.get("limit"))
+        
+        return TourSearchParams(
+            country=country_enum,
+            departure=departure_enum,
+            date_from=arguments.get("date_from", "01.12.2025"),
+            date_to=arguments.get("date_to", "31.12.2025"),
+            nights_from=arguments.get("nights_from", 7),
+            nights_to=arguments.get("nights_to", 7),
+            adults=arguments.get("adults", 2),
+            children=arguments.get("children", 0),
+            price_min=arguments.get("price_min"),
+            price_max=arguments.get("price_max"),
+            stars=arguments.get("stars"),
+            meal=arguments.get("meal", "любой"),
+            resort=arguments.get("resort", "любой"),
+            max_results=arguments.get("max_results"),
+            sort_by=arguments.get("sort_by"),
+            limit=arguments.get("limit")
+        )
+    
     async def search_tours(self, arguments: Dict[str, Any]) -> CallToolResult:
         """Основной поиск туров"""
         try:
-            # Конвертируем аргументы в параметры
-            country = arguments.get("country", "Турция")
-            departure = arguments.get("departure", "Москва")
-            
-            # Ищем в Enum
-            country_enum = None
-            for c in Country:
-                if c.value == country:
-                    country_enum = c
-                    break
-            
-            departure_enum = None
-            for d in Departure:
-                if d.value == departure:
-                    departure_enum = d
-                    break
-            
-            if not country_enum:
+            try:
+                params = self.params_from_arguments(arguments)
+            except ValueError as e:
                 return CallToolResult(
-                    content=[TextContent(type="text", text=f"Неизвестная страна: {country}")]
+                    content=[TextContent(type="text", text=str(e))]
                 )
+            country = params.country.value
+            departure = params.departure.value
             
-            if not departure_enum:
-                return CallToolResult(
-                    content=[TextContent(type="text", text=f"Неизвестный город вылета: {departure}")]
-                )
+            tours, total, complete = await self.run_search(params, arguments.get("deadline"))
             
-            params = TourSearchParams(
-                country=country_enum,
-                departure=departure_enum,
-                date_from=arguments.get("date_from", "01.12.2025"),
-                date_to=arguments.get("date_to", "31.12.2025"),
-                nights_from=arguments.get("nights_from", 7),
-                nights_to=arguments.get("nights_to", 7),
-                adults=arguments.get("adults", 2),
-                children=arguments.get("children", 0),
-                price_max=arguments.get("price_max"),
-                stars=arguments.get("stars"),
-                meal=arguments.get("meal", "любой"),
-                resort=arguments.get("resort", "любой")
-            )
+            # Конвертируем туры в JSON
+            tours_json = [tour_json(tour) for tour in tours]
             
-            async with FixedTourvisorAPI() as api:
-                tours = await api.search_tours(params)
-                
-                # Конвертируем туры в JSON
-                tours_json = []
-                for tour in tours:
-                    tours_json.append({
-                        "hotel": tour.hotel,
-                        "price": tour.price,
-                        "stars": tour.stars,
-                        "resort": tour.resort,
-                        "rating": tour.rating,
-                        "nights": tour.nights,
-                        "date": tour.date,
-                        "meal": tour.meal,
-                        "operator": tour.operator,
-                        "country": tour.country
-                    })
-                
-                result = {
-                    "success": True,
-                    "count": len(tours),
-                    "tours": tours_json,
-                    "params": {
-                        "country": country,
-                        "departure": departure,
-                        "date_from": params.date_from,
-                        "date_to": params.date_to,
-                        "nights_from": params.nights_from,
-                        "nights_to": params.nights_to,
-                        "adults": params.adults,
-                        "children": params.children,
-                        "price_max": params.price_max,
-                        "stars": params.stars,
-                        "meal": params.meal,
-                        "resort": params.resort
-                    }
+            result = {
+                "success": True,
+                **self.completion_fields(complete),
+                "count": len(tours),
+                "total": total,
+                "tours": tours_json,
+                "params": {
+                    "country": country,
+                    "departure": departure,
+                    "date_from": params.date_from,
+                    "date_to": params.date_to,
+                    "nights_from": params.nights_from,
+                    "nights_to": params.nights_to,
+                    "adults": params.adults,
+                    "children": params.children,
+                    "price_min": params.price_min,
+                    "price_max": params.price_max,
+                    "stars": params.stars,
+                    "meal": params.meal,
+                    "resort": params.resort,
+                    "max_results": params.max_results,
+                    "sort_by": params.sort_by,
+                    "limit": params.limit
                 }
-                
-                return CallToolResult(
-                    content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-                )
-                
+            }
+            
+            return CallToolResult(
+                content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+            )
+            
         except Exception as e:
             return CallToolResult(
                 content=[TextContent(type="text", text=f"Ошибка поиска: {str(e)}")]
             )
     
+    async def batch_search(self, arguments: Dict[str, Any]) -> CallToolResult:
+        """Пакетный поиск: варианты выполняются одновременно на страницах пула"""
+        try:
+            variants = [self.params_from_arguments(variant) for variant in expand_batch(arguments)]
+        except (BatchError, ValueError) as e:
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Ошибка пакета: {str(e)}")]
+            )
+        
+        ctx = self.server.request_context
+        progress = ToolProgress(ctx.session, ctx.meta.progressToken if ctx.meta else None)
+        done = []
+        
+        def variant_done(result):
+            done.append(result)
+            progress.variant_done(len(done), len(variants),
+                                  f"{result.params.departure.value} → {result.params.country.value}")
+        
+        started = time.monotonic()
+        try:
+            results = await run_batch(self.tour_api, variants, batch_concurrency(self.pool), variant_done)
+        finally:
+            progress.close()
+        result = batch_json(results, tour_json, time.monotonic() - started)
+        
+        return CallToolResult(
+            content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+        )
+    
+    async def tour_stats(self, arguments: Dict[str, Any]) -> CallToolResult:
+        """Сводка цен по группам: несколько десятков чисел вместо сотен туров"""
+        try:
+            params = self.params_from_arguments(arguments)
+            group_by = validate_group_by(arguments.get("group_by"))
+        except ValueError as e:
+            return CallToolResult(
+                content=[TextContent(type="text", text=str(e))]
+            )
+        
+        # limit здесь - число групп, поэтому туры берутся все (только фильтры)
+        tours, _, complete = await self.run_search(replace(params, sort_by=None, limit=None),
+                                                   arguments.get("deadline"))
+        # total считает tour_stats - так же, как для HTTP
+        result = {
+            "success": True,
+            **self.completion_fields(complete),
+            **tour_stats(tours, params, group_by)
+        }
+        
+        return CallToolResult(
+            content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+        )
+    
+    async def price_calendar(self, arguments: Dict[str, Any]) -> CallToolResult:
+        """Календарь цен: окна дат из кэша отдаются сразу, недостающие ищутся параллельно"""
+        try:
+            params = self.params_from_arguments(arguments)
+            validate_calendar(params)
+        except ValueError as e:
+            return CallToolResult(
+                content=[TextContent(type="text", text=str(e))]
+            )
+        
+        ctx = self.server.request_context
+        progress = ToolProgress(ctx.session, ctx.meta.progressToken if ctx.meta else None)
+        try:
+            calendar = await price_calendar(
+                self.tour_api, params, batch_concurrency(self.pool), get_result_cache(),
+                on_window=lambda done, total, window: progress.variant_done(
+                    done, total, f"{window.date_from}-{window.date_to}"))
+        finally:
+            progress.close()
+        result = {
+            "success": True,
+            "country": params.country.value,
+            "departure": params.departure.value,
+            **calendar
+        }
+        
+        return CallToolResult(
+            content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+        )
+    
+    async def watch_route(self, arguments: Dict[str, Any]) -> CallToolResult:
+        """Зарегистрировать наблюдение за поиском и вернуть текущую выдачу"""
+        if self.watcher is None:
+            return CallToolResult(
+                content=[TextContent(type="text", text="Наблюдение за маршрутами отключено (TOURVISOR_WATCH=0)")]
+            )
+        try:
+            params = self.params_from_arguments(arguments)
+            interval = self.watcher.validate_interval(arguments.get("interval"))
+        except ValueError as e:
+            return CallToolResult(
+                content=[TextContent(type="text", text=str(e))]
+            )
+        
+        watch, route = await self.watcher.watch(params, interval)
+        tours = refine_tours(list(route.snapshot.values()), params)
+        result = {
+            "success": True,
+            "watch_id": watch.id,
+            **self.watcher.route_status(route),
+            # Тот же вид туров, что и в изменениях watch_changes
+            "tours": [tour_json(tour) for tour in tours]
+        }
+        
+        return CallToolResult(
+            content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+        )
+    
+    async def watch_changes(self, arguments: Dict[str, Any]) -> CallToolResult:
+        """Изменения наблюдаемого поиска с прошлого вызова (или с версии since)"""
+        watch_id = arguments.get("watch_id", "")
+        changes = self.watcher.changes(watch_id, arguments.get("since")) if self.watcher else None
+        if changes is None:
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Наблюдение не найдено или истекло: {watch_id}")]
+            )
+        if arguments.get("stop"):
+            self.watcher.unwatch(watch_id)
+        result = {
+            "success": True,
+            **changes,
+            "stopped": bool(arguments.get("stop"))
+        }
+        
+        return CallToolResult(
+            content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+        )
+    
     async def get_countries(self, arguments: Dict[str, Any]) -> CallToolResult:
         """Получить список стран"""
         countries = [country.value for country in Country]
@@ -286,41 +705,29 @@ class TourMCPServer:
         # Парсим текстовый запрос
         params = self.parse_query(query)
         
-        async with FixedTourvisorAPI() as api:
-            tours = await api.search_tours(params)
-            
-            tours_json = []
-            for tour in tours:
-                tours_json.append({
-                    "hotel": tour.hotel,
-                    "price": tour.price,
-                    "stars": tour.stars,
-                    "resort": tour.resort,
-                    "rating": tour.rating,
-                    "nights": tour.nights,
-                    "date": tour.date,
-                    "meal": tour.meal,
-                    "operator": tour.operator,
-                    "country": tour.country
-                })
-            
-            result = {
-                "success": True,
-                "query": query,
-                "parsed_params": {
-                    "country": params.country.value if isinstance(params.country, Country) else params.country,
-                    "departure": params.departure.value if isinstance(params.departure, Departure) else params.departure,
-                    "nights_from": params.nights_from,
-                    "adults": params.adults,
-                    "stars": params.stars
-                },
-                "count": len(tours),
-                "tours": tours_json
-            }
-            
-            return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-            )
+        tours, total, complete = await self.run_search(params, arguments.get("deadline"))
+        
+        tours_json = [tour_json(tour) for tour in tours]
+        
+        result = {
+            "success": True,
+            **self.completion_fields(complete),
+            "query": query,
+            "parsed_params": {
+                "country": params.country.value if isinstance(params.country, Country) else params.country,
+                "departure": params.departure.value if isinstance(params.departure, Departure) else params.departure,
+                "nights_from": params.nights_from,
+                "adults": params.adults,
+                "stars": params.stars
+            },
+            "count": len(tours),
+            "total": total,
+            "tours": tours_json
+        }
+        
+        return CallToolResult(
+            content=[TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+        )
     
     def parse_query(self, query: str) -> TourSearchParams:
         """Парсинг текстового запроса"""
@@ -372,21 +779,32 @@ class TourMCPServer:
 async def main():
     """Запуск MCP сервера"""
     server_instance = TourMCPServer()
+    if server_instance.watcher is not None:
+        server_instance.watcher.start(asyncio.get_running_loop())
     
-    # Используем stdio_server для MCP
-    async with stdio_server() as (read_stream, write_stream):
-        await server_instance.server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="tourvisor-api",
-                server_version="1.0.0",
-                capabilities=server_instance.server.get_capabilities(
-                    notification_options=None,
-                    experimental_capabilities=None,
+    try:
+        # Используем stdio_server для MCP
+        async with stdio_server() as (read_stream, write_stream):
+            await server_instance.server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="tourvisor-api",
+                    server_version="1.0.0",
+                    capabilities=server_instance.server.get_capabilities(
+                        notification_options=None,
+                        experimental_capabilities=None,
+                    ),
                 ),
-            ),
-        )
+            )
+    finally:
+        if server_instance.watcher is not None:
+            server_instance.watcher.close()
+        # Поиски после дедлайна дописывают кэш - даем им закончиться
+        if server_instance.background_searches:
+            await asyncio.gather(*server_instance.background_searches, return_exceptions=True)
+        await server_instance.tour_api.close()
+        await server_instance.pool.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
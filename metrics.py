@@ -0,0 +1,217 @@
+"""
+Метрики процесса: счетчики, гистограммы и значения в текстовом формате Prometheus (/metrics)
+и краткой JSON-сводкой (/stats). Без внешних зависимостей: метрики объявляются в модулях,
+которые их пишут, через общий реестр get_metrics().
+"""
+
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Границы корзин по умолчанию, секунд: от быстрых шагов формы до долгого ожидания выдачи
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        # Flask пишет метрики из своих потоков, поиски - из цикла событий
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name}: labels must be {', '.join(self.label_names) or 'empty'}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _label_json(self, key: LabelValues) -> str:
+        return ",".join(f"{name}={value}" for name, value in zip(self.label_names, key)) or "total"
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    """Монотонный счетчик (с метками - по счетчику на набор значений)"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        # Метрика без меток видна со значением 0 еще до первого события
+        self._values: Dict[LabelValues, float] = {} if self.label_names else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                                for key, value in values]
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            return {self._label_json(key): value for key, value in sorted(self._values.items())}
+
+
+class Gauge(Counter):
+    """Текущее значение (занятые страницы пула и т.п.)"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Распределение длительностей по корзинам; сводка - число, среднее и перцентили, оцененные по корзинам"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # метки -> [счетчики корзин (не накопительные), сумма, число]
+        self._values: Dict[LabelValues, list] = {}
+        if not self.label_names:
+            self._values[()] = [[0] * len(self.buckets), 0.0, 0]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _snapshot(self) -> List[Tuple[LabelValues, List[int], float, int]]:
+        with self._lock:
+            return [(key, list(counts), total, count) for key, (counts, total, count) in sorted(self._values.items())]
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, counts, total, count in self._snapshot():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def quantile(self, counts: List[int], count: int, q: float) -> Optional[float]:
+        """Перцентиль с линейной интерполяцией внутри корзины (как histogram_quantile в Prometheus)"""
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if math.isinf(bound):
+                    # Выше последней границы оценки нет - отдаем последнюю конечную границу
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            if not math.isinf(bound):
+                lower = bound
+        return lower
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            self._label_json(key): {
+                "count": count,
+                "mean": round(total / count, 4) if count else None,
+                "p50": round(self.quantile(counts, count, 0.5), 4) if count else None,
+                "p90": round(self.quantile(counts, count, 0.9), 4) if count else None,
+                "sum": round(total, 4)
+            }
+            for key, counts, total, count in self._snapshot()
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        # Повторное объявление (повторный импорт модуля) возвращает ту же метрику
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labels, buckets)
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus 0.0.4"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return {metric.name: metric.summary() for metric in metrics}
+
+
+# Content-Type ответа /metrics
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry: Optional[MetricsRegistry] = None
+
+
+def get_metrics() -> MetricsRegistry:
+    """Общий на процесс реестр метрик"""
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
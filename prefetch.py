@@ -0,0 +1,251 @@
+"""
+Упреждающее обновление популярных поисков
+Журнал запросов (QueryLog) считает нормализованные поиски с затуханием, планировщик (PrefetchScheduler)
+обновляет самые частые из них до того, как их запись в кэше истечет. Браузерное время ограничено бюджетом
+на скользящий час; в часы пик обновляется только то, что вот-вот истечет, вне пика - с запасом.
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fixed_departure_api import TourSearchParams
+from tour_cache import CachedSearchBackend, TourResultCache, cache_key
+from tour_model import parse_date
+
+logger = logging.getLogger(__name__)
+
+
+class QueryLog:
+    """
+    Частота поисков с экспоненциальным затуханием (период полураспада half_life секунд)
+    и профиль трафика по часам суток для определения пика
+    """
+
+    def __init__(self, half_life: float = 3600.0, max_entries: int = 1000):
+        self.half_life = half_life
+        self.max_entries = max_entries
+        # key -> [params, счет на момент last_seen, last_seen]
+        self._entries: Dict[str, list] = {}
+        # Счет запросов по часу суток (затухает с полураспадом в неделю, чтобы профиль следовал за трафиком)
+        self._hours = [0.0] * 24
+        self._hours_updated = time.time()
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def _decay(self, score: float, elapsed: float, half_life: float) -> float:
+        return score * math.pow(0.5, elapsed / half_life)
+
+    def record(self, params: TourSearchParams):
+        now = time.time()
+        key = cache_key(params)
+        with self._lock:
+            self.recorded += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = [params, 1.0, now]
+                if len(self._entries) > self.max_entries:
+                    self._prune(now)
+            else:
+                entry[1] = self._decay(entry[1], now - entry[2], self.half_life) + 1.0
+                entry[2] = now
+            self._age_hours(now)
+            self._hours[datetime.fromtimestamp(now).hour] += 1.0
+
+    def _prune(self, now: float):
+        # Вытесняется десятая часть самых редких поисков
+        scores = {key: self._decay(score, now - seen, self.half_life)
+                  for key, (_, score, seen) in self._entries.items()}
+        for key in heapq.nsmallest(max(1, self.max_entries // 10), scores, key=scores.__getitem__):
+            del self._entries[key]
+
+    def _age_hours(self, now: float):
+        elapsed = now - self._hours_updated
+        if elapsed >= 3600:
+            self._hours = [self._decay(count, elapsed, 7 * 24 * 3600.0) for count in self._hours]
+            self._hours_updated = now
+
+    def hot(self, limit: int, min_score: float = 0.0) -> List[Tuple[TourSearchParams, float]]:
+        """Самые частые поиски сейчас: [(params, счет)] по убыванию счета"""
+        now = time.time()
+        with self._lock:
+            scored = [(self._decay(score, now - seen, self.half_life), params)
+                      for params, score, seen in self._entries.values()]
+        top = heapq.nlargest(limit, (item for item in scored if item[0] >= min_score), key=lambda item: item[0])
+        return [(params, score) for score, params in top]
+
+    def hour_load(self, hour: Optional[int] = None) -> float:
+        """Трафик часа относительно среднего по часам (1.0 - средний час, 0.0 - трафика не было)"""
+        hour = datetime.now().hour if hour is None else hour
+        with self._lock:
+            total = sum(self._hours)
+            return self._hours[hour] * 24 / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tracked": len(self._entries),
+                "recorded": self.recorded,
+                "half_life": self.half_life
+            }
+
+
+class PrefetchScheduler:
+    """Фоновое обновление горячих поисков через кэширующий бэкенд, по одному поиску за раз"""
+
+    def __init__(self, backend: CachedSearchBackend, pool=None, interval: float = 60.0, top: int = 10,
+                 min_score: float = 3.0, budget: float = 600.0, lead_time: float = 120.0,
+                 offpeak_lead_time: float = 300.0, peak_load: float = 1.0):
+        self.backend = backend
+        self.cache: TourResultCache = backend.cache
+        self.log: QueryLog = backend.query_log
+        # Занятые страницы пула - признак того, что браузер нужен пользователям
+        self.pool = pool
+        self.interval = interval
+        self.top = top
+        self.min_score = min_score
+        # Сколько секунд браузерного времени можно потратить за скользящий час
+        self.budget = budget
+        # За сколько секунд до истечения записи обновлять ее в пик и вне пика
+        self.lead_time = lead_time
+        self.offpeak_lead_time = offpeak_lead_time
+        # Час считается пиковым, если трафик в нем не ниже peak_load от среднего часа
+        self.peak_load = peak_load
+        # (время окончания, потраченные секунды) обновлений за последний час
+        self._spent: "deque[Tuple[float, float]]" = deque()
+        # stats() читают потоки Flask
+        self._spent_lock = threading.Lock()
+        self._future = None
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped_budget = 0
+        self.skipped_busy = 0
+        self.last_run: Optional[float] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Запустить планировщик в цикле событий сервера (можно звать из любого потока)"""
+        if self._future is None:
+            self._future = asyncio.run_coroutine_threadsafe(self._run(), loop)
+
+    def close(self):
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.warning(f"⚠️ Упреждающее обновление не удалось: {e}")
+
+    def spent(self) -> float:
+        """Браузерное время обновлений за последний час, секунд"""
+        cutoff = time.monotonic() - 3600
+        with self._spent_lock:
+            while self._spent and self._spent[0][0] < cutoff:
+                self._spent.popleft()
+            return sum(seconds for _, seconds in self._spent)
+
+    def is_peak(self) -> bool:
+        return self.log.hour_load() >= self.peak_load
+
+    def _busy(self) -> bool:
+        return self.pool is not None and self.pool.in_use > 0
+
+    def due(self) -> List[TourSearchParams]:
+        """Горячие поиски, запись которых истекла или истечет раньше, чем через lead_time"""
+        lead_time = self.lead_time if self.is_peak() else self.offpeak_lead_time
+        today = date.today()
+        due = []
+        for params, _ in self.log.hot(self.top, self.min_score):
+            # Даты поиска уже прошли - обновлять нечего
+            date_to = parse_date(params.date_to)
+            if date_to is not None and date_to < today:
+                continue
+            ttl_left = self.cache.ttl_left(params)
+            if ttl_left is None or ttl_left <= lead_time:
+                due.append(params)
+        return due
+
+    async def tick(self) -> int:
+        """Один проход планировщика: сколько поисков обновлено"""
+        self.last_run = time.time()
+        refreshed = 0
+        for params in self.due():
+            if self.spent() >= self.budget:
+                self.skipped_budget += 1
+                break
+            # Пользовательские поиски важнее: пока страницы пула заняты, ждем следующего прохода
+            if self._busy():
+                self.skipped_busy += 1
+                break
+            started = time.monotonic()
+            try:
+                # Через single-flight: совпавший по времени поиск пользователя не запустит второй браузер
+                await self.backend.flights.do(cache_key(params), lambda: self.backend.refresh(params))
+                self.refreshed += 1
+                refreshed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"⚠️ Упреждающее обновление поиска не удалось: {e}")
+            finally:
+                with self._spent_lock:
+                    self._spent.append((time.monotonic(), time.monotonic() - started))
+        return refreshed
+
+    def stats(self) -> Dict[str, Any]:
+        hot = self.log.hot(5, self.min_score)
+        return {
+            "interval": self.interval,
+            "budget": self.budget,
+            "spent_last_hour": round(self.spent(), 1),
+            "peak": self.is_peak(),
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "skipped_budget": self.skipped_budget,
+            "skipped_busy": self.skipped_busy,
+            "last_run": datetime.fromtimestamp(self.last_run).isoformat() if self.last_run else None,
+            "query_log": self.log.stats(),
+            "hot": [dict(_route_fields(params), score=round(score, 2)) for params, score in hot]
+        }
+
+
+def _route_fields(params: TourSearchParams) -> Dict[str, Any]:
+    country = getattr(params.country, "value", params.country)
+    departure = getattr(params.departure, "value", params.departure)
+    return {"country": country, "departure": departure, "date_from": params.date_from, "date_to": params.date_to}
+
+
+def create_query_log() -> Optional[QueryLog]:
+    """Журнал запросов для CachedSearchBackend; None при TOURVISOR_PREFETCH=0"""
+    if os.environ.get("TOURVISOR_PREFETCH", "1") == "0":
+        return None
+    return QueryLog(half_life=float(os.environ.get("TOURVISOR_PREFETCH_HALF_LIFE", "3600")))
+
+
+def create_prefetcher(backend, pool=None) -> Optional[PrefetchScheduler]:
+    """Планировщик над кэширующим слоем бэкенда; None, если кэша или журнала запросов нет"""
+    # Кэширующий слой лежит под планировщиком подпоисков
+    while backend is not None and not isinstance(backend, CachedSearchBackend):
+        backend = getattr(backend, "backend", None)
+    if backend is None or backend.query_log is None:
+        return None
+    return PrefetchScheduler(
+        backend,
+        pool=pool,
+        interval=float(os.environ.get("TOURVISOR_PREFETCH_INTERVAL", "60")),
+        top=int(os.environ.get("TOURVISOR_PREFETCH_TOP", "10")),
+        min_score=float(os.environ.get("TOURVISOR_PREFETCH_MIN_SCORE", "3")),
+        budget=float(os.environ.get("TOURVISOR_PREFETCH_BUDGET", "600")),
+        lead_time=float(os.environ.get("TOURVISOR_PREFETCH_LEAD", "120")),
+        offpeak_lead_time=float(os.environ.get("TOURVISOR_PREFETCH_OFFPEAK_LEAD", "300"))
+    )
@@ -0,0 +1,128 @@
+"""
+Календарь цен: самая низкая цена (и отель) на каждую дату вылета
+Диапазон дат делится на окна; окна, которые уже есть в кэше, отдаются сразу,
+остальные ищутся параллельно. Один ответ вместо десятков поисков "а если на день позже".
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import replace
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from fixed_departure_api import Tour, TourSearchParams
+from search_planner import plan_searches
+from tour_filters import tour_predicate
+from tour_format import format_date
+from tour_model import parse_date
+
+logger = logging.getLogger(__name__)
+
+WindowCallback = Callable[[int, int, TourSearchParams], None]
+
+
+def max_calendar_days() -> int:
+    return int(os.environ.get("TOURVISOR_CALENDAR_MAX_DAYS", "62"))
+
+
+def validate_calendar(params: TourSearchParams):
+    """ValueError, если даты не разбираются или диапазон длиннее TOURVISOR_CALENDAR_MAX_DAYS"""
+    date_from, date_to = parse_date(params.date_from), parse_date(params.date_to)
+    if date_from is None or date_to is None:
+        raise ValueError("date_from and date_to must be DD.MM.YYYY")
+    if date_to < date_from:
+        raise ValueError("date_to must not be earlier than date_from")
+    days = (date_to - date_from).days + 1
+    if days > max_calendar_days():
+        raise ValueError(f"Calendar range is too long: {days} days (max {max_calendar_days()})")
+
+
+def plan_windows(params: TourSearchParams) -> List[TourSearchParams]:
+    """Окна дат календаря (ночи делит уже планировщик бэкенда)"""
+    return plan_searches(
+        replace(params, sort_by=None, limit=None),
+        window_days=int(os.environ.get("TOURVISOR_CALENDAR_WINDOW_DAYS", "7")),
+        nights_span=0,
+        max_subsearches=int(os.environ.get("TOURVISOR_CALENDAR_MAX_WINDOWS", "10"))
+    )
+
+
+def calendar_days(tours: List[Tour], params: TourSearchParams) -> List[Dict[str, Any]]:
+    """Строка на каждую дату диапазона: самый дешевый тур и число туров (null, если туров нет)"""
+    date_from, date_to = parse_date(params.date_from), parse_date(params.date_to)
+    matches = tour_predicate(params)
+    cheapest: Dict[Any, Tour] = {}
+    counts: Dict[Any, int] = {}
+    for tour in tours:
+        if tour.date is None or not date_from <= tour.date <= date_to or (matches and not matches(tour)):
+            continue
+        counts[tour.date] = counts.get(tour.date, 0) + 1
+        if tour.price is not None and (tour.date not in cheapest or tour.price < cheapest[tour.date].price):
+            cheapest[tour.date] = tour
+
+    days = []
+    day = date_from
+    while day <= date_to:
+        tour = cheapest.get(day)
+        days.append({
+            "date": format_date(day),
+            "min_price": tour.price if tour else None,
+            "hotel": tour.hotel if tour else None,
+            "nights": tour.nights if tour else None,
+            "operator": tour.operator if tour else None,
+            "count": counts.get(day, 0)
+        })
+        day += timedelta(days=1)
+    return days
+
+
+async def price_calendar(backend, params: TourSearchParams, concurrency: int, cache=None,
+                         on_window: Optional[WindowCallback] = None) -> Dict[str, Any]:
+    """
+    Календарь цен по params; cache - TourResultCache бэкенда, чтобы закэшированные окна
+    не ждали в очереди за теми, что ищутся в браузере
+    """
+    windows = plan_windows(params)
+    # Кэш хранит не окна, а подпоиски, на которые окно разобьет планировщик бэкенда (например, по ночам)
+    plan = getattr(backend, "plan", lambda window: [window])
+    cached = [cache is not None and all(cache.contains(sub_params) for sub_params in plan(window))
+              for window in windows]
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def search(window: TourSearchParams, is_cached: bool) -> List[Tour]:
+        nonlocal done
+        if is_cached:
+            tours = await backend.search_tours(window)
+        else:
+            async with semaphore:
+                tours = await backend.search_tours(window)
+        done += 1
+        if on_window:
+            on_window(done, len(windows), window)
+        return tours
+
+    results = await asyncio.gather(*map(search, windows, cached), return_exceptions=True)
+    errors = [(window, result) for window, result in zip(windows, results) if isinstance(result, BaseException)]
+    if len(errors) == len(windows):
+        raise errors[0][1]
+    for window, error in errors:
+        logger.warning(f"⚠️ Окно календаря {window.date_from}-{window.date_to} не выполнено: {error}")
+
+    tours = [tour for result in results if not isinstance(result, BaseException) for tour in result]
+    days = calendar_days(tours, params)
+    priced = [day for day in days if day["min_price"] is not None]
+    cheapest = min(priced, key=lambda day: day["min_price"]) if priced else None
+    return {
+        "date_from": params.date_from,
+        "date_to": params.date_to,
+        "nights_from": params.nights_from,
+        "nights_to": params.nights_to,
+        "windows": len(windows),
+        "cached_windows": sum(cached),
+        "failed_windows": [{"date_from": window.date_from, "date_to": window.date_to, "error": str(error)}
+                           for window, error in errors],
+        "cheapest": {key: cheapest[key] for key in ("date", "min_price", "hotel")} if cheapest else None,
+        "days": days
+    }
@@ -0,0 +1,107 @@
+"""
+Политика загрузки ресурсов страницы (context.route)
+Виджету TourVisor нужны документ, скрипты, стили и XHR. Картинки, шрифты, медиа, аналитика и чаты
+только замедляют goto и раздувают память страницы, поэтому они отклоняются до сети.
+"""
+
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Типы ресурсов Playwright, которые не нужны для поиска
+DEFAULT_BLOCKED_TYPES = ("image", "font", "media")
+
+# Аналитика, ретаргетинг и чат-виджеты на eto.travel
+DEFAULT_DENY_PATTERNS = (
+    r"google-analytics\.com", r"googletagmanager\.com", r"doubleclick\.net", r"mc\.yandex\.",
+    r"yandex\.\w+/(metrika|watch)", r"top-fwz1\.mail\.ru", r"vk\.com/rtrg", r"connect\.facebook\.net",
+    r"jivosite\.com", r"code\.jivo\.ru", r"carrotquest\.", r"bitrix24\.", r"tawk\.to", r"hotjar\.com",
+    r"onesignal\.com", r"clarity\.ms",
+)
+
+
+def _patterns(value: Optional[str]) -> List[str]:
+    return [pattern.strip() for pattern in (value or "").split(",") if pattern.strip()]
+
+
+class ResourcePolicy:
+    """
+    Решение по каждому запросу контекста:
+    документ пропускается всегда; ресурсы из blocked_types и URL из deny отклоняются;
+    если задан allow, отклоняется и все, что в него не входит (allow сильнее deny, но не типов)
+    """
+
+    def __init__(self, blocked_types: Iterable[str] = DEFAULT_BLOCKED_TYPES,
+                 deny: Iterable[str] = DEFAULT_DENY_PATTERNS, allow: Iterable[str] = ()):
+        self.blocked_types = frozenset(blocked_types)
+        self.deny = [re.compile(pattern, re.IGNORECASE) for pattern in deny]
+        self.allow = [re.compile(pattern, re.IGNORECASE) for pattern in allow]
+        # Маршруты одного контекста вызываются из цикла событий, а stats() читают потоки Flask
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.blocked: Dict[str, int] = {}
+        self.loaded_bytes = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResourcePolicy"]:
+        """TOURVISOR_RESOURCE_POLICY=0 отключает политику (None - грузить все)"""
+        if os.environ.get("TOURVISOR_RESOURCE_POLICY", "1") == "0":
+            return None
+        blocked_types = os.environ.get("TOURVISOR_BLOCK_TYPES")
+        return cls(
+            blocked_types=DEFAULT_BLOCKED_TYPES if blocked_types is None else _patterns(blocked_types),
+            deny=list(DEFAULT_DENY_PATTERNS) + _patterns(os.environ.get("TOURVISOR_BLOCK_URLS")),
+            allow=_patterns(os.environ.get("TOURVISOR_ALLOW_URLS"))
+        )
+
+    def decide(self, url: str, resource_type: str) -> Optional[str]:
+        """Причина отказа ("type:image", "deny", "not_allowed") или None, если запрос пропускается"""
+        if resource_type == "document":
+            return None
+        allowed = any(pattern.search(url) for pattern in self.allow)
+        if self.allow and not allowed:
+            return "not_allowed"
+        if resource_type in self.blocked_types:
+            return f"type:{resource_type}"
+        if not allowed and any(pattern.search(url) for pattern in self.deny):
+            return "deny"
+        return None
+
+    async def attach(self, context):
+        """Подключить политику к BrowserContext (до открытия страниц)"""
+        await context.route("**/*", self._route)
+        context.on("response", self._on_response)
+
+    async def _route(self, route):
+        request = route.request
+        reason = self.decide(request.url, request.resource_type)
+        if reason is None:
+            with self._lock:
+                self.allowed += 1
+            await route.continue_()
+            return
+        with self._lock:
+            self.blocked[reason] = self.blocked.get(reason, 0) + 1
+        await route.abort("blockedbyclient")
+
+    def _on_response(self, response):
+        # Размер отклоненных запросов неизвестен (до сети они не доходят), считаем то, что реально загружено
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            with self._lock:
+                self.loaded_bytes += int(length)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "blocked_types": sorted(self.blocked_types),
+                "allow_patterns": len(self.allow),
+                "allowed_requests": self.allowed,
+                "blocked_requests": sum(self.blocked.values()),
+                "blocked_by_reason": dict(self.blocked),
+                "loaded_bytes": self.loaded_bytes
+            }
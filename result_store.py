@@ -0,0 +1,172 @@
+"""
+Постоянное хранилище результатов поиска в SQLite (WAL)
+Переживает перезапуски и читается всеми воркерами gunicorn/Flask одновременно
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from dataclasses import fields
+from typing import Any, Dict, List, Optional, Tuple
+
+from fixed_departure_api import TourSearchParams
+from tour_cache import cache_key, normalize_value
+from tour_model import TOUR_FIELDS, Tour
+
+# Меняется вместе с полями Tour: при несовпадении таблицы пересоздаются (это кэш, не архив)
+SCHEMA_VERSION = 2
+
+TOUR_COLUMNS = list(TOUR_FIELDS)
+
+# Даты хранятся строками ISO (SQLite не знает типа DATE)
+DATE_COLUMNS = ("date", "date_to")
+
+
+def _tour_row(tour: Tour) -> Tuple[Any, ...]:
+    values = ((name, getattr(tour, name)) for name in TOUR_COLUMNS)
+    return tuple(value.isoformat() if name in DATE_COLUMNS and value else value for name, value in values)
+
+
+def _row_tour(row) -> Tour:
+    return Tour(*(date.fromisoformat(value) if name in DATE_COLUMNS and value else value
+                  for name, value in zip(TOUR_COLUMNS, row)))
+
+
+class TourResultStore:
+    def __init__(self, path: str, fresh_ttl: float = 900.0, stale_ttl: float = 6 * 3600.0):
+        self.path = path
+        # Моложе fresh_ttl - отдаем как есть, до stale_ttl - отдаем и обновляем в фоне
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = set()
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3.Connection нельзя делить между потоками - у каждого потока своя
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        with conn:
+            if version != SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS tours")
+                conn.execute("DROP TABLE IF EXISTS searches")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS searches (
+                    key TEXT PRIMARY KEY,
+                    params TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    tour_count INTEGER NOT NULL
+                )
+            """)
+            columns = ", ".join(TOUR_COLUMNS)
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS tours (
+                    search_key TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    {columns},
+                    PRIMARY KEY (search_key, position)
+                )
+            """)
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def load(self, params: TourSearchParams) -> Optional[Tuple[List[Tour], float]]:
+        """(туры, возраст в секундах) или None, если записи нет или она старше stale_ttl"""
+        key = cache_key(params)
+        conn = self._connect()
+        row = conn.execute("SELECT updated_at FROM searches WHERE key = ?", (key,)).fetchone()
+        age = time.time() - row[0] if row else None
+        if age is None or age >= self.stale_ttl:
+            self.misses += 1
+            return None
+        if age < self.fresh_ttl:
+            self.fresh_hits += 1
+        else:
+            self.stale_hits += 1
+        rows = conn.execute(
+            f"SELECT {', '.join(TOUR_COLUMNS)} FROM tours WHERE search_key = ? ORDER BY position",
+            (key,)
+        ).fetchall()
+        return [_row_tour(row) for row in rows], age
+
+    def save(self, params: TourSearchParams, tours: List[Tour]):
+        key = cache_key(params)
+        normalized = {f.name: normalize_value(getattr(params, f.name)) for f in fields(params)}
+        placeholders = ", ".join("?" for _ in TOUR_COLUMNS)
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM tours WHERE search_key = ?", (key,))
+            conn.execute(
+                "INSERT OR REPLACE INTO searches (key, params, updated_at, tour_count) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(normalized, ensure_ascii=False), time.time(), len(tours))
+            )
+            conn.executemany(
+                f"INSERT INTO tours (search_key, position, {', '.join(TOUR_COLUMNS)}) VALUES (?, ?, {placeholders})",
+                [(key, position) + _tour_row(tour) for position, tour in enumerate(tours)]
+            )
+
+    def purge_expired(self) -> int:
+        """Удалить записи старше stale_ttl"""
+        cutoff = time.time() - self.stale_ttl
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM tours WHERE search_key IN (SELECT key FROM searches WHERE updated_at < ?)",
+                         (cutoff,))
+            return conn.execute("DELETE FROM searches WHERE updated_at < ?", (cutoff,)).rowcount
+
+    def claim_refresh(self, params: TourSearchParams) -> bool:
+        """Фоновое обновление одного поиска запускается только один раз"""
+        key = cache_key(params)
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def release_refresh(self, params: TourSearchParams):
+        with self._refresh_lock:
+            self._refreshing.discard(cache_key(params))
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        searches, tours = conn.execute("SELECT COUNT(*), COALESCE(SUM(tour_count), 0) FROM searches").fetchone()
+        return {
+            "path": self.path,
+            "searches": searches,
+            "tours": tours,
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshing": len(self._refreshing)
+        }
+
+
+_shared_store: Optional[TourResultStore] = None
+
+
+def get_result_store() -> Optional[TourResultStore]:
+    """Общее хранилище процесса; TOURVISOR_STORE_PATH="" отключает его"""
+    global _shared_store
+    path = os.environ.get("TOURVISOR_STORE_PATH", "tour_results.db")
+    if _shared_store is None and path:
+        _shared_store = TourResultStore(
+            path,
+            fresh_ttl=float(os.environ.get("TOURVISOR_STORE_FRESH_TTL", "900")),
+            stale_ttl=float(os.environ.get("TOURVISOR_STORE_STALE_TTL", str(6 * 3600)))
+        )
+    return _shared_store
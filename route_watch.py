@@ -0,0 +1,405 @@
+"""
+Наблюдение за маршрутами: изменения цен вместо повторных полных поисков
+Сервер сам перепроверяет зарегистрированные поиски раз в interval секунд и хранит последний снимок,
+клиент забирает только разницу: новые туры, исчезнувшие и изменения цены (тур - отель/дата/ночи/оператор).
+Одинаковые наблюдения делят один маршрут, маршруты, которые отличаются только фильтрами (звезды, цена,
+питание, курорт), проверяются одним поиском, а за проход планировщика подпоиск, покрытый уже выполненным
+(тем же или более широким), не ищется повторно.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from fixed_departure_api import Tour, TourSearchParams
+from search_planner import tour_identity
+from search_progress import track_stages
+from tour_cache import CachedSearchBackend, cache_key, covers, narrow_tours
+from tour_filters import ANY_VALUE, filter_tours, tour_predicate
+from tour_format import format_date, tour_json
+
+logger = logging.getLogger(__name__)
+
+# (отель, дата, ночи, оператор)
+WatchKey = Tuple[Any, ...]
+
+
+class WatchLimitReached(Exception):
+    """Слишком много наблюдений"""
+
+
+def watch_key(tour: Tour) -> WatchKey:
+    return (tour.hotel, tour.date, tour.nights, tour.operator)
+
+
+def take_snapshot(tours: List[Tour]) -> Dict[WatchKey, Tour]:
+    """Снимок выдачи; из туров с одним ключом (разное питание) остается самый дешевый"""
+    snapshot: Dict[WatchKey, Tour] = {}
+    for tour in tours:
+        key = watch_key(tour)
+        current = snapshot.get(key)
+        if current is None or (tour.price is not None and (current.price is None or tour.price < current.price)):
+            snapshot[key] = tour
+    return snapshot
+
+
+def _key_json(key: WatchKey) -> Dict[str, Any]:
+    hotel, date, nights, operator = key
+    return {"hotel": hotel, "date_from": format_date(date), "nights": nights, "operator": operator}
+
+
+def diff_snapshots(old_prices: Dict[WatchKey, Optional[int]], snapshot: Dict[WatchKey, Tour]) -> Dict[str, Any]:
+    """Разница между ценами старого снимка и новым снимком; самые сильные снижения - первыми"""
+    new = [tour for key, tour in snapshot.items() if key not in old_prices]
+    removed = [dict(_key_json(key), price=price) for key, price in old_prices.items() if key not in snapshot]
+    changed = [(old_prices[key], tour) for key, tour in snapshot.items()
+               if key in old_prices and old_prices[key] != tour.price]
+    new.sort(key=lambda tour: (tour.price is None, tour.price or 0))
+    changed.sort(key=lambda item: (tour_delta(*item) is None, tour_delta(*item) or 0))
+    return {
+        "new": [tour_json(tour) for tour in new],
+        "removed": removed,
+        "price_changes": [dict(tour_json(tour), old_price=old, change=tour_delta(old, tour)) for old, tour in changed]
+    }
+
+
+def tour_delta(old_price: Optional[int], tour: Tour) -> Optional[int]:
+    if old_price is None or tour.price is None:
+        return None
+    return tour.price - old_price
+
+
+@dataclass
+class WatchedRoute:
+    """Один поиск, общий для всех наблюдений с тем же ключом"""
+    key: str
+    params: TourSearchParams
+    interval: float
+    # 0 - снимка еще нет; растет при каждом изменении выдачи
+    version: int = 0
+    snapshot: Dict[WatchKey, Tour] = field(default_factory=dict)
+    # версия -> цены снимка этой версии (для разницы с любой недавней версией)
+    history: "OrderedDict[int, Dict[WatchKey, Optional[int]]]" = field(default_factory=OrderedDict)
+    watch_ids: Set[str] = field(default_factory=set)
+    next_check: float = 0.0
+    checked_at: Optional[float] = None
+    changed_at: Optional[float] = None
+    checks: int = 0
+    failures: int = 0
+    last_error: Optional[str] = None
+
+    def update(self, tours: List[Tour], max_history: int) -> bool:
+        """Новый снимок; True, если выдача изменилась"""
+        self.checked_at = time.time()
+        self.last_error = None
+        snapshot = take_snapshot(tours)
+        prices = {key: tour.price for key, tour in snapshot.items()}
+        if self.version and prices == self.history.get(self.version):
+            self.snapshot = snapshot
+            return False
+        self.version += 1
+        self.snapshot = snapshot
+        self.changed_at = self.checked_at
+        self.history[self.version] = prices
+        while len(self.history) > max_history:
+            self.history.popitem(last=False)
+        return True
+
+    def changes_since(self, version: int) -> Dict[str, Any]:
+        """Разница с версией version; если она уже вытеснена - весь снимок как новые туры (reset)"""
+        if version == self.version:
+            return {"reset": False, "new": [], "removed": [], "price_changes": []}
+        old_prices = self.history.get(version)
+        return {"reset": version != 0 and old_prices is None, **diff_snapshots(old_prices or {}, self.snapshot)}
+
+
+@dataclass
+class RouteWatch:
+    """Наблюдение клиента: маршрут и версия, которую клиент уже видел"""
+    id: str
+    route_key: str
+    interval: float
+    cursor: int = 0
+    created_at: float = field(default_factory=time.time)
+    last_seen: float = field(default_factory=time.monotonic)
+
+
+def search_params(params: TourSearchParams) -> TourSearchParams:
+    """Поиск маршрута без фильтров: фильтры применяются к его выдаче локально"""
+    return replace(params, price_min=None, price_max=None, stars=None, meal=ANY_VALUE, resort=ANY_VALUE)
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+
+class RouteWatcher:
+    """Регистрация наблюдений и общая перепроверка их маршрутов в цикле событий сервера"""
+
+    def __init__(self, backend, concurrency: int = 2, tick: float = 30.0, default_interval: float = 1800.0,
+                 min_interval: float = 300.0, max_watches: int = 100, idle_ttl: float = 86400.0,
+                 max_history: int = 20):
+        self.backend = backend
+        # Подпоиски идут через кэширующий слой (single-flight и сохранение результата), разбиение - как у планировщика
+        self.cached = _find_layer(backend, CachedSearchBackend)
+        self.plan: Callable[[TourSearchParams], List[TourSearchParams]] = getattr(backend, "plan", lambda p: [p])
+        self.concurrency = concurrency
+        self.tick_interval = tick
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_watches = max_watches
+        # Наблюдение, которое не опрашивали idle_ttl секунд, удаляется вместе с осиротевшим маршрутом
+        self.idle_ttl = idle_ttl
+        self.max_history = max_history
+        self._watches: Dict[str, RouteWatch] = {}
+        self._routes: Dict[str, WatchedRoute] = {}
+        self._future = None
+        self.checks = 0
+        self.scrapes = 0
+        self.shared_subsearches = 0
+        self.failures = 0
+        self.expired = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Запустить перепроверку в цикле событий сервера (можно звать из любого потока)"""
+        if self._future is None:
+            self._future = asyncio.run_coroutine_threadsafe(self._run(), loop)
+
+    def close(self):
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.warning(f"⚠️ Проверка наблюдаемых маршрутов не удалась: {e}")
+
+    def validate_interval(self, interval: Optional[float]) -> float:
+        """ValueError для интервала не числом или короче min_interval"""
+        if interval is None:
+            return self.default_interval
+        if isinstance(interval, bool) or not isinstance(interval, (int, float)):
+            raise ValueError("interval must be a number of seconds")
+        if interval < self.min_interval:
+            raise ValueError(f"interval must be at least {self.min_interval:g} seconds")
+        return float(interval)
+
+    async def watch(self, params: TourSearchParams, interval: Optional[float] = None) -> Tuple[RouteWatch, WatchedRoute]:
+        """
+        Зарегистрировать наблюдение; снимок маршрута, которого еще нет, снимается сразу - из кэша, если
+        такой или более широкий поиск недавно выполнялся (ValueError - плохой interval, WatchLimitReached - слишком много наблюдений)
+        """
+        interval = self.validate_interval(interval)
+        self.expire_idle()
+        if len(self._watches) >= self.max_watches:
+            raise WatchLimitReached(f"Too many route watches (max {self.max_watches})")
+
+        # sort_by и limit - вид ответа, а не другой поиск
+        params = replace(params, sort_by=None, limit=None)
+        key = cache_key(params)
+        route = self._routes.get(key)
+        if route is None:
+            route = self._routes[key] = WatchedRoute(key=key, params=params, interval=interval)
+        watch = RouteWatch(id=uuid.uuid4().hex[:12], route_key=key, interval=interval)
+        self._watches[watch.id] = watch
+        route.watch_ids.add(watch.id)
+        self._reschedule(route)
+
+        if route.version == 0:
+            await self.check([route], fresh=False)
+            if route.version == 0:
+                self.unwatch(watch.id)
+                raise RuntimeError(f"Route search failed: {route.last_error or 'no tours found'}")
+        watch.cursor = route.version
+        return watch, route
+
+    def changes(self, watch_id: str, since: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Изменения с версии since (по умолчанию - с прошлого опроса); None - наблюдения нет"""
+        watch = self._watches.get(watch_id)
+        if watch is None:
+            return None
+        route = self._routes[watch.route_key]
+        since = watch.cursor if since is None else since
+        watch.cursor = route.version
+        watch.last_seen = time.monotonic()
+        return {
+            "watch_id": watch.id,
+            "since": since,
+            **self.route_status(route),
+            **route.changes_since(since)
+        }
+
+    def unwatch(self, watch_id: str) -> bool:
+        watch = self._watches.pop(watch_id, None)
+        if watch is None:
+            return False
+        route = self._routes.get(watch.route_key)
+        if route is not None:
+            route.watch_ids.discard(watch_id)
+            if route.watch_ids:
+                self._reschedule(route)
+            else:
+                del self._routes[route.key]
+        return True
+
+    def expire_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        for watch in [watch for watch in self._watches.values() if watch.last_seen < cutoff]:
+            self.unwatch(watch.id)
+            self.expired += 1
+
+    def _reschedule(self, route: WatchedRoute):
+        # Маршрут проверяется так часто, как просит самое частое из его наблюдений
+        route.interval = min(self._watches[watch_id].interval for watch_id in route.watch_ids)
+        if route.checked_at is not None:
+            route.next_check = min(route.next_check, time.monotonic() + route.interval)
+
+    def route_status(self, route: WatchedRoute) -> Dict[str, Any]:
+        return {
+            "version": route.version,
+            "count": len(route.snapshot),
+            "interval": route.interval,
+            "checked_at": _iso(route.checked_at),
+            "changed_at": _iso(route.changed_at),
+            "next_check_in": max(0, round(route.next_check - time.monotonic())),
+            "last_error": route.last_error
+        }
+
+    async def tick(self) -> int:
+        """Один проход: перепроверить маршруты, которым пора; сколько маршрутов проверено"""
+        self.expire_idle()
+        now = time.monotonic()
+        due = [route for route in self._routes.values() if route.next_check <= now]
+        if due:
+            await self.check(due)
+        return len(due)
+
+    async def check(self, routes: List[WatchedRoute], fresh: bool = True):
+        """
+        Перепроверить маршруты: широкие первыми, чтобы узкие взяли их туры без второго поиска
+        (fresh=False - подпоиски можно взять из кэша)
+        """
+        # Маршруты с одним поиском и разными фильтрами: поиск выполняется один раз на группу
+        groups: Dict[str, Tuple[TourSearchParams, List[WatchedRoute]]] = {}
+        for route in routes:
+            params = search_params(route.params)
+            groups.setdefault(cache_key(params), (params, []))[1].append(route)
+        searches = sorted(groups.values(),
+                          key=lambda group: -sum(covers(group[0], other[0]) for other in groups.values()))
+        # Подпоиски, выполненные в этом проходе: [(params, туры)]
+        fetched: List[Tuple[TourSearchParams, List[Tour]]] = []
+        semaphore = asyncio.Semaphore(self.concurrency)
+        for params, group in searches:
+            now = time.monotonic()
+            for route in group:
+                self.checks += 1
+                route.checks += 1
+                route.next_check = now + route.interval
+            error = None
+            try:
+                tours = await self._search(params, fetched, semaphore, fresh)
+            except Exception as e:
+                tours, error = None, str(e)
+                logger.warning(f"⚠️ Проверка маршрута не удалась: {e}")
+            for route in group:
+                # Пустая выдача чаще означает сбой страницы: не объявляем все туры исчезнувшими.
+                # Пустой результат фильтров при непустой выдаче - настоящее изменение
+                failure = error if tours is None else ("empty result" if not tours and route.snapshot else None)
+                if failure is not None:
+                    route.failures += 1
+                    route.last_error = failure
+                    self.failures += 1
+                    continue
+                if route.update(filter_tours(tours, route.params), self.max_history):
+                    logger.info(f"🔔 Маршрут изменился: версия {route.version}, туров {len(route.snapshot)}")
+
+    async def _search(self, params: TourSearchParams, fetched: List[Tuple[TourSearchParams, List[Tour]]],
+                      semaphore: asyncio.Semaphore, fresh: bool) -> List[Tour]:
+        async def search(sub_params: TourSearchParams) -> List[Tour]:
+            for done_params, done_tours in fetched:
+                if covers(done_params, sub_params):
+                    self.shared_subsearches += 1
+                    return narrow_tours(done_tours, done_params, sub_params)
+            complete = False
+
+            def on_stage(stage: str):
+                nonlocal complete
+                complete = complete or stage == "results_exhausted"
+
+            async with semaphore:
+                # Стадии видны только у поиска, запущенного здесь: присоединившись к чужому, выдачу не делим
+                with track_stages(on_stage):
+                    tours = await self._scrape(sub_params) if fresh else await self._lookup(sub_params)
+            # Сужать для других маршрутов можно только выдачу, полученную этим поиском целиком
+            if complete:
+                fetched.append((sub_params, tours))
+            return tours
+
+        # В отличие от поиска пользователя, частичный результат здесь хуже ошибки: пропавшие туры были бы ложными
+        results = await asyncio.gather(*map(search, self.plan(params)))
+        matches = tour_predicate(params)
+        tours, seen = [], set()
+        for result in results:
+            for tour in result:
+                identity = tour_identity(tour)
+                if identity not in seen and (matches is None or matches(tour)):
+                    seen.add(identity)
+                    tours.append(tour)
+        return tours
+
+    async def _scrape(self, params: TourSearchParams) -> List[Tour]:
+        """Свежий поиск мимо кэша; одновременный поиск пользователя с тем же ключом присоединится к нему"""
+        self.scrapes += 1
+        if self.cached is None:
+            return await self.backend.search_tours(params)
+        return await self.cached.flights.do(cache_key(params), lambda: self.cached.refresh(params))
+
+    async def _lookup(self, params: TourSearchParams) -> List[Tour]:
+        """Подпоиск через кэш (в том числе сужением более широкого поиска)"""
+        if self.cached is None:
+            return await self.backend.search_tours(params)
+        return await self.cached.search_tours(params)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "watches": len(self._watches),
+            "routes": len(self._routes),
+            "max_watches": self.max_watches,
+            "min_interval": self.min_interval,
+            "checks": self.checks,
+            "scrapes": self.scrapes,
+            "shared_subsearches": self.shared_subsearches,
+            "failures": self.failures,
+            "expired": self.expired
+        }
+
+
+def _find_layer(backend, kind):
+    while backend is not None and not isinstance(backend, kind):
+        backend = getattr(backend, "backend", None)
+    return backend
+
+
+def create_route_watcher(backend, concurrency: int = 2) -> Optional[RouteWatcher]:
+    """Наблюдатель маршрутов с настройками из окружения; None при TOURVISOR_WATCH=0"""
+    if os.environ.get("TOURVISOR_WATCH", "1") == "0":
+        return None
+    return RouteWatcher(
+        backend,
+        concurrency=concurrency,
+        tick=float(os.environ.get("TOURVISOR_WATCH_TICK", "30")),
+        default_interval=float(os.environ.get("TOURVISOR_WATCH_INTERVAL", "1800")),
+        min_interval=float(os.environ.get("TOURVISOR_WATCH_MIN_INTERVAL", "300")),
+        max_watches=int(os.environ.get("TOURVISOR_WATCH_MAX", "100")),
+        idle_ttl=float(os.environ.get("TOURVISOR_WATCH_IDLE_TTL", "86400"))
+    )
@@ -0,0 +1,68 @@
+"""
+Выбор бэкенда поиска туров
+playwright - браузер FixedTourvisorAPI, direct - HTTP-протокол TourVisor с откатом на браузер
+"""
+
+import logging
+import os
+from typing import List, Optional
+
+from browser_pool import BrowserPool
+from fixed_departure_api import FixedTourvisorAPI, Tour, TourCallback, TourSearchParams
+from tour_cache import CachedSearchBackend, TourResultCache
+from search_planner import DEFAULT_WINDOW_DAYS, PlannedSearchBackend
+from prefetch import create_query_log
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("playwright", "direct")
+
+
+class FallbackSearchBackend:
+    """Сначала основной бэкенд, при ошибке - запасной"""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.fallbacks = 0
+
+    async def search_tours(self, params: TourSearchParams, on_tour: Optional[TourCallback] = None) -> List[Tour]:
+        try:
+            return await self.primary.search_tours(params, on_tour)
+        except Exception as e:
+            self.fallbacks += 1
+            logger.warning(f"⚠️ {type(self.primary).__name__} не справился ({e}), ищу через браузер")
+            return await self.fallback.search_tours(params, on_tour)
+
+    async def close(self):
+        try:
+            await self.primary.close()
+        finally:
+            await self.fallback.close()
+
+
+def create_search_backend(kind: Optional[str] = None, pool: Optional[BrowserPool] = None,
+                          headless: bool = False, cache: Optional[TourResultCache] = None,
+                          store=None, concurrency: int = 2):
+    """Бэкенд с интерфейсом search_tours(TourSearchParams) -> List[Tour]"""
+    kind = kind or os.environ.get("TOURVISOR_BACKEND", "playwright")
+    if kind not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд поиска: {kind} (доступны: {', '.join(BACKENDS)})")
+
+    backend = FixedTourvisorAPI(headless=headless, pool=pool)
+    if kind == "direct":
+        # Импорт здесь: aiohttp нужен только прямому бэкенду
+        from direct_api import DirectTourvisorAPI
+        backend = FallbackSearchBackend(DirectTourvisorAPI(), backend)
+    if cache is not None:
+        # Журнал запросов кэширующего слоя - источник горячих поисков для упреждающего обновления
+        backend = CachedSearchBackend(backend, cache, store=store, query_log=create_query_log())
+    # Планировщик снаружи кэша: каждый подпоиск кэшируется и схлопывается отдельно.
+    # Форма сайта задает одно число ночей, протокол TourVisor - диапазон
+    return PlannedSearchBackend(
+        backend,
+        concurrency=concurrency,
+        window_days=int(os.environ.get("TOURVISOR_PLAN_WINDOW_DAYS", str(DEFAULT_WINDOW_DAYS))),
+        nights_span=int(os.environ.get("TOURVISOR_PLAN_NIGHTS_SPAN", "1" if kind == "playwright" else "7")),
+        max_subsearches=int(os.environ.get("TOURVISOR_PLAN_MAX_SUBSEARCHES", "8"))
+    )
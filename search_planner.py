@@ -0,0 +1,148 @@
+"""
+Планировщик поиска: широкий диапазон дат и ночей -> несколько подпоисков
+Сайт обрезает выдачу широкого поиска до того, что помещается на экран, а форма задает только одно
+число ночей. Подпоиски по окнам дат и числу ночей выполняются параллельно, результаты склеиваются без дублей.
+"""
+
+import asyncio
+import logging
+import math
+from dataclasses import replace
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from fixed_departure_api import Tour, TourCallback, TourSearchParams
+from tour_model import DATE_FORMAT, parse_date
+
+logger = logging.getLogger(__name__)
+
+# Окно дат по умолчанию - календарный месяц: обычный запрос на месяц идет одним поиском,
+# делятся только диапазоны заметно шире
+DEFAULT_WINDOW_DAYS = 31
+
+
+def _date_windows(date_from: str, date_to: str, window_days: int) -> List[Tuple[str, str]]:
+    start, end = parse_date(date_from), parse_date(date_to)
+    if window_days <= 0 or start is None or end is None or end < start:
+        return [(date_from, date_to)]
+    # Окна одинаковой длины вместо короткого хвоста: 30 дней по 14 -> 10 + 10 + 10
+    total_days = (end - start).days + 1
+    window_days = math.ceil(total_days / math.ceil(total_days / window_days))
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=window_days - 1), end)
+        windows.append((start.strftime(DATE_FORMAT), window_end.strftime(DATE_FORMAT)))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+def _nights_groups(nights_from: int, nights_to: int, span: int) -> List[Tuple[int, int]]:
+    if span <= 0 or nights_to <= nights_from:
+        return [(nights_from, nights_to)]
+    return [(nights, min(nights + span - 1, nights_to)) for nights in range(nights_from, nights_to + 1, span)]
+
+
+def plan_searches(params: TourSearchParams, window_days: int = DEFAULT_WINDOW_DAYS, nights_span: int = 1,
+                  max_subsearches: int = 8) -> List[TourSearchParams]:
+    """
+    Разбить поиск на подпоиски: окна по window_days дней и группы по nights_span ночей
+    Если подпоисков больше max_subsearches, сначала расширяются окна дат, затем группы ночей.
+    """
+    nights_from, nights_to = params.nights_from, params.nights_to
+    start, end = parse_date(params.date_from), parse_date(params.date_to)
+    total_days = (end - start).days + 1 if start and end and end >= start else 0
+
+    while True:
+        windows = _date_windows(params.date_from, params.date_to, window_days)
+        groups = _nights_groups(nights_from, nights_to, nights_span)
+        if len(windows) * len(groups) <= max_subsearches:
+            break
+        if 0 < window_days < total_days:
+            window_days *= 2
+        elif 0 < nights_span <= nights_to - nights_from:
+            nights_span *= 2
+        else:
+            break
+
+    return [replace(params, date_from=window_from, date_to=window_to, nights_from=group_from, nights_to=group_to)
+            for window_from, window_to in windows
+            for group_from, group_to in groups]
+
+
+def tour_identity(tour: Tour) -> Tuple[Any, ...]:
+    """
+    Один и тот же тур из разных подпоисков (окна дат сайт может отдавать с запасом)
+    Цена входит в ключ: предложения того же отеля на ту же дату по другой цене (другой номер)
+    остаются, как и в выдаче неразбитого поиска.
+    """
+    return (tour.hotel, tour.date, tour.nights, tour.meal, tour.operator, tour.price)
+
+
+class PlannedSearchBackend:
+    """Бэкенд, который разбивает широкие поиски на подпоиски и выполняет их параллельно"""
+
+    def __init__(self, backend, concurrency: int = 2, window_days: int = DEFAULT_WINDOW_DAYS, nights_span: int = 1,
+                 max_subsearches: int = 8):
+        self.backend = backend
+        self.concurrency = concurrency
+        self.window_days = window_days
+        self.nights_span = nights_span
+        self.max_subsearches = max_subsearches
+        self.planned = 0
+        self.subsearches = 0
+        self.failed_subsearches = 0
+
+    def plan(self, params: TourSearchParams) -> List[TourSearchParams]:
+        return plan_searches(params, self.window_days, self.nights_span, self.max_subsearches)
+
+    async def search_tours(self, params: TourSearchParams, on_tour: Optional[TourCallback] = None) -> List[Tour]:
+        plan = self.plan(params)
+        if len(plan) == 1:
+            return await self.backend.search_tours(plan[0], on_tour)
+
+        self.planned += 1
+        self.subsearches += len(plan)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        streamed = set()
+
+        def forward(tour: Tour):
+            identity = tour_identity(tour)
+            if identity not in streamed:
+                streamed.add(identity)
+                on_tour(tour)
+
+        async def search(sub_params: TourSearchParams) -> List[Tour]:
+            async with semaphore:
+                return await self.backend.search_tours(sub_params, forward if on_tour else None)
+
+        results = await asyncio.gather(*(search(sub_params) for sub_params in plan), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if len(errors) == len(results):
+            raise errors[0]
+        if errors:
+            self.failed_subsearches += len(errors)
+            logger.warning(f"⚠️ {len(errors)} из {len(plan)} подпоисков не выполнены: {errors[0]}")
+
+        tours, seen = [], set()
+        for result in results:
+            if isinstance(result, BaseException):
+                continue
+            for tour in result:
+                identity = tour_identity(tour)
+                if identity not in seen:
+                    seen.add(identity)
+                    tours.append(tour)
+        return tours[:params.max_results] if params.max_results else tours
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_days": self.window_days,
+            "nights_span": self.nights_span,
+            "max_subsearches": self.max_subsearches,
+            "planned_searches": self.planned,
+            "subsearches": self.subsearches,
+            "failed_subsearches": self.failed_subsearches
+        }
+
+    async def close(self):
+        await self.backend.close()
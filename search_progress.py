@@ -0,0 +1,81 @@
+"""
+Стадии поиска для уведомлений о прогрессе
+Бэкенд отмечает стадии через report_stage(), вызывающий код подписывается через track_stages().
+Подписчики хранятся в contextvars, поэтому проходят через кэш и single-flight без лишних параметров;
+вложенные подписки не заменяют внешние (прогресс MCP и замер фаз получают одни и те же стадии).
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Стадия -> сообщение для клиента (в порядке прохождения)
+STAGE_MESSAGES = {
+    "navigated": "Страница поиска открыта",
+    "page_loaded": "Страница поиска загружена",
+    "country_selected": "Страна выбрана",
+    "departure_selected": "Город вылета выбран",
+    "dates_filled": "Даты заполнены",
+    "nights_selected": "Ночи выбраны",
+    "tourists_selected": "Туристы выбраны",
+    "submitted": "Поиск запущен",
+    "results_ready": "Выдача получена",
+    "extracted": "Туры разобраны",
+    "results_exhausted": "Выдача загружена полностью",
+}
+
+# Стадия -> фаза поиска, которая ею заканчивается (фаза длится от предыдущей отмеченной стадии)
+STAGE_PHASES = {
+    "navigated": "goto",
+    "page_loaded": "widget",
+    "country_selected": "country",
+    "departure_selected": "departure",
+    "dates_filled": "dates",
+    "nights_selected": "nights",
+    "tourists_selected": "tourists",
+    "submitted": "submit",
+    "results_ready": "result_wait",
+    "extracted": "extract",
+}
+
+StageCallback = Callable[[str], None]
+
+_stage_listeners: ContextVar[Tuple[StageCallback, ...]] = ContextVar("search_stage_listeners", default=())
+
+
+def report_stage(stage: str):
+    """Отметить стадию текущего поиска (без подписчиков ничего не делает)"""
+    for listener in _stage_listeners.get():
+        try:
+            listener(stage)
+        except Exception as e:
+            logger.warning(f"⚠️ Подписчик стадий поиска упал: {e}")
+
+
+@contextmanager
+def track_stages(listener: StageCallback):
+    """Стадии поисков, запущенных внутри блока (включая созданные в нем задачи), уходят и в listener"""
+    token = _stage_listeners.set(_stage_listeners.get() + (listener,))
+    try:
+        yield
+    finally:
+        _stage_listeners.reset(token)
+
+
+class StageTimer:
+    """Длительность фаз одного поиска: mark(stage) передает в on_phase(фаза, секунды) время с прошлой стадии"""
+
+    def __init__(self, on_phase: Callable[[str, float], None]):
+        self.on_phase = on_phase
+        self._last = time.monotonic()
+
+    def mark(self, stage: str):
+        now = time.monotonic()
+        phase = STAGE_PHASES.get(stage)
+        if phase is not None:
+            self.on_phase(phase, now - self._last)
+        self._last = now
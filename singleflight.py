@@ -0,0 +1,58 @@
+"""
+Схлопывание одновременных одинаковых поисков (single-flight)
+Первый запрос по ключу выполняет работу, остальные ждут тот же результат
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        # (цикл событий, ключ) -> задача; задачи одного цикла нельзя ждать из другого
+        self._inflight: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Task] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнить factory() один раз на ключ; ошибка достается всем ожидающим"""
+        slot = (asyncio.get_running_loop(), key)
+        task = self._inflight.get(slot)
+        # Завершившийся поиск еще может лежать в _inflight до вызова _forget - к нему не присоединяемся:
+        # иначе обновление, запущенное изнутри поиска с тем же ключом, получит его старый результат
+        if task is None or task.done():
+            self.leaders += 1
+            task = asyncio.ensure_future(factory())
+            self._inflight[slot] = task
+            task.add_done_callback(lambda done: self._forget(slot, done))
+        else:
+            self.shared += 1
+        # shield: отмена одного ожидающего (даже первого) не отменяет общую работу
+        return await asyncio.shield(task)
+
+    def _forget(self, slot, task: asyncio.Task):
+        if self._inflight.get(slot) is task:
+            del self._inflight[slot]
+        # Если все ожидающие отменились, ошибку никто не заберет - гасим предупреждение asyncio
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight(),
+            "leaders": self.leaders,
+            "shared": self.shared
+        }
+
+
+_shared_flights: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    global _shared_flights
+    if _shared_flights is None:
+        _shared_flights = SingleFlight()
+    return _shared_flights
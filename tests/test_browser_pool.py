@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from browser_pool import BrowserPool
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+
+class FakeContext:
+    def __init__(self):
+        self.closed = False
+
+    async def new_page(self):
+        return FakePage()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts = []
+
+    def is_connected(self):
+        return True
+
+    async def new_context(self, **options):
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        pass
+
+
+def make_pool(**kwargs):
+    pool = BrowserPool(size=1, health_check_interval=0, **kwargs)
+    browser = FakeBrowser()
+
+    async def ensure_browser():
+        if pool.browser is None:
+            pool.browser = browser
+            pool.generation += 1
+
+    pool._ensure_browser = ensure_browser
+    return pool, browser
+
+
+async def use_page(pool, fail=False):
+    async with pool.page() as page:
+        if fail:
+            raise RuntimeError("page crashed")
+        return page
+
+
+def test_page_is_reused_after_success():
+    pool, browser = make_pool()
+
+    async def run():
+        first = await use_page(pool)
+        second = await use_page(pool)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second and len(browser.contexts) == 1
+    assert pool.in_use == 0
+
+
+def test_page_is_discarded_after_error():
+    pool, browser = make_pool()
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await use_page(pool, fail=True)
+        # Место в пуле не потеряно: следующий поиск получает новую страницу
+        return await asyncio.wait_for(use_page(pool), timeout=1)
+
+    asyncio.run(run())
+    assert len(browser.contexts) == 2 and browser.contexts[0].closed and not browser.contexts[1].closed
+    assert pool.in_use == 0 and pool.stats()["available"] == 1
+
+
+def test_closed_and_worn_out_pages_are_replaced():
+    pool, browser = make_pool(max_uses_per_slot=2)
+
+    async def run():
+        first = await use_page(pool)
+        first.closed = True
+        await use_page(pool)
+        # Второе использование исчерпывает лимит слота
+        await use_page(pool)
+        await use_page(pool)
+
+    asyncio.run(run())
+    assert len(browser.contexts) == 3
+    assert [context.closed for context in browser.contexts] == [True, True, False]
@@ -0,0 +1,35 @@
+import asyncio
+
+from fixed_departure_api import FixedTourvisorAPI, TourSearchParams
+
+
+class FakePage:
+    """Отдает заранее заданные строки карточек на каждый разбор"""
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+
+    async def evaluate(self, script, args):
+        return self.batches.pop(0)
+
+
+def card(card_id, hotel, price):
+    return [card_id, hotel, str(price), "5", "Кемер", "4.5", "7", "01.07.2026", "All Inclusive", "TUI"]
+
+
+def test_reused_card_node_with_new_tour_is_extracted():
+    api = FixedTourvisorAPI(headless=True)
+    # Виртуальный список заново отрисовал узел tv-1 с другим туром и повторил уже разобранный тур
+    page = FakePage([card("tv-1", "Rixos", 100000)],
+                    [card("tv-1", "Titanic", 90000), card("tv-2", "Rixos", 100000)])
+    params = TourSearchParams()
+    seen = set()
+
+    async def run():
+        first = await api._extract_tours(page, params, seen)
+        second = await api._extract_tours(page, params, seen)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [tour.hotel for tour in first] == ["Rixos"]
+    assert [(tour.hotel, tour.price) for tour in second] == [("Titanic", 90000)]
@@ -0,0 +1,10 @@
+import threading
+
+
+def test_import_starts_no_event_loop_or_background_services():
+    threads = set(threading.enumerate())
+    import http_server
+
+    # TOURVISOR_SERVER=async импортирует модуль ради main - цикл и планировщики создает только aiohttp-сервер
+    assert http_server._http_wrapper is None
+    assert set(threading.enumerate()) == threads
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from jobs import JobManager, JobQueueFull
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    loop.close()
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_job_reports_partial_then_result(loop):
+    manager = JobManager(loop=loop)
+    release = asyncio.Event()
+
+    async def work(job):
+        job.report([{"hotel": "A"}])
+        await release.wait()
+        return {"success": True, "tours": 1}
+
+    job = manager.submit("search", work)
+    wait_for(lambda: job.partial)
+    status = manager.get(job.id).to_dict()
+    assert status["status"] == "running" and status["partial"] == [{"hotel": "A"}]
+
+    loop.call_soon_threadsafe(release.set)
+    wait_for(lambda: job.finished_at is not None)
+    status = job.to_dict()
+    assert status["status"] == "done" and status["result"] == {"success": True, "tours": 1}
+    # Итог уже в result - промежуточные туры не дублируются
+    assert status["partial"] == [] and status["partial_count"] == 1
+
+
+def test_failures_are_reported(loop):
+    manager = JobManager(loop=loop)
+
+    async def unsuccessful(job):
+        return {"success": False, "error": "no tours"}
+
+    async def broken(job):
+        raise RuntimeError("browser crashed")
+
+    jobs = [manager.submit("search", unsuccessful), manager.submit("search", broken)]
+    wait_for(lambda: all(job.finished_at is not None for job in jobs))
+    assert [(job.status, job.error) for job in jobs] == [("failed", "no tours"), ("failed", "browser crashed")]
+    assert manager.stats()["jobs"] == {"failed": 2}
+
+
+def test_workers_and_queue_are_bounded(loop):
+    manager = JobManager(max_workers=1, max_pending=2, loop=loop)
+    release = asyncio.Event()
+
+    async def work(job):
+        await release.wait()
+        return {"success": True}
+
+    first, second = manager.submit("search", work), manager.submit("search", work)
+    wait_for(lambda: first.status == "running")
+    assert second.status == "queued"
+    with pytest.raises(JobQueueFull):
+        manager.submit("search", work)
+
+    loop.call_soon_threadsafe(release.set)
+    wait_for(lambda: second.status == "done")
+
+
+def test_finished_jobs_expire(loop):
+    manager = JobManager(retention=60, loop=loop)
+
+    async def work(job):
+        return {"success": True}
+
+    job = manager.submit("search", work)
+    wait_for(lambda: job.finished_at is not None)
+    assert manager.get(job.id) is job
+    job.finished_at -= 120
+    assert manager.get(job.id) is None
@@ -0,0 +1,54 @@
+import pytest
+
+from metrics import MetricsRegistry
+
+
+def test_counter_and_gauge_render():
+    registry = MetricsRegistry()
+    lookups = registry.counter("cache_lookups_total", "Cache lookups", labels=("result",))
+    lookups.inc(result="hit")
+    lookups.inc(2, result='mi"ss')
+    registry.gauge("pool_in_use", "Busy pages").set(1.5)
+    assert registry.render() == (
+        "# HELP cache_lookups_total Cache lookups\n"
+        "# TYPE cache_lookups_total counter\n"
+        'cache_lookups_total{result="hit"} 1\n'
+        'cache_lookups_total{result="mi\\"ss"} 2\n'
+        "# HELP pool_in_use Busy pages\n"
+        "# TYPE pool_in_use gauge\n"
+        "pool_in_use 1.5\n"
+    )
+    assert registry.summary() == {"cache_lookups_total": {"result=hit": 1.0, 'result=mi"ss': 2.0},
+                                  "pool_in_use": {"total": 1.5}}
+    with pytest.raises(ValueError):
+        lookups.inc(kind="hit")
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = MetricsRegistry().histogram("search_seconds", "Search time", buckets=(1, 2, 5))
+    for value in (0.5, 1.5, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.render()[2:] == [
+        'search_seconds_bucket{le="1"} 1',
+        'search_seconds_bucket{le="2"} 3',
+        'search_seconds_bucket{le="5"} 4',
+        'search_seconds_bucket{le="+Inf"} 4',
+        "search_seconds_sum 6.5",
+        "search_seconds_count 4",
+    ]
+    assert histogram.summary() == {"total": {"count": 4, "mean": 1.625, "p50": 1.5, "p90": 3.8, "sum": 6.5}}
+
+
+def test_histogram_quantile_above_last_bound():
+    histogram = MetricsRegistry().histogram("wait_seconds", "Wait", buckets=(1, 5))
+    histogram.observe(60)
+    assert histogram.summary()["total"]["p90"] == 5
+    assert histogram.quantile([0, 0, 0], 0, 0.5) is None
+
+
+def test_registry_returns_same_metric_and_rejects_kind_change():
+    registry = MetricsRegistry()
+    counter = registry.counter("searches_total", "Searches")
+    assert registry.counter("searches_total", "Searches") is counter
+    with pytest.raises(ValueError):
+        registry.histogram("searches_total", "Searches")
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from datetime import date
+
+import pytest
+
+import prefetch
+from fixed_departure_api import Tour, TourSearchParams
+from prefetch import PrefetchScheduler, QueryLog
+from singleflight import SingleFlight
+from tour_cache import CachedSearchBackend, TourResultCache
+
+
+class FakeBackend:
+    def __init__(self):
+        self.searches = []
+
+    async def search_tours(self, params, on_tour=None):
+        self.searches.append(params)
+        return [Tour(hotel="Hotel", price=1000, date=date(2030, 7, 1))]
+
+    async def close(self):
+        pass
+
+
+def route(day: int, year: int = 2030) -> TourSearchParams:
+    return TourSearchParams(date_from=f"{day:02d}.07.{year}", date_to=f"{day:02d}.07.{year}")
+
+
+def make_scheduler(**kwargs):
+    backend = CachedSearchBackend(FakeBackend(), TourResultCache(ttl=900), flights=SingleFlight(),
+                                  query_log=QueryLog(half_life=3600))
+    kwargs.setdefault("min_score", 0.5)
+    return PrefetchScheduler(backend, **kwargs)
+
+
+def test_query_log_decays_scores(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(prefetch.time, "time", lambda: now[0])
+    log = QueryLog(half_life=3600)
+    for _ in range(4):
+        log.record(route(1))
+    log.record(route(2))
+    assert [(params.date_from, score) for params, score in log.hot(5)] == [("01.07.2030", 4.0), ("02.07.2030", 1.0)]
+
+    # Через период полураспада счет вдвое меньше; min_score отсекает редкие поиски
+    now[0] += 3600
+    assert [(params.date_from, score) for params, score in log.hot(5, min_score=1.0)] == [("01.07.2030", 2.0)]
+
+
+def test_query_log_prunes_rarest():
+    log = QueryLog(max_entries=10)
+    for day in range(1, 11):
+        for _ in range(day):
+            log.record(route(day))
+    log.record(route(20))
+    assert log.stats()["tracked"] == 10
+    assert "01.07.2030" not in {params.date_from for params, _ in log.hot(20)}
+
+
+def test_due_skips_fresh_and_past_searches():
+    scheduler = make_scheduler(lead_time=120, offpeak_lead_time=120)
+    for params in (route(1), route(2), route(1, year=2020)):
+        scheduler.log.record(params)
+    scheduler.cache.put(route(2), [Tour(hotel="Hotel", price=1000)])
+    # Запись route(2) живет 900 с - больше lead_time, прошедшие даты не обновляются
+    assert [params.date_from for params in scheduler.due()] == ["01.07.2030"]
+
+    scheduler.cache.put(route(2), [Tour(hotel="Hotel", price=1000)], ttl=60)
+    assert sorted(params.date_from for params in scheduler.due()) == ["01.07.2030", "02.07.2030"]
+
+
+def test_tick_refreshes_until_budget_is_spent():
+    scheduler = make_scheduler(budget=3600)
+    scheduler.log.record(route(1))
+    scheduler.log.record(route(2))
+    assert asyncio.run(scheduler.tick()) == 2
+    assert scheduler.cache.contains(route(1)) and scheduler.cache.contains(route(2))
+    assert scheduler.due() == []
+
+    scheduler.cache.clear()
+    scheduler._spent.append((time.monotonic(), 3600.0))
+    assert asyncio.run(scheduler.tick()) == 0
+    assert scheduler.skipped_budget == 1
+
+
+def test_tick_yields_to_busy_pool():
+    class Pool:
+        in_use = 1
+
+    scheduler = make_scheduler(pool=Pool())
+    scheduler.log.record(route(1))
+    assert asyncio.run(scheduler.tick()) == 0
+    assert scheduler.skipped_busy == 1
+    assert scheduler.backend.backend.searches == []
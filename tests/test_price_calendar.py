@@ -0,0 +1,56 @@
+import asyncio
+from datetime import date
+
+from fixed_departure_api import Tour, TourSearchParams
+from price_calendar import calendar_days, price_calendar
+from search_planner import PlannedSearchBackend
+from singleflight import SingleFlight
+from tour_cache import CachedSearchBackend, TourResultCache
+
+
+class CountingBackend:
+    def __init__(self):
+        self.searches = []
+
+    async def search_tours(self, params, on_tour=None):
+        self.searches.append(params)
+        return [Tour(hotel="A", price=1000 + params.nights_from, nights=params.nights_from,
+                     date=date(2026, 7, int(params.date_from[:2])))]
+
+    async def close(self):
+        pass
+
+
+def test_cached_windows_are_checked_per_planner_subsearch(monkeypatch):
+    monkeypatch.setenv("TOURVISOR_CALENDAR_WINDOW_DAYS", "7")
+    cache = TourResultCache()
+    raw = CountingBackend()
+    backend = PlannedSearchBackend(CachedSearchBackend(raw, cache, flights=SingleFlight()), nights_span=1)
+    params = TourSearchParams(date_from="01.07.2026", date_to="14.07.2026", nights_from=7, nights_to=8)
+
+    # Первое окно уже искали целиком (обе ночи), второе - только на 7 ночей
+    for window_from, window_to, nights in (("01.07.2026", "07.07.2026", 7), ("01.07.2026", "07.07.2026", 8),
+                                           ("08.07.2026", "14.07.2026", 7)):
+        cache.put(TourSearchParams(date_from=window_from, date_to=window_to, nights_from=nights, nights_to=nights),
+                  [Tour(hotel="A", price=900, nights=nights, date=date(2026, 7, int(window_from[:2])))])
+
+    calendar = asyncio.run(price_calendar(backend, params, concurrency=2, cache=cache))
+    assert calendar["windows"] == 2
+    assert calendar["cached_windows"] == 1
+    # Браузер понадобился только непокрытому подпоиску
+    assert [(p.date_from, p.nights_from) for p in raw.searches] == [("08.07.2026", 8)]
+    assert calendar["cheapest"] == {"date": "01.07.2026", "min_price": 900, "hotel": "A"}
+
+
+def test_calendar_days_pick_cheapest_per_date_and_fill_gaps():
+    params = TourSearchParams(date_from="01.07.2026", date_to="03.07.2026", stars=4)
+    tours = [
+        Tour(hotel="A", price=1000, date=date(2026, 7, 1), stars=5),
+        Tour(hotel="B", price=800, date=date(2026, 7, 1), stars=4),
+        Tour(hotel="C", price=500, date=date(2026, 7, 1), stars=3),
+        Tour(hotel="D", price=700, date=date(2026, 7, 3), stars=5),
+        Tour(hotel="E", price=100, date=date(2026, 7, 9), stars=5),
+    ]
+    days = calendar_days(tours, params)
+    assert [(day["date"], day["min_price"], day["hotel"], day["count"]) for day in days] == [
+        ("01.07.2026", 800, "B", 2), ("02.07.2026", None, None, 0), ("03.07.2026", 700, "D", 1)]
@@ -0,0 +1,115 @@
+import asyncio
+from dataclasses import replace
+from datetime import date
+
+from fixed_departure_api import Tour, TourSearchParams
+from route_watch import RouteWatcher, WatchedRoute, diff_snapshots, take_snapshot, watch_key
+from search_progress import report_stage
+from singleflight import SingleFlight
+from tour_cache import CachedSearchBackend, TourResultCache
+
+
+class FakeBackend:
+    def __init__(self, tours, complete=True):
+        self.tours = tours
+        self.complete = complete
+        self.searches = []
+
+    async def search_tours(self, params, on_tour=None):
+        self.searches.append(params)
+        if self.complete:
+            report_stage("results_exhausted")
+        return list(self.tours)
+
+    async def close(self):
+        pass
+
+
+def make_tour(hotel, price, day=2, stars=5):
+    return Tour(hotel=hotel, price=price, nights=7, date=date(2026, 7, day), operator="Op", stars=stars)
+
+
+def make_watcher(backend):
+    return RouteWatcher(CachedSearchBackend(backend, TourResultCache(), flights=SingleFlight()))
+
+
+def check_routes(watcher, *params):
+    async def run():
+        return [(await watcher.watch(p))[1] for p in params]
+    return asyncio.run(run())
+
+
+def test_narrow_route_shares_complete_scrape():
+    backend = FakeBackend([make_tour("A", 1000, day=2), make_tour("B", 2000, day=12)])
+    watcher = make_watcher(backend)
+    broad = TourSearchParams(date_from="01.07.2026", date_to="14.07.2026")
+    narrow = TourSearchParams(date_from="01.07.2026", date_to="05.07.2026")
+    routes = check_routes(watcher, broad, narrow)
+
+    async def run():
+        await watcher.check(routes)
+
+    asyncio.run(run())
+    # Проверка: один поиск широкого маршрута, узкий взял его туры
+    assert len(backend.searches) == 2
+    assert [tour.hotel for tour in routes[1].snapshot.values()] == ["A"]
+
+
+def test_incomplete_scrape_is_not_shared():
+    backend = FakeBackend([make_tour("A", 1000, day=2)], complete=False)
+    watcher = make_watcher(backend)
+    broad = TourSearchParams(date_from="01.07.2026", date_to="14.07.2026")
+    narrow = TourSearchParams(date_from="01.07.2026", date_to="05.07.2026")
+    routes = check_routes(watcher, broad, narrow)
+    searches = len(backend.searches)
+
+    asyncio.run(watcher.check(routes))
+    assert len(backend.searches) == searches + 2
+
+
+def test_routes_differing_in_filters_share_one_scrape():
+    backend = FakeBackend([make_tour("A", 1000, stars=5), make_tour("B", 90000, stars=4)], complete=False)
+    watcher = make_watcher(backend)
+    five_stars = TourSearchParams(stars=5)
+    cheap = TourSearchParams(price_max=50000)
+    routes = check_routes(watcher, five_stars, cheap)
+    searches = len(backend.searches)
+
+    asyncio.run(watcher.check(routes))
+    assert len(backend.searches) == searches + 1
+    assert [tour.hotel for tour in routes[0].snapshot.values()] == ["A"]
+    assert [tour.hotel for tour in routes[1].snapshot.values()] == ["A"]
+
+
+def test_snapshot_keeps_cheapest_meal_option():
+    bb = make_tour("A", 1000)
+    ai = replace(bb, price=1500, meal="AI")
+    snapshot = take_snapshot([ai, bb, make_tour("A", None)])
+    assert snapshot == {watch_key(bb): bb}
+
+
+def test_diff_orders_new_by_price_and_changes_by_drop():
+    a, b, c, d = make_tour("A", 1000), make_tour("B", 2000), make_tour("C", 3000), make_tour("D", 500)
+    old = {watch_key(a): 1200, watch_key(b): 2100, watch_key(c): 3000, watch_key(make_tour("E", 0)): 700}
+    diff = diff_snapshots(old, take_snapshot([a, b, c, d, make_tour("F", 400)]))
+    assert [tour["hotel"] for tour in diff["new"]] == ["F", "D"]
+    assert diff["removed"] == [{"hotel": "E", "date_from": "02.07.2026", "nights": 7, "operator": "Op", "price": 700}]
+    assert [(tour["hotel"], tour["old_price"], tour["change"]) for tour in diff["price_changes"]] == [
+        ("A", 1200, -200), ("B", 2100, -100)]
+
+
+def test_changes_since_reports_reset_for_evicted_versions():
+    route = WatchedRoute(key="k", params=TourSearchParams(), interval=60)
+    assert route.update([make_tour("A", 1000)], max_history=2)
+    assert not route.update([make_tour("A", 1000)], max_history=2)
+    assert route.update([make_tour("A", 900)], max_history=2)
+    assert route.update([make_tour("A", 900), make_tour("B", 100)], max_history=2)
+    assert route.version == 3
+
+    assert route.changes_since(3) == {"reset": False, "new": [], "removed": [], "price_changes": []}
+    recent = route.changes_since(2)
+    assert not recent["reset"] and [tour["hotel"] for tour in recent["new"]] == ["B"]
+    # Версия 1 вытеснена из истории: клиент получает весь снимок заново
+    evicted = route.changes_since(1)
+    assert evicted["reset"] and {tour["hotel"] for tour in evicted["new"]} == {"A", "B"}
+    assert not route.changes_since(0)["reset"]
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import date
+
+from fixed_departure_api import Tour, TourSearchParams
+from search_planner import PlannedSearchBackend, plan_searches
+
+
+def ranges(plan):
+    return [(p.date_from, p.date_to, p.nights_from, p.nights_to) for p in plan]
+
+
+def test_default_month_is_one_search():
+    params = TourSearchParams(date_from="01.12.2026", date_to="31.12.2026")
+    assert ranges(PlannedSearchBackend(None).plan(params)) == [("01.12.2026", "31.12.2026", 7, 7)]
+
+
+def test_wide_range_splits_into_equal_windows_and_nights():
+    params = TourSearchParams(date_from="01.07.2026", date_to="30.07.2026", nights_from=7, nights_to=8)
+    assert ranges(plan_searches(params, window_days=14)) == [
+        ("01.07.2026", "10.07.2026", 7, 7), ("01.07.2026", "10.07.2026", 8, 8),
+        ("11.07.2026", "20.07.2026", 7, 7), ("11.07.2026", "20.07.2026", 8, 8),
+        ("21.07.2026", "30.07.2026", 7, 7), ("21.07.2026", "30.07.2026", 8, 8),
+    ]
+
+
+def test_plan_widens_windows_to_fit_max_subsearches():
+    params = TourSearchParams(date_from="01.07.2026", date_to="30.07.2026", nights_from=7, nights_to=10)
+    plan = plan_searches(params, window_days=7, nights_span=1, max_subsearches=8)
+    assert len(plan) <= 8
+    assert {(p.nights_from, p.nights_to) for p in plan} == {(7, 7), (8, 8), (9, 9), (10, 10)}
+
+
+def test_bad_dates_are_not_split():
+    params = TourSearchParams(date_from="завтра", date_to="31.07.2026")
+    assert ranges(plan_searches(params, window_days=7)) == [("завтра", "31.07.2026", 7, 7)]
+
+
+class WindowBackend:
+    """Отдает туры, попадающие в окно подпоиска; окно 01-10 отдает и тур на границе с запасом"""
+
+    def __init__(self, tours, fail_from=None):
+        self.tours = tours
+        self.fail_from = fail_from
+        self.calls = 0
+
+    async def search_tours(self, params, on_tour=None):
+        self.calls += 1
+        if params.date_from == self.fail_from:
+            raise RuntimeError("page crashed")
+        found = [tour for tour in self.tours if tour.date.day <= int(params.date_to[:2]) + 1
+                 and tour.date.day >= int(params.date_from[:2])]
+        for tour in found:
+            if on_tour:
+                on_tour(tour)
+        return found
+
+
+def tour(hotel, day, price):
+    return Tour(hotel=hotel, price=price, nights=7, date=date(2026, 7, day), meal="AI", operator="Op")
+
+
+def test_merge_dedups_overlap_but_keeps_other_prices():
+    tours = [tour("A", 11, 1000), tour("A", 11, 1200), tour("B", 3, 900), tour("C", 20, 800)]
+    backend = PlannedSearchBackend(WindowBackend(tours), window_days=10)
+    params = TourSearchParams(date_from="01.07.2026", date_to="20.07.2026")
+    streamed = []
+
+    found = asyncio.run(backend.search_tours(params, streamed.append))
+    # Тур на 11.07 пришел из обоих окон, второй номер того же отеля по другой цене остался
+    assert sorted((t.hotel, t.date.day, t.price) for t in found) == [
+        ("A", 11, 1000), ("A", 11, 1200), ("B", 3, 900), ("C", 20, 800)]
+    assert sorted(t.price for t in streamed) == sorted(t.price for t in found)
+
+
+def test_failed_subsearch_returns_the_rest():
+    tours = [tour("B", 3, 900), tour("C", 20, 800)]
+    backend = PlannedSearchBackend(WindowBackend(tours, fail_from="11.07.2026"), window_days=10)
+    params = TourSearchParams(date_from="01.07.2026", date_to="20.07.2026", max_results=5)
+
+    found = asyncio.run(backend.search_tours(params))
+    assert [t.hotel for t in found] == ["B"]
+    assert backend.failed_subsearches == 1
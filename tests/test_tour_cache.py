@@ -0,0 +1,102 @@
+import asyncio
+import time
+from datetime import date
+
+from fixed_departure_api import Tour, TourSearchParams
+from result_store import TourResultStore
+from search_progress import report_stage
+from singleflight import SingleFlight
+from tour_cache import CachedSearchBackend, TourResultCache
+
+
+class FakeBackend:
+    def __init__(self, tours):
+        self.tours = tours
+        self.calls = 0
+        self.gate = None
+
+    async def search_tours(self, params, on_tour=None):
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return list(self.tours)
+
+    async def close(self):
+        pass
+
+
+def make_tour(price):
+    return Tour(hotel="Hotel", price=price, nights=7, date=date(2026, 7, 1),
+                meal="AI", operator="Op", resort="Kemer", stars=5)
+
+
+def test_stale_hit_refreshes_once(tmp_path):
+    params = TourSearchParams(date_from="01.07.2026", date_to="10.07.2026")
+    store = TourResultStore(str(tmp_path / "tours.db"), fresh_ttl=60, stale_ttl=3600)
+    store.save(params, [make_tour(1000)])
+    # Запись старше fresh_ttl, но моложе stale_ttl
+    conn = store._connect()
+    with conn:
+        conn.execute("UPDATE searches SET updated_at = ?", (time.time() - 120,))
+
+    backend = FakeBackend([make_tour(900)])
+    cached = CachedSearchBackend(backend, TourResultCache(), store=store, flights=SingleFlight())
+
+    async def run():
+        backend.gate = asyncio.Event()
+        try:
+            tours = await cached.search_tours(params)
+            assert [tour.price for tour in tours] == [1000]
+            # Повтор до окончания обновления отвечается из памяти, не дожидаясь обновления
+            tours = await asyncio.wait_for(cached.search_tours(params), timeout=1)
+            assert [tour.price for tour in tours] == [1000]
+            assert store.stale_hits == 1
+        finally:
+            backend.gate.set()
+        await asyncio.gather(*cached._refresh_tasks)
+        tours = await cached.search_tours(params)
+        assert [tour.price for tour in tours] == [900]
+
+    asyncio.run(run())
+    assert backend.calls == 1
+    tours, age = store.load(params)
+    assert [tour.price for tour in tours] == [900]
+    assert age < 60
+
+
+def test_only_complete_results_answer_narrower_queries():
+    broad = TourSearchParams(date_from="01.07.2026", date_to="14.07.2026", max_results=100)
+    narrow = TourSearchParams(date_from="01.07.2026", date_to="07.07.2026", stars=5)
+    cache = TourResultCache()
+
+    # Первая страница выдачи могла не содержать туров, которые нашел бы узкий поиск
+    cache.put(broad, [make_tour(1000)])
+    assert cache.get(narrow) is None
+
+    cache.put(broad, [make_tour(1000)], complete=True)
+    assert [tour.price for tour in cache.get(narrow)] == [1000]
+    assert cache.is_complete(broad)
+    # Своей записи у узкого поиска нет - о его полноте судит только его собственная запись
+    assert not cache.is_complete(narrow)
+    cache.put(narrow, [make_tour(1000)])
+    assert not cache.is_complete(narrow)
+
+
+def test_default_search_answers_filtered_follow_up():
+    # Обычный поиск без max_results, виджет отдал финальную пачку со всеми найденными отелями
+    class ExhaustedBackend(FakeBackend):
+        async def search_tours(self, params, on_tour=None):
+            report_stage("results_exhausted")
+            return await super().search_tours(params, on_tour)
+
+    backend = ExhaustedBackend([make_tour(1000), make_tour(200000)])
+    cached = CachedSearchBackend(backend, TourResultCache(), flights=SingleFlight())
+    broad = TourSearchParams()
+
+    async def run():
+        await cached.search_tours(broad)
+        return await cached.search_tours(TourSearchParams(stars=5, price_max=100000))
+
+    tours = asyncio.run(run())
+    assert [tour.price for tour in tours] == [1000]
+    assert backend.calls == 1
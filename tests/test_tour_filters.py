@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from fixed_departure_api import Tour, TourSearchParams
+from tour_filters import MAX_LIMIT, filter_tours, filtered_callback, refine_tours, validate_view
+
+
+def make_tours(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    return [Tour(hotel=f"H{i}", price=rng.choice([None, 1000, 1500, 2000, rng.randint(500, 5000)]),
+                 rating=rng.choice([None, 4.1, 4.5]), stars=rng.choice([None, 3, 4, 5]))
+            for i in range(count)]
+
+
+@pytest.mark.parametrize("sort_by", ["price", "rating", "stars"])
+def test_top_k_matches_full_sort(sort_by):
+    tours = make_tours(200)
+    full = refine_tours(tours, TourSearchParams(sort_by=sort_by))
+    top = refine_tours(tours, TourSearchParams(sort_by=sort_by, limit=15))
+    # Совпадает с sorted()[:k], включая порядок равных ключей
+    assert [tour.hotel for tour in top] == [tour.hotel for tour in full[:15]]
+
+
+def test_missing_values_go_last():
+    tours = [Tour(hotel="A", price=None, rating=None), Tour(hotel="B", price=900, rating=4.0),
+             Tour(hotel="C", price=500, rating=4.8)]
+    assert [t.hotel for t in refine_tours(tours, TourSearchParams(sort_by="price"))] == ["C", "B", "A"]
+    assert [t.hotel for t in refine_tours(tours, TourSearchParams(sort_by="rating", limit=2))] == ["C", "B"]
+
+
+def test_filters_require_the_field():
+    tours = [Tour(hotel="A", price=1000, stars=5, meal="AI", resort="Кемер"),
+             Tour(hotel="B", price=3000, stars=5, meal="AI", resort="Кемер"),
+             Tour(hotel="C", price=1000, stars=None, meal="AI", resort="Кемер"),
+             Tour(hotel="D", price=1000, stars=4, meal="BB", resort="Кемер"),
+             Tour(hotel="E", price=1000, stars=5, meal="ai", resort="Сиде")]
+    params = TourSearchParams(price_max=2000, stars=4, meal=" AI ", resort="кем")
+    assert [t.hotel for t in filter_tours(tours, params)] == ["A"]
+    assert filter_tours(tours, TourSearchParams(meal="любой")) is tours
+
+
+def test_filtered_callback_forwards_matches_only():
+    seen = []
+    forward = filtered_callback(seen.append, TourSearchParams(price_min=1000))
+    for tour in (Tour(hotel="A", price=900), Tour(hotel="B", price=1000), Tour(hotel="C")):
+        forward(tour)
+    assert [t.hotel for t in seen] == ["B"]
+    assert filtered_callback(seen.append, TourSearchParams()) == seen.append
+
+
+@pytest.mark.parametrize("sort_by, limit", [("name", None), (None, 0), (None, MAX_LIMIT + 1), (None, True), (None, "5")])
+def test_validate_view_rejects(sort_by, limit):
+    with pytest.raises(ValueError):
+        validate_view(sort_by, limit)
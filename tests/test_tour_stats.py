@@ -0,0 +1,41 @@
+from fixed_departure_api import Tour, TourSearchParams
+from tour_model import TourBatch
+from tour_stats import group_stats, percentile, tour_stats, validate_group_by
+
+import pytest
+
+
+def test_percentile_interpolates_like_numpy():
+    assert percentile([], 0.5) is None
+    assert percentile([10], 0.9) == 10
+    assert percentile([10, 20, 30, 40], 0.5) == 25
+    assert percentile([10, 20, 30, 40], 0.9) == pytest.approx(37)
+
+
+def test_group_stats_sorted_by_median_with_unpriced_last():
+    batch = TourBatch([
+        Tour(hotel="A", price=3000, resort="Кемер"),
+        Tour(hotel="B", price=1000, resort="Кемер"),
+        Tour(hotel="C", price=1500, resort="Сиде"),
+        Tour(hotel="D", price=None, resort="Белек"),
+    ])
+    rows = group_stats(batch, "resort")
+    assert [(row["resort"], row["count"], row["min_price"], row["median_price"], row["cheapest_hotel"])
+            for row in rows] == [("Сиде", 1, 1500, 1500, "C"), ("Кемер", 2, 1000, 2000, "B"),
+                                 ("Белек", 1, None, None, None)]
+
+
+def test_tour_stats_total_counts_filtered_tours():
+    tours = [Tour(hotel="A", price=1000, stars=5, operator="TUI"),
+             Tour(hotel="B", price=2000, stars=5, operator="Anex"),
+             Tour(hotel="C", price=500, stars=3, operator="TUI")]
+    stats = tour_stats(tours, TourSearchParams(stars=5, limit=1), "operator")
+    assert stats["count"] == stats["total"] == 2
+    assert stats["group_count"] == 2
+    assert [row["operator"] for row in stats["groups"]] == ["TUI"]
+
+
+def test_validate_group_by():
+    assert validate_group_by(None) == "resort"
+    with pytest.raises(ValueError):
+        validate_group_by("price")
@@ -0,0 +1,64 @@
+from datetime import date
+
+from tourvisor_json import ListingTracker, decode_body, hotels_found, parse_result_payload, search_state
+
+
+def payload(hotels, state="searching", found=None):
+    status = {"state": state}
+    if found is not None:
+        status["hotelsfound"] = found
+    return {"data": {"status": status, "result": {"hotel": hotels}}}
+
+
+def test_listing_complete_after_final_batch_with_all_hotels():
+    listing = ListingTracker()
+    listing.update(payload([{"hotelcode": 1}], found=2))
+    assert not listing.complete
+    listing.update(payload([{"hotelcode": 2}], state="finished", found=2))
+    assert listing.complete
+
+
+def test_listing_incomplete_when_finished_batch_holds_first_page():
+    listing = ListingTracker()
+    listing.update(payload([{"hotelcode": 1}, {"hotelcode": 2}], state="finished", found=40))
+    assert not listing.complete
+    # Без hotelsfound полноту не узнать
+    listing = ListingTracker()
+    listing.update(payload([{"hotelcode": 1}], state="finished"))
+    assert not listing.complete
+
+
+def test_decode_body_accepts_json_and_jsonp():
+    assert decode_body('{"a": 1}') == {"a": 1}
+    assert decode_body(' jQuery123_456({"data": {"a": 1}});\n') == {"data": {"a": 1}}
+    assert decode_body("[1, 2]") is None
+    assert decode_body("<html></html>") is None
+    assert decode_body("cb({broken);") is None
+    assert decode_body("   ") is None
+
+
+def test_search_state_and_hotels_found():
+    status = payload([], state="finished", found="12")
+    assert search_state(status) == "finished" and hotels_found(status) == 12
+    # Без обертки data и без статуса
+    assert search_state({"status": {"state": "searching"}}) == "searching"
+    assert search_state({"data": {"result": {}}}) is None and hotels_found({"data": {}}) is None
+
+
+def test_parse_result_payload_fields():
+    hotel = {"hotelcode": 7, "hotelname": "Sea Club", "hotelstars": "5", "hotelrating": "0",
+             "regionname": "Кемер", "countryname": "Турция",
+             "tours": {"tour": {"tourid": 99, "price": "123 456", "currency": "usd", "nights": "7",
+                                "flydate": "01.07.2026", "meal": "ai", "operatorname": "TUI"}}}
+    other = {"hotelcode": 8, "hotelname": "Park",
+             "tours": [{"price": 50000, "flydate": "02.07.2026", "nights": 10, "meal": "XX", "mealrussian": "Особое"}]}
+    records = parse_result_payload(payload([hotel, other, "junk"]), country="Египет")
+    assert records[0] == {
+        "key": "99", "hotel": "Sea Club", "price": 123456, "currency": "USD", "nights": 7,
+        "date": date(2026, 7, 1), "date_to": date(2026, 7, 8), "meal": "All Inclusive", "operator": "TUI",
+        "resort": "Кемер", "stars": 5.0, "rating": None, "country": "Турция"
+    }
+    # Без tourid ключ собирается из полей тура, страна - из запроса
+    assert records[1]["key"] == str((8, "02.07.2026", 10, None, "XX", 50000))
+    assert (records[1]["meal"], records[1]["country"], records[1]["stars"]) == ("Особое", "Египет", None)
+    assert parse_result_payload({"data": {"status": {"state": "searching"}}}) == []
@@ -0,0 +1,375 @@
+"""
+Кэш результатов поиска туров в памяти процесса
+Ключ строится из нормализованных TourSearchParams, записи живут TTL секунд, лишние вытесняются по LRU.
+Запрос, который только сужает уже выполненный поиск (те же страна, город и состав, даты и ночи внутри,
+фильтры строже), отвечается фильтрацией закэшированных туров - если тот поиск получил выдачу целиком.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import fields
+from enum import Enum
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fixed_departure_api import VIEW_FIELDS, Tour, TourCallback, TourSearchParams
+from search_progress import track_stages
+from singleflight import SingleFlight, get_single_flight
+from tour_filters import ANY_VALUE, tour_predicate
+from tour_model import parse_date
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# result: hit, subsumption (ответ сужением более широкого поиска) или miss
+CACHE_LOOKUPS = get_metrics().counter("tourvisor_cache_lookups_total", "Обращения к кэшу результатов", ["result"])
+
+
+def normalize_value(value: Any) -> Any:
+    """Enum и строки приводятся к одному виду: Country.TURKEY == 'Турция' == ' турция '"""
+    if isinstance(value, Enum):
+        value = value.value
+    if isinstance(value, str):
+        return " ".join(value.split()).lower().replace('ё', 'е')
+    return value
+
+
+def cache_key(params: TourSearchParams) -> str:
+    """Канонический ключ поиска (сортировка и limit результата на него не влияют)"""
+    normalized = {f.name: normalize_value(getattr(params, f.name))
+                  for f in fields(params) if f.name not in VIEW_FIELDS}
+    return json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+
+
+# Поля, которые у сужающего запроса должны совпадать с закэшированным
+ROUTE_FIELDS = ("country", "departure", "adults", "children")
+
+
+def route_key(params: TourSearchParams) -> Tuple[Any, ...]:
+    return tuple(normalize_value(getattr(params, name)) for name in ROUTE_FIELDS)
+
+
+def _is_any(value: Optional[str]) -> bool:
+    return not value or normalize_value(value) == ANY_VALUE
+
+
+def covers(broad: TourSearchParams, params: TourSearchParams) -> bool:
+    """
+    Поиск params - сужение поиска broad: полная выдача broad содержит все его туры
+    Сайт обрезает выдачу до первой страницы, поэтому сужать можно только выдачу, полученную целиком.
+    """
+    if route_key(broad) != route_key(params):
+        return False
+    broad_from, broad_to = parse_date(broad.date_from), parse_date(broad.date_to)
+    date_from, date_to = parse_date(params.date_from), parse_date(params.date_to)
+    if None in (broad_from, broad_to, date_from, date_to):
+        if (broad.date_from, broad.date_to) != (params.date_from, params.date_to):
+            return False
+    elif not broad_from <= date_from <= date_to <= broad_to:
+        return False
+    if not broad.nights_from <= params.nights_from <= params.nights_to <= broad.nights_to:
+        return False
+
+    # Нижние границы: у широкого поиска нет ограничения или оно не строже
+    for name in ("price_min", "stars"):
+        limit = getattr(broad, name)
+        if limit is not None and (getattr(params, name) is None or getattr(params, name) < limit):
+            return False
+    if broad.price_max is not None and (params.price_max is None or params.price_max > broad.price_max):
+        return False
+    if not _is_any(broad.meal) and normalize_value(broad.meal) != normalize_value(params.meal):
+        return False
+    # Фильтр курорта - по подстроке: "бел" покрывает "белек"
+    if not _is_any(broad.resort) and (_is_any(params.resort) or
+                                      normalize_value(broad.resort) not in normalize_value(params.resort)):
+        return False
+    return True
+
+
+def narrow_tours(tours: List[Tour], broad: TourSearchParams, params: TourSearchParams) -> List[Tour]:
+    """Туры широкого поиска broad, подходящие под params"""
+    matches = tour_predicate(params)
+    if (broad.date_from, broad.date_to) != (params.date_from, params.date_to):
+        date_from, date_to = parse_date(params.date_from), parse_date(params.date_to)
+        tours = [tour for tour in tours if tour.date is not None and date_from <= tour.date <= date_to]
+    if (broad.nights_from, broad.nights_to) != (params.nights_from, params.nights_to):
+        tours = [tour for tour in tours
+                 if tour.nights is not None and params.nights_from <= tour.nights <= params.nights_to]
+    if matches is not None:
+        tours = [tour for tour in tours if matches(tour)]
+    tours = list(tours)
+    return tours[:params.max_results] if params.max_results else tours
+
+
+class TourResultCache:
+    def __init__(self, ttl: float = 900.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (expires_at, tours, params, complete); порядок OrderedDict - от давно использованных к недавним.
+        # complete - выдача получена целиком (а не только первая страница): только такие записи сужаются
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # route_key -> ключи записей этого маршрута (кандидаты для сужающих запросов)
+        self._routes: Dict[Tuple[Any, ...], Set[str]] = {}
+        # Flask обслуживает запросы в разных потоках
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.subsumption_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, params: TourSearchParams) -> Optional[List[Tour]]:
+        key = cache_key(params)
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.inc(result="hit")
+                return list(entry[1])
+            broad = self._find_broader(params)
+            if broad is not None:
+                broad_key, (_, tours, broad_params, _) = broad
+                self._entries.move_to_end(broad_key)
+                self.subsumption_hits += 1
+                CACHE_LOOKUPS.inc(result="subsumption")
+                return narrow_tours(tours, broad_params, params)
+            self.misses += 1
+            CACHE_LOOKUPS.inc(result="miss")
+            return None
+
+    def ttl_left(self, params: TourSearchParams) -> Optional[float]:
+        """Сколько секунд еще живет запись именно этого поиска (None - записи нет), без учета в статистике"""
+        with self._lock:
+            entry = self._entries.get(cache_key(params))
+            return entry[0] - time.monotonic() if entry is not None and entry[0] > time.monotonic() else None
+
+    def contains(self, params: TourSearchParams) -> bool:
+        """Ответит ли get() из кэша (точно или сужением), без учета в статистике и LRU"""
+        with self._lock:
+            return self._live_entry(cache_key(params)) is not None or self._find_broader(params) is not None
+
+    def is_complete(self, params: TourSearchParams) -> bool:
+        """Получена ли целиком выдача, записанная под ключом самого params (без учета в статистике)"""
+        with self._lock:
+            entry = self._live_entry(cache_key(params))
+            return entry is not None and entry[3]
+
+    def _live_entry(self, key: str) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _find_broader(self, params: TourSearchParams) -> Optional[Tuple[str, tuple]]:
+        # Из нескольких подходящих берется самый узкий (меньше туров фильтровать)
+        found = None
+        for key in list(self._routes.get(route_key(params), ())):
+            entry = self._live_entry(key)
+            if (entry is not None and entry[3] and covers(entry[2], params)
+                    and (found is None or len(entry[1]) < len(found[1][1]))):
+                found = (key, entry)
+        return found
+
+    def _drop(self, key: str):
+        _, _, params, _ = self._entries.pop(key)
+        route = route_key(params)
+        keys = self._routes.get(route)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._routes[route]
+
+    def put(self, params: TourSearchParams, tours: List[Tour], ttl: Optional[float] = None, complete: bool = False):
+        key = cache_key(params)
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, list(tours), params, complete)
+            self._entries.move_to_end(key)
+            self._routes.setdefault(route_key(params), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._routes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.hits + self.subsumption_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "subsumption_hits": self.subsumption_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+class TourBroadcast:
+    """Туры выполняющегося поиска для всех, кто ждет его через single-flight"""
+
+    def __init__(self):
+        self.tours: List[Tour] = []
+        self.listeners: List[TourCallback] = []
+
+    def emit(self, tour: Tour):
+        self.tours.append(tour)
+        for listener in list(self.listeners):
+            try:
+                listener(tour)
+            except Exception as e:
+                # Ошибка одного подписчика не должна прерывать общий поиск
+                logger.warning(f"⚠️ Подписчик потока туров упал: {e}")
+
+    def subscribe(self, listener: TourCallback):
+        """Подключившийся позже сначала получает уже найденные туры"""
+        for tour in list(self.tours):
+            listener(tour)
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: TourCallback):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+
+class CachedSearchBackend:
+    """Бэкенд поиска с кэшем в памяти и (опционально) хранилищем SQLite перед ним"""
+
+    def __init__(self, backend, cache: TourResultCache, store=None,
+                 flights: Optional[SingleFlight] = None, query_log=None, stale_cache_ttl: float = 60.0):
+        self.backend = backend
+        self.cache = cache
+        self.store = store
+        # Сколько секунд устаревший ответ хранилища отдается из памяти, пока идет фоновое обновление
+        self.stale_cache_ttl = stale_cache_ttl
+        # Журнал запросов для упреждающего обновления (prefetch.py); обновления в обход кэша в него не попадают
+        self.query_log = query_log
+        # Одинаковые одновременные промахи кэша выполняются одним поиском
+        self.flights = flights or get_single_flight()
+        self._refresh_tasks = set()
+        # Ключ поиска -> поток найденных туров, чтобы ожидающие через single-flight тоже получали их сразу
+        self._broadcasts: Dict[str, TourBroadcast] = {}
+
+    async def search_tours(self, params: TourSearchParams, on_tour: Optional[TourCallback] = None) -> List[Tour]:
+        if self.query_log is not None:
+            self.query_log.record(params)
+        tours = self.cache.get(params)
+        if tours is not None:
+            if on_tour:
+                for tour in tours:
+                    on_tour(tour)
+            return tours
+
+        key = cache_key(params)
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None:
+            broadcast = self._broadcasts[key] = TourBroadcast()
+        delivered = []
+
+        def listener(tour: Tour):
+            delivered.append(tour)
+            on_tour(tour)
+
+        if on_tour:
+            broadcast.subscribe(listener)
+        try:
+            tours = await self.flights.do(key, lambda: self._load_or_search(params, broadcast.emit))
+        finally:
+            broadcast.unsubscribe(listener)
+            if not broadcast.listeners and self._broadcasts.get(key) is broadcast:
+                del self._broadcasts[key]
+
+        # Присоединились к поиску без потока (например, к фоновому обновлению) - отдаем итог целиком
+        if on_tour and not delivered:
+            for tour in tours:
+                on_tour(tour)
+        # У каждого ожидающего свой список
+        return list(tours)
+
+    async def _load_or_search(self, params: TourSearchParams,
+                              on_tour: Optional[TourCallback] = None) -> List[Tour]:
+        if self.store is not None:
+            stored = await asyncio.to_thread(self.store.load, params)
+            if stored is not None:
+                tours, age = stored
+                if on_tour:
+                    for tour in tours:
+                        on_tour(tour)
+                if age < self.store.fresh_ttl:
+                    self.cache.put(params, tours, ttl=min(self.cache.ttl, self.store.fresh_ttl - age))
+                else:
+                    # stale-while-revalidate: отвечаем сразу, свежие данные подтянутся в фоне.
+                    # Короткая запись в памяти избавляет повторные запросы от чтения SQLite;
+                    # обновление ее перезапишет, а при сбое обновления она истечет и запустит новое
+                    self.cache.put(params, tours, ttl=min(self.cache.ttl, self.stale_cache_ttl))
+                    self._schedule_refresh(params)
+                return tours
+
+        return await self.refresh(params, on_tour)
+
+    async def refresh(self, params: TourSearchParams, on_tour: Optional[TourCallback] = None) -> List[Tour]:
+        """Поиск в обход кэша с сохранением результата"""
+        complete = False
+
+        def on_stage(stage: str):
+            nonlocal complete
+            complete = complete or stage == "results_exhausted"
+
+        with track_stages(on_stage):
+            tours = await self.backend.search_tours(params, on_tour)
+        # Пустой ответ чаще означает сбой страницы, чем отсутствие туров - не кэшируем
+        if tours:
+            # Хранилище полноту выдачи не помнит: поднятые из него записи сужающим запросам не отвечают
+            self.cache.put(params, tours, complete=complete)
+            if self.store is not None:
+                await asyncio.to_thread(self.store.save, params, tours)
+        return tours
+
+    def _schedule_refresh(self, params: TourSearchParams):
+        if not self.store.claim_refresh(params):
+            return
+        task = asyncio.create_task(self._refresh_in_background(params))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh_in_background(self, params: TourSearchParams):
+        try:
+            await self.flights.do(cache_key(params), lambda: self.refresh(params))
+        except Exception as e:
+            logger.warning(f"⚠️ Фоновое обновление поиска не удалось: {e}")
+        finally:
+            self.store.release_refresh(params)
+
+    async def close(self):
+        # Бэкенд нужен фоновым обновлениям до их завершения
+        if self._refresh_tasks:
+            await asyncio.gather(*self._refresh_tasks, return_exceptions=True)
+        await self.backend.close()
+
+
+_shared_cache: Optional[TourResultCache] = None
+
+
+def get_result_cache() -> TourResultCache:
+    """Общий на процесс кэш (TTL и размер - из переменных окружения)"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = TourResultCache(
+            ttl=float(os.environ.get("TOURVISOR_CACHE_TTL", "900")),
+            max_entries=int(os.environ.get("TOURVISOR_CACHE_SIZE", "256"))
+        )
+    return _shared_cache
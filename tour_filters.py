@@ -0,0 +1,101 @@
+"""
+Отбор результатов поиска на сервере
+Фильтры берутся из TourSearchParams (price_min/price_max, stars, meal, resort), затем сортировка sort_by
+и limit: "10 самых дешевых пятизвездочных" - это 10 туров в ответе, а не 300, отфильтрованных клиентом.
+"""
+
+import heapq
+from typing import Callable, List, Optional
+
+from fixed_departure_api import Tour, TourCallback, TourSearchParams
+
+# Поле сортировки -> направление (True - по убыванию): дешевые первыми, лучшие рейтинг и звезды первыми
+SORT_FIELDS = {"price": False, "rating": True, "stars": True}
+
+# Значение meal/resort, означающее "без ограничения"
+ANY_VALUE = "любой"
+
+MAX_LIMIT = 1000
+
+TourPredicate = Callable[[Tour], bool]
+
+
+def validate_view(sort_by: Optional[str], limit: Optional[int]):
+    """ValueError для неизвестной сортировки или limit вне 1..MAX_LIMIT"""
+    if sort_by is not None and sort_by not in SORT_FIELDS:
+        raise ValueError(f"sort_by must be one of: {', '.join(SORT_FIELDS)}")
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= MAX_LIMIT):
+        raise ValueError(f"limit must be an integer from 1 to {MAX_LIMIT}")
+
+
+def _is_any(value: Optional[str]) -> bool:
+    return not value or value.strip().lower() == ANY_VALUE
+
+
+def tour_predicate(params: TourSearchParams) -> Optional[TourPredicate]:
+    """Проверка тура по фильтрам params (None - фильтров нет). Тур без нужного поля не проходит"""
+    checks: List[TourPredicate] = []
+    if params.price_min is not None:
+        price_min = params.price_min
+        checks.append(lambda tour: tour.price is not None and tour.price >= price_min)
+    if params.price_max is not None:
+        price_max = params.price_max
+        checks.append(lambda tour: tour.price is not None and tour.price <= price_max)
+    if params.stars is not None:
+        # Как в форме TourVisor: звезд не меньше указанного
+        stars = params.stars
+        checks.append(lambda tour: tour.stars is not None and tour.stars >= stars)
+    if not _is_any(params.meal):
+        meal = params.meal.strip().lower()
+        checks.append(lambda tour: tour.meal is not None and tour.meal.lower() == meal)
+    if not _is_any(params.resort):
+        resort = params.resort.strip().lower()
+        checks.append(lambda tour: tour.resort is not None and resort in tour.resort.lower())
+
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    return lambda tour: all(check(tour) for check in checks)
+
+
+def filtered_callback(on_tour: Optional[TourCallback], params: TourSearchParams) -> Optional[TourCallback]:
+    """on_tour, который получает только туры, проходящие фильтры"""
+    matches = tour_predicate(params)
+    if on_tour is None or matches is None:
+        return on_tour
+
+    def forward(tour: Tour):
+        if matches(tour):
+            on_tour(tour)
+
+    return forward
+
+
+def _sort_key(field: str, descending: bool):
+    # Туры без значения - в конце при любом направлении
+    if descending:
+        return lambda tour: (getattr(tour, field) is None, -(getattr(tour, field) or 0))
+    return lambda tour: (getattr(tour, field) is None, getattr(tour, field) or 0)
+
+
+def filter_tours(tours: List[Tour], params: TourSearchParams) -> List[Tour]:
+    """Только фильтры params, без сортировки и limit"""
+    matches = tour_predicate(params)
+    return [tour for tour in tours if matches(tour)] if matches is not None else tours
+
+
+def order_tours(tours: List[Tour], params: TourSearchParams) -> List[Tour]:
+    """Сортировка и limit уже отфильтрованных туров; при limit и сортировке - частичная сортировка через кучу (top-k)"""
+    if params.sort_by:
+        key = _sort_key(params.sort_by, SORT_FIELDS[params.sort_by])
+        if params.limit and params.limit < len(tours):
+            # nsmallest стабилен, как sorted: при равных ключах сохраняется порядок выдачи
+            return heapq.nsmallest(params.limit, tours, key=key)
+        return sorted(tours, key=key)
+    return tours[:params.limit] if params.limit else tours
+
+
+def refine_tours(tours: List[Tour], params: TourSearchParams) -> List[Tour]:
+    """Фильтры, сортировка и limit"""
+    return order_tours(filter_tours(tours, params), params)
@@ -0,0 +1,65 @@
+"""
+Представление тура: подписи для консоли и JSON ответов API
+Модель (tour_model) хранит типизированные значения, строки собираются только здесь.
+"""
+
+import datetime
+from typing import Any, Dict, Optional
+
+from tour_model import DATE_FORMAT, Tour
+
+# Код валюты -> подпись в выводе
+CURRENCY_LABELS = {"RUB": "руб", "USD": "$", "EUR": "€"}
+
+
+def format_date(value: Optional[datetime.date]) -> Optional[str]:
+    return value.strftime(DATE_FORMAT) if value else None
+
+
+def format_price(tour: Tour) -> Optional[str]:
+    if tour.price is None:
+        return None
+    return f"{tour.price:,} {CURRENCY_LABELS.get(tour.currency, tour.currency)}".replace(",", " ")
+
+
+def format_number(value: Optional[float]) -> Optional[str]:
+    """4.0 -> "4", 4.5 -> "4.5" """
+    if value is None:
+        return None
+    return f"{value:g}"
+
+
+def tour_json(tour: Tour) -> Dict[str, Any]:
+    """Tour -> JSON ответа API (числа - числами, даты - ДД.ММ.ГГГГ, нет значения - null)"""
+    return {
+        "hotel": tour.hotel,
+        "price": tour.price,
+        "currency": tour.currency,
+        "stars": tour.stars,
+        "resort": tour.resort,
+        "rating": tour.rating,
+        "nights": tour.nights,
+        "date_from": format_date(tour.date),
+        "date_to": format_date(tour.date_to),
+        "meal": tour.meal,
+        "operator": tour.operator,
+        "country": tour.country
+    }
+
+
+def print_tour(tour: Tour):
+    print(f"🏨 {tour.hotel or 'Отель не указан'}")
+    if tour.stars is not None:
+        print(f"⭐ {format_number(tour.stars)}★")
+    if tour.resort:
+        print(f"🏖️ {tour.resort}")
+    if tour.rating is not None:
+        print(f"📊 Рейтинг: {format_number(tour.rating)}⭐")
+    if tour.price is not None:
+        print(f"💰 Цена: {format_price(tour)}")
+    if tour.nights is not None:
+        print(f"🌙 Ночей: {tour.nights}")
+    if tour.date:
+        print(f"📅 Дата: {format_date(tour.date)}")
+    if tour.meal:
+        print(f"🍽️ Питание: {tour.meal}")
@@ -0,0 +1,140 @@
+"""
+Модель тура
+Поля типизированы: цена и ночи - int, звезды и рейтинг - float, даты - datetime.date, отсутствующее
+значение - None. Подписи вида "125000 руб" и "4.5★" собирает только слой представления (tour_format).
+"""
+
+import datetime
+import re
+from dataclasses import dataclass, fields
+from typing import Any, Iterable, Iterator, List, Optional
+
+DATE_FORMAT = "%d.%m.%Y"
+
+DEFAULT_CURRENCY = "RUB"
+
+# Обозначения валют на сайте и в ответах TourVisor -> код ISO
+CURRENCY_CODES = {"руб": "RUB", "₽": "RUB", "rur": "RUB", "$": "USD", "€": "EUR", "eur": "EUR", "usd": "USD"}
+
+
+@dataclass(slots=True)
+class Tour:
+    hotel: Optional[str] = None
+    price: Optional[int] = None
+    nights: Optional[int] = None
+    date: Optional[datetime.date] = None
+    date_to: Optional[datetime.date] = None
+    meal: Optional[str] = None
+    operator: Optional[str] = None
+    resort: Optional[str] = None
+    stars: Optional[float] = None
+    rating: Optional[float] = None
+    country: Optional[str] = None
+    currency: str = DEFAULT_CURRENCY
+
+
+# Порядок полей Tour (позиционный конструктор, столбцы TourBatch и хранилища)
+TOUR_FIELDS = tuple(f.name for f in fields(Tour))
+
+
+def parse_int(value: Any) -> Optional[int]:
+    """125000, "125 000", "125000.0" -> 125000; пусто и мусор -> None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().replace(" ", "").replace("\xa0", "")
+    try:
+        return int(float(text))
+    except ValueError:
+        digits = re.sub(r"\D", "", text)
+        return int(digits) if digits else None
+
+
+def parse_float(value: Any) -> Optional[float]:
+    """4.5, "4,5" -> 4.5; пусто и мусор -> None"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(str(value).strip().replace(",", "."))
+    except ValueError:
+        return None
+
+
+def parse_date(value: Any) -> Optional[datetime.date]:
+    """date или "ДД.ММ.ГГГГ" -> date; иначе None"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.datetime.strptime(str(value).strip(), DATE_FORMAT).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_currency(value: Any) -> str:
+    text = str(value or "").strip()
+    if not text:
+        return DEFAULT_CURRENCY
+    return CURRENCY_CODES.get(text.lower(), text.upper())
+
+
+class TourBatch:
+    """
+    Много туров в виде параллельных массивов: по списку на поле Tour, i-й тур - i-е элементы списков.
+    Сортировка, фильтры и агрегаты проходят по одному столбцу, не трогая остальные.
+    """
+
+    __slots__ = TOUR_FIELDS
+
+    def __init__(self, tours: Iterable[Tour] = ()):
+        for name in TOUR_FIELDS:
+            setattr(self, name, [])
+        self.extend(tours)
+
+    @classmethod
+    def from_columns(cls, **columns: List[Any]) -> "TourBatch":
+        batch = cls()
+        for name in TOUR_FIELDS:
+            setattr(batch, name, list(columns[name]))
+        return batch
+
+    def append(self, tour: Tour):
+        for name in TOUR_FIELDS:
+            getattr(self, name).append(getattr(tour, name))
+
+    def extend(self, tours: Iterable[Tour]):
+        for tour in tours:
+            self.append(tour)
+
+    def __len__(self) -> int:
+        return len(self.hotel)
+
+    def __getitem__(self, index: int) -> Tour:
+        return Tour(*(getattr(self, name)[index] for name in TOUR_FIELDS))
+
+    def __iter__(self) -> Iterator[Tour]:
+        for row in zip(*(getattr(self, name) for name in TOUR_FIELDS)):
+            yield Tour(*row)
+
+    def column(self, name: str) -> List[Any]:
+        if name not in TOUR_FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def take(self, indices: Iterable[int]) -> "TourBatch":
+        """Новый пакет из туров с данными номерами (в этом порядке)"""
+        indices = list(indices)
+        columns = {name: [getattr(self, name)[i] for i in indices] for name in TOUR_FIELDS}
+        return TourBatch.from_columns(**columns)
+
+    def order(self, name: str, reverse: bool = False) -> List[int]:
+        """Номера туров по возрастанию (убыванию) поля; туры без значения - в конце"""
+        values = self.column(name)
+        present = [i for i, value in enumerate(values) if value is not None]
+        present.sort(key=values.__getitem__, reverse=reverse)
+        return present + [i for i, value in enumerate(values) if value is None]
+
+    def tours(self) -> List[Tour]:
+        return list(self)
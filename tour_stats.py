@@ -0,0 +1,89 @@
+"""
+Сводная статистика по результатам поиска
+Вместо сотен туров клиент получает по строке на группу (курорт, оператор, питание...):
+число туров, минимальная, медианная и 90-я перцентиль цены, самый дешевый отель.
+Считается по столбцам TourBatch: цена и поле группы проходятся один раз, без обхода объектов Tour.
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+from fixed_departure_api import Tour, TourSearchParams
+from tour_filters import tour_predicate
+from tour_model import TourBatch
+
+# Поля, по которым можно группировать
+GROUP_FIELDS = ("resort", "operator", "meal", "stars", "nights", "hotel")
+
+DEFAULT_GROUP_BY = "resort"
+
+
+def validate_group_by(group_by: Optional[str]) -> str:
+    group_by = group_by or DEFAULT_GROUP_BY
+    if group_by not in GROUP_FIELDS:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUP_FIELDS)}")
+    return group_by
+
+
+def percentile(ordered: Sequence[int], q: float) -> Optional[float]:
+    """Перцентиль отсортированного ряда с линейной интерполяцией (как numpy.percentile по умолчанию)"""
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _price_summary(ordered: Sequence[int]) -> Dict[str, Any]:
+    median = percentile(ordered, 0.5)
+    p90 = percentile(ordered, 0.9)
+    return {
+        "min_price": ordered[0] if ordered else None,
+        "median_price": round(median) if median is not None else None,
+        "p90_price": round(p90) if p90 is not None else None
+    }
+
+
+def group_stats(batch: TourBatch, group_by: str) -> List[Dict[str, Any]]:
+    """Строка на каждое значение поля group_by; группы - от самой дешевой медианы к самой дорогой"""
+    prices = batch.price
+    hotels = batch.hotel
+    groups: Dict[Any, List[int]] = {}
+    for index, value in enumerate(batch.column(group_by)):
+        groups.setdefault(value, []).append(index)
+
+    rows = []
+    for value, indices in groups.items():
+        priced = [i for i in indices if prices[i] is not None]
+        cheapest = min(priced, key=prices.__getitem__) if priced else None
+        rows.append({
+            group_by: value,
+            "count": len(indices),
+            **_price_summary(sorted(prices[i] for i in priced)),
+            "cheapest_hotel": hotels[cheapest] if cheapest is not None else None
+        })
+    # Группы без цен - в конце
+    rows.sort(key=lambda row: (row["median_price"] is None, row["median_price"] or 0))
+    return rows
+
+
+def tour_stats(tours: List[Tour], params: TourSearchParams, group_by: str) -> Dict[str, Any]:
+    """
+    Статистика по турам, прошедшим фильтры params; limit ограничивает число групп в ответе
+    (сортировка туров sort_by здесь не нужна). total, как и у поиска, - число туров, прошедших фильтры
+    """
+    matches = tour_predicate(params)
+    batch = TourBatch(tour for tour in tours if matches is None or matches(tour))
+    groups = group_stats(batch, group_by)
+    priced = sorted(price for price in batch.price if price is not None)
+    currencies = sorted(set(batch.currency))
+    return {
+        "group_by": group_by,
+        "count": len(batch),
+        "total": len(batch),
+        "currency": currencies[0] if len(currencies) == 1 else (currencies or None),
+        **_price_summary(priced),
+        "group_count": len(groups),
+        "groups": groups[:params.limit] if params.limit else groups
+    }
@@ -0,0 +1,192 @@
+"""
+Разбор JSON-ответов TourVisor
+Виджет eto.travel сам запрашивает у TourVisor статус поиска и пачки результатов.
+Эти ответы можно перехватить и превратить в туры без разбора DOM.
+"""
+
+import asyncio
+import json
+import logging
+import re
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from tour_model import parse_currency, parse_date, parse_float, parse_int
+
+logger = logging.getLogger(__name__)
+
+# Признаки ответов TourVisor с результатами поиска
+RESULT_URL_PATTERN = re.compile(r'tourvisor\.ru/.*(result|search)', re.IGNORECASE)
+
+# JSONP: callback({...});
+JSONP_PATTERN = re.compile(r'^\s*[\w$.]+\s*\(\s*(.*)\s*\)\s*;?\s*$', re.DOTALL)
+
+# Коды питания TourVisor -> подписи, которые отдает DOM-парсер
+MEAL_LABELS = {
+    "UAI": "Ultra All Inclusive",
+    "AI": "All Inclusive",
+    "FB": "Full Board",
+    "HB": "Half Board",
+    "BB": "Bed & Breakfast",
+    "RO": "Room Only",
+}
+
+
+def decode_body(body: str) -> Optional[Dict[str, Any]]:
+    """JSON или JSONP -> dict (None, если это не JSON)"""
+    body = body.strip()
+    if not body:
+        return None
+    if body[0] not in '{[':
+        match = JSONP_PATTERN.match(body)
+        if not match:
+            return None
+        body = match.group(1)
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def search_state(payload: Dict[str, Any]) -> Optional[str]:
+    """Состояние поиска: 'searching', 'finished' или None, если статуса нет"""
+    data = payload.get("data", payload)
+    status = data.get("status") if isinstance(data, dict) else None
+    if isinstance(status, dict):
+        return status.get("state")
+    return None
+
+
+def hotels_found(payload: Dict[str, Any]) -> Optional[int]:
+    """Сколько отелей нашел поиск по статусу TourVisor (None, если статуса нет)"""
+    data = payload.get("data", payload)
+    status = data.get("status") if isinstance(data, dict) else None
+    return parse_int(status.get("hotelsfound")) if isinstance(status, dict) else None
+
+
+def _as_list(value) -> List[Any]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def parse_result_payload(payload: Dict[str, Any], country: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Пачка результатов -> список полей Tour (по записи на каждый тур каждого отеля)"""
+    data = payload.get("data", payload)
+    result = data.get("result") if isinstance(data, dict) else None
+    if not isinstance(result, dict):
+        return []
+
+    records = []
+    for hotel in _as_list(result.get("hotel")):
+        if not isinstance(hotel, dict):
+            continue
+        tours = hotel.get("tours")
+        if isinstance(tours, dict):
+            tours = tours.get("tour")
+        for tour in _as_list(tours):
+            if not isinstance(tour, dict):
+                continue
+            price = parse_int(tour.get("price"))
+            nights = parse_int(tour.get("nights"))
+            flydate = parse_date(tour.get("flydate"))
+            meal = str(tour.get("meal") or '').upper()
+            stars = parse_float(hotel.get("hotelstars"))
+            # Рейтинг 0 у TourVisor означает "нет оценок"
+            rating = parse_float(hotel.get("hotelrating"))
+            records.append({
+                "key": str(tour.get("tourid") or (hotel.get("hotelcode"), tour.get("flydate"), nights,
+                                                  tour.get("operatorcode"), meal, price)),
+                "hotel": hotel.get("hotelname") or None,
+                "price": price or None,
+                "currency": parse_currency(tour.get("currency")),
+                "nights": nights or None,
+                "date": flydate,
+                "date_to": flydate + timedelta(days=nights) if flydate and nights else None,
+                "meal": MEAL_LABELS.get(meal, tour.get("mealrussian") or None),
+                "operator": tour.get("operatorname") or None,
+                "resort": hotel.get("regionname") or None,
+                "stars": stars or None,
+                "rating": rating or None,
+                "country": hotel.get("countryname") or country
+            })
+    return records
+
+
+class ListingTracker:
+    """Полнота выдачи по пачкам JSON: поиск завершен и пришли все найденные им отели"""
+
+    def __init__(self):
+        self.hotels: Set[str] = set()
+        self.hotels_found: Optional[int] = None
+        self.finished = False
+
+    def update(self, payload: Dict[str, Any]):
+        data = payload.get("data", payload)
+        result = data.get("result") if isinstance(data, dict) else None
+        if isinstance(result, dict):
+            for hotel in _as_list(result.get("hotel")):
+                if isinstance(hotel, dict):
+                    self.hotels.add(str(hotel.get("hotelcode") or hotel.get("hotelname")))
+        found = hotels_found(payload)
+        if found is not None:
+            self.hotels_found = found
+        if search_state(payload) == "finished":
+            self.finished = True
+
+    @property
+    def complete(self) -> bool:
+        return self.finished and self.hotels_found is not None and len(self.hotels) >= self.hotels_found
+
+
+class ResultCapture:
+    """Слушает ответы страницы и копит туры из JSON TourVisor"""
+
+    def __init__(self, page, country: Optional[str] = None,
+                 on_record: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.page = page
+        self.country = country
+        # Вызывается для каждого нового тура сразу по приходу пачки
+        self.on_record = on_record
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.listing = ListingTracker()
+        self.responses = 0
+        self.finished = asyncio.Event()
+        page.on("response", self._on_response)
+
+    async def _on_response(self, response):
+        if not RESULT_URL_PATTERN.search(response.url):
+            return
+        try:
+            payload = decode_body(await response.text())
+        except Exception:
+            return
+        if payload is None:
+            return
+        self.responses += 1
+        # Пачки могут быть как накопительными, так и частичными - склеиваем по ключу тура
+        for record in parse_result_payload(payload, self.country):
+            key = record.pop("key")
+            is_new = key not in self.records
+            self.records[key] = record
+            if is_new and self.on_record:
+                self.on_record(dict(record))
+        self.listing.update(payload)
+        if search_state(payload) == "finished":
+            self.finished.set()
+
+    async def wait_finished(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.finished.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def tour_fields(self) -> List[Dict[str, Any]]:
+        return list(self.records.values())
+
+    def detach(self):
+        self.page.remove_listener("response", self._on_response)
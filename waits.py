@@ -0,0 +1,165 @@
+"""
+Ожидания для FixedTourvisorAPI
+Вместо фиксированных пауз ждем реальных условий на странице: видимости элементов,
+стабилизации #TVResultPanel и тишины в сети. У каждого условия есть предельный срок.
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Карточки туров в выдаче TourVisor
+RESULT_CARD_SELECTOR = '.TVSHotelResultItem, .TVResultListViewItem'
+
+# Проверка в браузере: число карточек не меняется stableMs миллисекунд
+JS_RESULTS_STABLE = '''
+([selector, stableMs]) => {
+    const panel = document.getElementById('TVResultPanel');
+    if (!panel) return false;
+    const count = panel.querySelectorAll(selector).length;
+    const now = Date.now();
+    const state = window.__tvResultsWait || (window.__tvResultsWait = {count: -1, since: now});
+    if (count !== state.count) {
+        state.count = count;
+        state.since = now;
+        return false;
+    }
+    return count > 0 && now - state.since >= stableMs;
+}
+'''
+
+
+@dataclass
+class WaitConfig:
+    # True - старое консервативное расписание пауз (8+3 после goto, 20 после поиска, slow_mo=500)
+    conservative: bool = False
+    page_ready_timeout: float = 30.0
+    dropdown_timeout: float = 5.0
+    settle_timeout: float = 3.0
+    network_idle_ms: int = 300
+    results_timeout: float = 45.0
+    results_stable_ms: int = 1500
+    poll_interval_ms: int = 200
+
+    @property
+    def slow_mo(self) -> int:
+        return 500 if self.conservative else 0
+
+    @classmethod
+    def from_env(cls) -> "WaitConfig":
+        return cls(
+            conservative=os.environ.get("TOURVISOR_CONSERVATIVE_WAITS", "0") == "1",
+            results_timeout=float(os.environ.get("TOURVISOR_RESULTS_TIMEOUT", "45"))
+        )
+
+
+class NetworkTracker:
+    """Счетчик незавершенных запросов страницы"""
+
+    def __init__(self, page):
+        self.page = page
+        self.inflight = 0
+        self._last_change = asyncio.get_running_loop().time()
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+
+    def _on_request(self, request):
+        self.inflight += 1
+        self._last_change = asyncio.get_running_loop().time()
+
+    def _on_done(self, request):
+        self.inflight = max(0, self.inflight - 1)
+        self._last_change = asyncio.get_running_loop().time()
+
+    async def wait_idle(self, idle_ms: int, timeout: float, poll_ms: int = 100) -> bool:
+        """Ждать, пока в сети не будет запросов idle_ms миллисекунд; False по истечении срока"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            now = loop.time()
+            if self.inflight == 0 and (now - self._last_change) * 1000 >= idle_ms:
+                return True
+            if now >= deadline:
+                return False
+            await asyncio.sleep(poll_ms / 1000)
+
+    def detach(self):
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("requestfinished", self._on_done)
+        self.page.remove_listener("requestfailed", self._on_done)
+
+
+class PageWaiter:
+    """Ожидания для одной страницы на время одного поиска"""
+
+    def __init__(self, page, config: WaitConfig):
+        self.page = page
+        self.config = config
+        self.network = None if config.conservative else NetworkTracker(page)
+
+    def detach(self):
+        if self.network:
+            self.network.detach()
+            self.network = None
+
+    async def page_ready(self):
+        """Форма TourVisor загрузилась и инициализировалась"""
+        if self.config.conservative:
+            await asyncio.sleep(8)
+            await self.page.wait_for_selector('.tv-search-form.tv-loaded', timeout=30000)
+            await asyncio.sleep(3)
+            return
+        await self.page.wait_for_selector('.tv-search-form.tv-loaded',
+                                          timeout=self.config.page_ready_timeout * 1000)
+        await self.network.wait_idle(self.config.network_idle_ms, self.config.settle_timeout)
+
+    async def dropdown(self, selector: str, legacy_pause: float = 2) -> bool:
+        """Выпадающий список открылся: нужный пункт стал видимым"""
+        if self.config.conservative:
+            await asyncio.sleep(legacy_pause)
+            return True
+        try:
+            await self.page.wait_for_selector(selector, state='visible',
+                                              timeout=self.config.dropdown_timeout * 1000)
+            return True
+        except Exception:
+            return False
+
+    async def settle(self, legacy_pause: float = 3) -> bool:
+        """Шаг формы применен: сеть затихла (но не дольше старой паузы)"""
+        if self.config.conservative:
+            await asyncio.sleep(legacy_pause)
+            return True
+        timeout = min(legacy_pause, self.config.settle_timeout)
+        return await self.network.wait_idle(self.config.network_idle_ms, timeout,
+                                            self.config.poll_interval_ms)
+
+    async def results(self) -> bool:
+        """Выдача в #TVResultPanel появилась и перестала меняться"""
+        if self.config.conservative:
+            await asyncio.sleep(20)
+            return True
+        await self.page.evaluate('() => { delete window.__tvResultsWait; }')
+        try:
+            await self.page.wait_for_function(
+                JS_RESULTS_STABLE,
+                arg=[RESULT_CARD_SELECTOR, self.config.results_stable_ms],
+                polling=self.config.poll_interval_ms,
+                timeout=self.config.results_timeout * 1000
+            )
+            return True
+        except Exception:
+            logger.warning(f"⚠️ Выдача не стабилизировалась за {self.config.results_timeout} с")
+            return False
+
+
+class WaitEngine:
+    def __init__(self, config: WaitConfig = None):
+        self.config = config or WaitConfig.from_env()
+
+    def attach(self, page) -> PageWaiter:
+        return PageWaiter(page, self.config)